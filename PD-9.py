@@ -6,15 +6,32 @@ except ImportError:
     exit()
 
 import sqlite3
-import pandas as pd
 import textwrap
+import queue
+import threading
+import itertools
+import db_migrations
+import search_index
+import search_query
 import tkinter.font as tkFont
-import matplotlib.pyplot as plt
-import numpy as np  # 用於計算角度與座標
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-# 設定 matplotlib 使用支援中文的字型與正確顯示負號
-plt.rcParams["font.sans-serif"] = ["Microsoft JhengHei"]
-plt.rcParams["axes.unicode_minus"] = False
+# pandas / matplotlib / numpy 延後到匯入匯出或圖表分析時才載入，以縮短啟動時間
+
+# 支援中文的備選字型清單 (依序採用第一個已安裝的字型)
+CJK_FONT_CANDIDATES = ["Microsoft JhengHei", "Noto Sans CJK TC", "SimHei", "WenQuanYi Zen Hei"]
+
+@lru_cache(maxsize=None)
+def get_pyplot():
+    # 第一次繪圖時才載入 matplotlib，並只解析一次中文字型與設定正確顯示負號
+    import matplotlib.pyplot as plt
+    from matplotlib import font_manager
+    installed = {f.name for f in font_manager.fontManager.ttflist}
+    available = [name for name in CJK_FONT_CANDIDATES if name in installed]
+    plt.rcParams["font.sans-serif"] = available[:1] + plt.rcParams["font.sans-serif"]
+    plt.rcParams["axes.unicode_minus"] = False
+    return plt
 
 # ========================
 # 版本及作者資訊設定 (更新至 1.0.11)
@@ -60,30 +77,189 @@ menubar.add_cascade(label="關於", menu=about_menu)
 root.config(menu=menubar)
 
 # 設定 Treeview style，調整列高為 80
+TREE_ROW_HEIGHT = 80
 style = ttk.Style()
-style.configure("Treeview", rowheight=80)
+style.configure("Treeview", rowheight=TREE_ROW_HEIGHT)
 
 # ========================
 # 資料庫及功能函式定義
 # ========================
+# 顯示 / 匯出用的欄位 (不含軟刪除標記 deleted_at)
+PROJECT_COLUMNS = ("projects.id, projects.year, projects.site_name, projects.project_name, "
+                   "projects.contract_price, projects.execution_budget, projects.contractor_price, "
+                   "projects.indirect_cost, projects.contractor, projects.remarks")
+# 依 id 批次刪除或讀取時，每個 IN (...) 的 id 數量 (低於 SQLite 參數上限)
+ID_CHUNK_SIZE = 500
+# 背景清理每批真正刪除的筆數；每批各自提交，不會長時間佔住寫入鎖
+COMPACT_BATCH_SIZE = 1000
+
+# ------------------------
+# 背景工作：資料庫查詢、Excel 讀寫與統計在工作執行緒執行，結果放入佇列，
+# 由主執行緒以 root.after() 定期取出後再更新畫面 (Tk 元件只能在主執行緒操作)
+# ------------------------
+WORKER_COUNT = 2
+# 主執行緒檢查結果佇列的間隔 (毫秒)
+RESULT_POLL_MS = 50
+# 每執行多少個 SQLite 虛擬機指令檢查一次是否已取消
+CANCEL_CHECK_OPS = 10000
+
+executor = ThreadPoolExecutor(max_workers=WORKER_COUNT, thread_name_prefix="pd9-worker")
+result_queue = queue.Queue()
+# channel -> 該類工作目前最新的 Task；舊的工作被取代後結果直接丟棄
+active_tasks = {}
+task_ids = itertools.count(1)
+# 本程式每次寫入資料庫就遞增，用來判斷執行中的相同查詢是否還能沿用
+data_state = {"generation": 0}
+
+class TaskCancelled(Exception):
+    pass
+
+class Task:
+    # 背景工作的狀態；work(task) 可用 task.check() / task.connect() 配合取消，
+    # 以 task.progress() 回報進度
+    def __init__(self, channel, key, label):
+        self.id = next(task_ids)
+        self.channel = channel
+        self.key = key
+        self.label = label
+        self.generation = data_state["generation"]
+        self.cancel_event = threading.Event()
+        self.fraction = None
+        self.text = ""
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def progress(self, fraction, text=""):
+        result_queue.put(("progress", self, (fraction, text)))
+
+    def connect(self):
+        # 取消後正在執行的 SQL 會被中斷 (sqlite3.OperationalError: interrupted)
+        conn = sqlite3.connect("projects.db")
+        conn.set_progress_handler(lambda: 1 if self.cancelled else 0, CANCEL_CHECK_OPS)
+        return conn
+
+def mark_data_changed():
+    data_state["generation"] += 1
+
+def run_task(channel, work, on_done, key=None, label="處理中…", on_error=None):
+    # 同一 channel 只保留最新的工作：相同 key 的工作仍在執行且資料未變更時直接沿用
+    # (合併重複的重新整理)，否則取消舊工作、送出新工作
+    current = active_tasks.get(channel)
+    if current is not None and not current.cancelled:
+        if key is not None and current.key == key and current.generation == data_state["generation"]:
+            return
+        current.cancel()
+    task = Task(channel, key, label)
+    active_tasks[channel] = task
+    executor.submit(run_task_in_worker, task, work, on_done, on_error)
+    update_status()
+
+def run_task_in_worker(task, work, on_done, on_error):
+    # 在工作執行緒中執行；不可直接操作 Tk
+    if task.cancelled:
+        result_queue.put(("cancelled", task, None))
+        return
+    try:
+        result = work(task)
+    except Exception as e:
+        if task.cancelled or isinstance(e, TaskCancelled):
+            result_queue.put(("cancelled", task, None))
+        else:
+            result_queue.put(("error", task, (on_error, e)))
+        return
+    result_queue.put(("done", task, (on_done, result)))
+
+def poll_results():
+    # 主執行緒：取出背景工作的結果並套用到畫面
+    try:
+        while True:
+            kind, task, payload = result_queue.get_nowait()
+            current = active_tasks.get(task.channel) is task
+            if kind == "progress":
+                if current:
+                    task.fraction, task.text = payload
+                    update_status()
+                continue
+            if current:
+                del active_tasks[task.channel]
+                update_status()
+            if kind == "done" and current:
+                # 取消前已完成的工作 (例如匯入已提交) 仍然顯示結果
+                on_done, result = payload
+                on_done(result)
+            elif kind == "error" and current:
+                on_error, error = payload
+                if on_error is not None:
+                    on_error(error)
+                else:
+                    messagebox.showerror("錯誤", f"{task.label}發生錯誤：{error}")
+    except queue.Empty:
+        pass
+    root.after(RESULT_POLL_MS, poll_results)
+
+def task_running(channel):
+    # 匯入 / 匯出等不適合被新請求取代的工作，執行中時提示使用者稍候
+    if channel in active_tasks:
+        messagebox.showwarning("警告", f"{active_tasks[channel].label}尚未完成，請稍候")
+        return True
+    return False
+
+def cancel_all_tasks():
+    for task in active_tasks.values():
+        task.cancel()
+    update_status()
+
+def update_status():
+    # 狀態列：顯示最新一個工作的名稱與進度；沒有進度資訊時以不定進度動畫表示
+    tasks = [task for task in active_tasks.values() if not task.cancelled]
+    if not tasks:
+        progress_bar.stop()
+        progress_bar.config(mode="determinate", value=0)
+        status_var.set("取消中…" if active_tasks else "就緒")
+        btn_cancel.config(state=tk.DISABLED)
+        return
+    task = max(tasks, key=lambda t: t.id)
+    status_var.set(f"{task.label} {task.text}".strip())
+    btn_cancel.config(state=tk.NORMAL)
+    if task.fraction is None:
+        if str(progress_bar["mode"]) != "indeterminate":
+            progress_bar.config(mode="indeterminate")
+            progress_bar.start(15)
+    else:
+        progress_bar.stop()
+        progress_bar.config(mode="determinate", value=task.fraction * 100)
+
+def on_close():
+    cancel_all_tasks()
+    executor.shutdown(wait=False, cancel_futures=True)
+    root.destroy()
+
+def run_write(work, on_done, label):
+    # 新增 / 修改 / 刪除也在背景執行，不在主執行緒等待資料庫鎖定；
+    # 匯入進行中或上一個寫入尚未完成時先提示稍候 (寫入工作不會被新的請求取消)
+    if task_running("import") or task_running("write"):
+        return
+    run_task("write", work, on_done, label=label, on_error=show_write_error)
+
+def show_write_error(error):
+    if isinstance(error, sqlite3.OperationalError) and "locked" in str(error):
+        messagebox.showerror("錯誤", "資料庫正由其他程式寫入中，請稍後再試")
+    else:
+        messagebox.showerror("錯誤", f"寫入資料庫發生錯誤：{error}")
+
 def init_db():
+    # 建立資料表或將既有資料庫升級到最新結構 (見 db_migrations.py)
     conn = sqlite3.connect("projects.db")
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            year TEXT NOT NULL,
-            site_name TEXT NOT NULL,
-            project_name TEXT NOT NULL,
-            contract_price REAL DEFAULT 0,
-            execution_budget REAL DEFAULT 0,
-            contractor_price REAL DEFAULT 0,
-            indirect_cost REAL DEFAULT 0,
-            contractor TEXT,
-            remarks TEXT
-        );
-    ''')
-    conn.commit()
+    db_migrations.migrate(conn)
     conn.close()
 
 def add_project():
@@ -91,7 +267,6 @@ def add_project():
         contract_price = float(entry_contract.get().replace(',', ''))
         execution_budget = float(entry_execution.get().replace(',', ''))
         contractor_price = float(entry_contractor_price.get().replace(',', ''))
-        indirect_cost = contract_price - execution_budget
     except ValueError:
         messagebox.showwarning("警告", "請輸入有效的數字！")
         return
@@ -103,7 +278,6 @@ def add_project():
         contract_price, 
         execution_budget, 
         contractor_price, 
-        indirect_cost, 
         entry_contractor.get(), 
         entry_remarks.get()
     ]
@@ -111,18 +285,30 @@ def add_project():
         messagebox.showwarning("警告", "請填寫必要的欄位！")
         return
 
-    conn = sqlite3.connect("projects.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO projects (year, site_name, project_name, contract_price, 
-        execution_budget, contractor_price, indirect_cost, contractor, remarks)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, values)
-    conn.commit()
-    conn.close()
-    messagebox.showinfo("成功", "專案已新增")
-    clear_entries()
-    refresh_table()
+    def work(task):
+        conn = task.connect()
+        try:
+            cursor = conn.cursor()
+            # 管銷 (indirect_cost) 由資料庫生成欄位計算：契約來價 - 執行預算
+            cursor.execute("""
+                INSERT INTO projects (year, site_name, project_name, contract_price, 
+                execution_budget, contractor_price, contractor, remarks)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, values)
+            conn.commit()
+            return fetch_project_row(conn, cursor.lastrowid)
+        finally:
+            conn.close()
+
+    def done(row):
+        mark_data_changed()
+        messagebox.showinfo("成功", "專案已新增")
+        clear_entries()
+        # 只在表格最後加入新的一列，不重新載入整個表格
+        append_tree_row(row)
+        index_project_row(row)
+
+    run_write(work, done, "新增專案…")
 
 def load_project():
     selected = tree.selection()
@@ -144,17 +330,16 @@ def load_project():
     btn_add.config(state=tk.DISABLED)
 
 def update_project():
-    selected = tree.selection()
+    selected = selected_iids()
     if not selected:
         messagebox.showwarning("警告", "請選擇要更新的專案")
         return
-    item = tree.item(selected)
-    project_id = item['values'][0]
+    iid = selected[0]
+    project_id = int(iid)
     try:
         contract_price = float(entry_contract.get().replace(',', ''))
         execution_budget = float(entry_execution.get().replace(',', ''))
         contractor_price = float(entry_contractor_price.get().replace(',', ''))
-        indirect_cost = contract_price - execution_budget
     except ValueError:
         messagebox.showwarning("警告", "請輸入有效的數字！")
         return
@@ -165,7 +350,6 @@ def update_project():
         contract_price, 
         execution_budget, 
         contractor_price, 
-        indirect_cost, 
         entry_contractor.get(), 
         entry_remarks.get(), 
         project_id
@@ -173,21 +357,36 @@ def update_project():
     if not all(values[:3]):
         messagebox.showwarning("警告", "請填寫必要的欄位！")
         return
-    conn = sqlite3.connect("projects.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE projects 
-        SET year=?, site_name=?, project_name=?, contract_price=?, 
-            execution_budget=?, contractor_price=?, indirect_cost=?, contractor=?, remarks=?
-        WHERE id=?
-    """, values)
-    conn.commit()
-    conn.close()
-    messagebox.showinfo("成功", "專案已更新")
-    clear_entries()
-    refresh_table()
-    btn_update.config(state=tk.DISABLED)
-    btn_add.config(state=tk.NORMAL)
+
+    def work(task):
+        conn = task.connect()
+        try:
+            conn.execute("""
+                UPDATE projects 
+                SET year=?, site_name=?, project_name=?, contract_price=?, 
+                    execution_budget=?, contractor_price=?, contractor=?, remarks=?
+                WHERE id=? AND deleted_at IS NULL
+            """, values)
+            conn.commit()
+            return fetch_project_row(conn, project_id)
+        finally:
+            conn.close()
+
+    def done(row):
+        mark_data_changed()
+        messagebox.showinfo("成功", "專案已更新")
+        clear_entries()
+        # 只更新被編輯的那一列；若資料已被其他程式刪除則從表格移除
+        if row is None:
+            remove_tree_rows([iid])
+            unindex_projects([project_id])
+        else:
+            update_tree_row(row)
+            index_project_row(row)
+        btn_update.config(state=tk.DISABLED)
+        btn_add.config(state=tk.NORMAL)
+
+    run_write(work, done, "更新專案…")
 
 def clear_entries():
     entry_year.delete(0, tk.END)
@@ -201,205 +400,637 @@ def clear_entries():
     btn_update.config(state=tk.DISABLED)
     btn_add.config(state=tk.NORMAL)
 
-def auto_adjust_columns():
-    font = tkFont.Font()
-    for col in columns:
-        if col == "ID":
-            desired_max = 50
-        elif col == "年度":
-            desired_max = 80
-        elif col == "工地名稱":
-            tree.column(col, width=150)
+# 欄寬上限 (未列出的欄位不設上限)；工地名稱已自動換行，固定寬度
+COLUMN_WIDTH_CAPS = {"ID": 50, "年度": 80, "承攬項目": 100}
+FIXED_COLUMN_WIDTHS = {"工地名稱": 150}
+# 計算欄寬時最多取樣的列數 (平均分散取樣)，量測次數不再隨資料筆數成長
+COLUMN_WIDTH_SAMPLE_SIZE = 200
+
+# 目前各欄設定的寬度 (避免每次都向 Tk 查詢)
+column_widths = {}
+
+@lru_cache(maxsize=None)
+def measure_font():
+    return tkFont.Font()
+
+@lru_cache(maxsize=8192)
+def text_width(text):
+    # 同一字串只量測一次；font.measure 每次呼叫都是一次 Tk 往返
+    return measure_font().measure(text)
+
+def cell_width(col, value):
+    # 欄位內容所需寬度 (含邊距)，套用 COLUMN_WIDTH_CAPS 上限
+    width = text_width("" if value is None else str(value)) + 10
+    if col in COLUMN_WIDTH_CAPS:
+        width = min(width, COLUMN_WIDTH_CAPS[col])
+    return width
+
+def set_column_width(col, width):
+    if column_widths.get(col) != width:
+        column_widths[col] = width
+        tree.column(col, width=width)
+
+def sample_rows(rows, limit=COLUMN_WIDTH_SAMPLE_SIZE):
+    if len(rows) <= limit:
+        return rows
+    step = len(rows) / limit
+    return [rows[int(i * step)] for i in range(limit)]
+
+def auto_adjust_columns(rows):
+    # rows 為 format_tree_row 的結果；列數過多時只量測平均分散的取樣
+    rows = sample_rows(list(rows))
+    for idx, col in enumerate(columns):
+        if col in FIXED_COLUMN_WIDTHS:
+            set_column_width(col, FIXED_COLUMN_WIDTHS[col])
             continue
-        elif col == "承攬項目":
-            desired_max = 100
-        else:
-            desired_max = None
-        max_width = font.measure(col)
-        for child in tree.get_children():
-            cell_text = tree.set(child, col)
-            width = font.measure(cell_text)
-            if width > max_width:
-                max_width = width
-        if desired_max is not None:
-            tree.column(col, width=min(max_width+10, desired_max))
+        width = cell_width(col, col)
+        for values in rows:
+            width = max(width, cell_width(col, values[idx]))
+        set_column_width(col, width)
+
+def adjust_columns_for_view():
+    # 依目前顯示的結果重新計算欄寬；虛擬表格從全部 id 中取樣後再讀取
+    if table_view["virtual"]:
+        conn = sqlite3.connect("projects.db")
+        rows = fetch_project_rows(conn, sample_rows(table_view["ids"]))
+        conn.close()
+        auto_adjust_columns([format_tree_row(row) for row in rows])
+    else:
+        auto_adjust_columns(table_view["cache"].values())
+
+def format_tree_row(row):
+    # 將資料庫的一列 (PROJECT_COLUMNS 順序) 轉成表格顯示的欄位值
+    formatted_contract_price = f"{row[4]:,.2f}" if row[4] is not None else ""
+    formatted_execution_budget = f"{row[5]:,.2f}" if row[5] is not None else ""
+    formatted_contractor_price = f"{row[6]:,.2f}" if row[6] is not None else ""
+    formatted_indirect_cost = f"{row[7]:,.2f}" if row[7] is not None else ""
+    wrapped_site = textwrap.fill(row[2], width=15)
+    return (
+        row[0],
+        row[1],
+        wrapped_site,
+        row[3],
+        formatted_contract_price,
+        formatted_indirect_cost,
+        formatted_execution_budget,
+        formatted_contractor_price,
+        row[8],
+        row[9]
+    )
+
+def fetch_project_row(conn, project_id):
+    # 讀取單一專案 (已標記刪除則回傳 None)
+    return conn.execute(f"SELECT {PROJECT_COLUMNS} FROM projects WHERE id = ? AND deleted_at IS NULL",
+                        (project_id,)).fetchone()
+
+def stripe_tag(idx):
+    return "evenrow" if idx % 2 == 0 else "oddrow"
+
+def load_tree_rows(rows):
+    # 重新載入整個表格；每列的 iid 為資料庫 id，之後可直接以 id 更新或刪除單一列
+    cache = {row[0]: format_tree_row(row) for row in rows}
+    table_view.update(virtual=False, ids=[], offset=0, cache=cache, selected=set())
+    tree.delete(*tree.get_children())
+    for idx, (pid, values) in enumerate(cache.items()):
+        tree.insert("", "end", iid=str(pid), values=values, tags=(stripe_tag(idx),))
+    auto_adjust_columns(cache.values())
+
+def append_tree_row(row):
+    values = format_tree_row(row)
+    table_view["cache"][row[0]] = values
+    if table_view["virtual"]:
+        # 虛擬表格：加入 id 清單並捲動到最後一頁
+        table_view["ids"].append(row[0])
+        scroll_virtual_to(len(table_view["ids"]))
+    else:
+        idx = len(tree.get_children())
+        tree.insert("", "end", iid=str(row[0]), values=values, tags=(stripe_tag(idx),))
+    widen_columns(values)
+    tree.see(str(row[0]))
+
+def update_tree_row(row):
+    values = format_tree_row(row)
+    old_values = table_view["cache"].get(row[0])
+    table_view["cache"][row[0]] = values
+    iid = str(row[0])
+    if tree.exists(iid):
+        tree.item(iid, values=values)
+    if old_values is not None and may_narrow_columns([old_values]):
+        adjust_columns_for_view()
+    else:
+        widen_columns(values)
+
+def remove_tree_rows(iids):
+    # 只移除指定的列，並從第一個被移除的位置開始重新套用交替底色
+    removed_values = [table_view["cache"].pop(int(iid)) for iid in iids
+                      if int(iid) in table_view["cache"]]
+    if table_view["virtual"]:
+        removed = {int(iid) for iid in iids}
+        table_view["ids"] = [pid for pid in table_view["ids"] if pid not in removed]
+        table_view["selected"] -= {str(pid) for pid in removed}
+        render_virtual_window()
+    else:
+        iids = [iid for iid in iids if tree.exists(iid)]
+        if not iids:
+            return
+        start = min(tree.index(iid) for iid in iids)
+        tree.delete(*iids)
+        for idx, iid in enumerate(tree.get_children()[start:], start):
+            tree.item(iid, tags=(stripe_tag(idx),))
+    if may_narrow_columns(removed_values):
+        adjust_columns_for_view()
+
+def widen_columns(values):
+    # 只依單一列的內容加寬欄位，不重新量測整個表格
+    for col, value in zip(columns, values):
+        if col in FIXED_COLUMN_WIDTHS:
+            continue
+        width = cell_width(col, value)
+        if width > column_widths.get(col, 0):
+            set_column_width(col, width)
+
+def may_narrow_columns(removed_values):
+    # 被移除 (或被修改) 的內容若正是某欄最寬的值，該欄可能需要縮窄
+    for values in removed_values:
+        for col, value in zip(columns, values):
+            if col not in FIXED_COLUMN_WIDTHS and cell_width(col, value) >= column_widths.get(col, 0):
+                return True
+    return False
+
+# ------------------------
+# 虛擬表格：結果筆數超過門檻時，Treeview 只保留可見範圍的列，
+# 捲動時再從 SQLite 依 id 取出該範圍 (含前後預讀) 的資料
+# ------------------------
+VIRTUAL_TABLE_THRESHOLD = 2000
+# 可見範圍前後各多讀取的列數，小幅捲動時不必再查詢資料庫
+VIRTUAL_OVERSCAN = 10
+# 表格標題列約佔的高度 (像素)
+TREE_HEADING_HEIGHT = 24
+
+# ids: 目前結果的 id (依顯示順序)；cache: id -> 已格式化的欄位值；selected: 已選取的 iid
+table_view = {"virtual": False, "ids": [], "offset": 0, "cache": {}, "selected": set()}
+
+def fetch_project_rows(conn, ids):
+    # 依 id 取出多筆專案，並依 ids 的順序回傳 (已不存在的 id 略過)
+    found = {}
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[start:start + ID_CHUNK_SIZE]
+        marks = ",".join("?" * len(chunk))
+        for row in conn.execute(f"SELECT {PROJECT_COLUMNS} FROM projects "
+                                f"WHERE deleted_at IS NULL AND id IN ({marks})", chunk):
+            found[row[0]] = row
+    return [found[pid] for pid in ids if pid in found]
+
+def load_view(year, site, project, rank=False):
+    # 先只取出符合條件的 id；筆數超過門檻時改用虛擬表格，否則一次載入全部資料
+    # 查詢在背景執行，新的查詢會取代尚未完成的舊查詢
+    query, params = search_query.build_search_query("projects.id", year, site, project, rank=rank)
+    if " ORDER BY " not in query:
+        # 只取 id 時可能改走索引掃描，明確指定依 id 排序以維持原本的顯示順序
+        query += " ORDER BY projects.id"
+
+    def work(task):
+        conn = task.connect()
+        try:
+            ids = [r[0] for r in conn.execute(query, params)]
+            if len(ids) > VIRTUAL_TABLE_THRESHOLD:
+                return ids, None
+            return ids, fetch_project_rows(conn, ids)
+        finally:
+            conn.close()
+
+    def done(result):
+        ids, rows = result
+        if rows is None:
+            load_virtual_rows(ids)
         else:
-            tree.column(col, width=max_width+10)
+            load_tree_rows(rows)
+
+    run_task("view", work, done, key=(year, site, project, rank), label="讀取資料…")
+
+def load_virtual_rows(ids):
+    table_view.update(virtual=True, ids=ids, offset=0, cache={}, selected=set())
+    render_virtual_window()
+    adjust_columns_for_view()
+
+def visible_row_count():
+    return max(1, (tree.winfo_height() - TREE_HEADING_HEIGHT) // TREE_ROW_HEIGHT)
+
+def scroll_virtual_to(offset):
+    table_view["offset"] = offset
+    render_virtual_window()
+
+def render_virtual_window():
+    ids = table_view["ids"]
+    visible = visible_row_count()
+    offset = max(0, min(table_view["offset"], len(ids) - visible))
+    table_view["offset"] = offset
+    window = ids[offset:offset + visible]
+    cache = table_view["cache"]
+    if any(pid not in cache for pid in window):
+        # 讀取可見範圍與前後預讀的列，快取只保留這個範圍
+        start = max(0, offset - VIRTUAL_OVERSCAN)
+        wanted = ids[start:offset + visible + VIRTUAL_OVERSCAN]
+        conn = sqlite3.connect("projects.db")
+        rows = fetch_project_rows(conn, wanted)
+        conn.close()
+        kept = set(wanted)
+        table_view["cache"] = cache = {pid: values for pid, values in cache.items() if pid in kept}
+        for row in rows:
+            cache[row[0]] = format_tree_row(row)
+    tree.delete(*tree.get_children())
+    for idx, pid in enumerate(window, offset):
+        if pid in cache:
+            # 交替底色依整體位置計算，捲動時不會跳色
+            tree.insert("", "end", iid=str(pid), values=cache[pid], tags=(stripe_tag(idx),))
+    tree.selection_set([iid for iid in table_view["selected"] if tree.exists(iid)])
+    if ids:
+        v_scrollbar.set(offset / len(ids), min(1.0, (offset + visible) / len(ids)))
+    else:
+        v_scrollbar.set(0.0, 1.0)
+
+def selected_iids():
+    # 虛擬表格中已捲出可見範圍的選取列也要算在內
+    if table_view["virtual"]:
+        return tuple(sorted(table_view["selected"], key=int))
+    return tree.selection()
+
+def on_tree_select(event):
+    if table_view["virtual"]:
+        window = set(tree.get_children())
+        table_view["selected"] = (table_view["selected"] - window) | set(tree.selection())
+
+def on_vertical_scroll(*args):
+    # 捲軸操作：一般模式交給 Treeview，虛擬表格則換算成第幾列
+    if not table_view["virtual"]:
+        tree.yview(*args)
+        return
+    if args[0] == "moveto":
+        scroll_virtual_to(int(float(args[1]) * len(table_view["ids"])))
+    elif args[0] == "scroll":
+        step = int(args[1]) * (visible_row_count() if args[2] == "pages" else 1)
+        scroll_virtual_to(table_view["offset"] + step)
+
+def on_tree_yscroll(first, last):
+    # 虛擬表格的捲軸位置由 render_virtual_window 依總筆數設定
+    if not table_view["virtual"]:
+        v_scrollbar.set(first, last)
+
+def on_tree_mousewheel(event):
+    if not table_view["virtual"]:
+        return None
+    step = -1 if event.num == 4 or event.delta > 0 else 1
+    scroll_virtual_to(table_view["offset"] + step)
+    return "break"
+
+def on_tree_configure(event):
+    # 視窗大小改變時可見列數也會改變
+    if table_view["virtual"]:
+        render_virtual_window()
 
 def refresh_table():
-    for item in tree.get_children():
-        tree.delete(item)
-    conn = sqlite3.connect("projects.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM projects")
-    for idx, row in enumerate(cursor.fetchall()):
-        formatted_contract_price = f"{row[4]:,.2f}" if row[4] is not None else ""
-        formatted_execution_budget = f"{row[5]:,.2f}" if row[5] is not None else ""
-        formatted_contractor_price = f"{row[6]:,.2f}" if row[6] is not None else ""
-        formatted_indirect_cost = f"{row[7]:,.2f}" if row[7] is not None else ""
-        wrapped_site = textwrap.fill(row[2], width=15)
-        tag = "evenrow" if idx % 2 == 0 else "oddrow"
-        tree.insert("", "end", values=(
-            row[0],
-            row[1],
-            wrapped_site,
-            row[3],
-            formatted_contract_price,
-            formatted_indirect_cost,
-            formatted_execution_budget,
-            formatted_contractor_price,
-            row[8],
-            row[9]
-        ), tags=(tag,))
-    conn.close()
-    auto_adjust_columns()
+    # 重新整理時一併捨棄即時查詢索引，以反映其他程式的寫入
+    reset_search_index()
+    load_view("", "", "")
 
 def query_projects():
     year = entry_query_year.get().strip()
     site = entry_query_site.get().strip()
     project = entry_query_project.get().strip()
-    query = "SELECT * FROM projects WHERE 1=1"
-    params = []
-    if year:
-        query += " AND year LIKE ?"
-        params.append(f"%{year}%")
-    if site:
-        query += " AND site_name LIKE ?"
-        params.append(f"%{site}%")
-    if project:
-        query += " AND project_name LIKE ?"
-        params.append(f"%{project}%")
-    for item in tree.get_children():
-        tree.delete(item)
-    conn = sqlite3.connect("projects.db")
-    cursor = conn.cursor()
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
-    for idx, row in enumerate(rows):
-        formatted_contract_price = f"{row[4]:,.2f}" if row[4] is not None else ""
-        formatted_execution_budget = f"{row[5]:,.2f}" if row[5] is not None else ""
-        formatted_contractor_price = f"{row[6]:,.2f}" if row[6] is not None else ""
-        formatted_indirect_cost = f"{row[7]:,.2f}" if row[7] is not None else ""
-        wrapped_site = textwrap.fill(row[2], width=15)
-        tag = "evenrow" if idx % 2 == 0 else "oddrow"
-        tree.insert("", "end", values=(
-            row[0],
-            row[1],
-            wrapped_site,
-            row[3],
-            formatted_contract_price,
-            formatted_indirect_cost,
-            formatted_execution_budget,
-            formatted_contractor_price,
-            row[8],
-            row[9]
-        ), tags=(tag,))
-    auto_adjust_columns()
+    # 勾選「依相關度排序」時依全文索引的相關度排序，否則維持依 id 的順序
+    load_view(year, site, project, rank=rank_var.get())
+
+# ------------------------
+# 即時查詢：輸入停頓 LIVE_SEARCH_DELAY_MS 後，以記憶體內索引 (search_index.py) 篩選，
+# 不再重新查詢 SQLite；條件加長時只在上一次的結果中篩選
+# ------------------------
+LIVE_SEARCH_DELAY_MS = 250
+
+# index: 搜尋索引 (第一次即時查詢時於背景建立)；last: 上一次的查詢結果；after_id: 等待中的計時器
+# generation: 每次捨棄索引就遞增；build_lock: 同時只建立一份索引 (主執行緒不會取得)；
+# lock: 只保護捨棄與發布索引的短暫操作，建立索引期間不持有
+search_state = {"index": None, "generation": 0, "lock": threading.Lock(),
+                "build_lock": threading.Lock(), "last": None, "after_id": None}
+
+def get_search_index(task):
+    index = search_state["index"]
+    if index is not None:
+        return index
+    with search_state["build_lock"]:
+        index = search_state["index"]
+        if index is not None:
+            return index
+        generation = search_state["generation"]
+        conn = task.connect()
+        try:
+            index = search_index.SearchIndex.from_connection(conn)
+        finally:
+            conn.close()
+        with search_state["lock"]:
+            # 建立期間索引已被捨棄 (匯入) 或本程式寫入過資料時，這份索引只用於本次查詢
+            if search_state["generation"] == generation and data_state["generation"] == task.generation:
+                search_state["index"] = index
+        return index
+
+def reset_search_index():
+    # 資料大量變更後捨棄索引，下次即時查詢時重建；背景建立中的索引不會被發布
+    with search_state["lock"]:
+        search_state["generation"] += 1
+        search_state["index"] = None
+        search_state["last"] = None
+
+def index_project_row(row):
+    index = search_state["index"]
+    if index is not None:
+        index.add(row[0], row[1], row[2], row[3])
+
+def unindex_projects(ids):
+    index = search_state["index"]
+    if index is not None:
+        index.remove(ids)
+
+def schedule_live_search(event=None):
+    # 每次按鍵都重新計時，停止輸入後才查詢
+    if not live_search_var.get():
+        return
+    if search_state["after_id"] is not None:
+        root.after_cancel(search_state["after_id"])
+    search_state["after_id"] = root.after(LIVE_SEARCH_DELAY_MS, live_search)
+
+def live_search():
+    search_state["after_id"] = None
+    year = entry_query_year.get()
+    site = entry_query_site.get()
+    project = entry_query_project.get()
+    previous = search_state["last"]
+    terms = tuple(search_index.normalize(v) for v in (year, site, project))
+    index = search_state["index"]
+    if previous is not None and index is not None and previous.terms == terms \
+            and previous.generation == index.generation:
+        return
+
+    def work(task):
+        result = get_search_index(task).search(year, site, project, previous=previous)
+        if len(result.ids) > VIRTUAL_TABLE_THRESHOLD:
+            return result, None
+        conn = task.connect()
+        try:
+            return result, fetch_project_rows(conn, list(result.ids))
+        finally:
+            conn.close()
+
+    def done(payload):
+        result, rows = payload
+        search_state["last"] = result
+        if rows is None:
+            load_virtual_rows(list(result.ids))
+        else:
+            load_tree_rows(rows)
+
+    run_task("view", work, done, key=("live",) + terms, label="即時查詢…")
 
 def delete_project():
-    selected_items = tree.selection()
+    selected_items = selected_iids()
     if not selected_items:
         messagebox.showwarning("警告", "請選擇要刪除的專案")
         return
     if messagebox.askyesno("確認", "確定要刪除選定的專案嗎？"):
-        conn = sqlite3.connect("projects.db")
-        cursor = conn.cursor()
-        for item in selected_items:
-            project_id = tree.item(item)['values'][0]
-            cursor.execute("DELETE FROM projects WHERE id = ?", (project_id,))
-        conn.commit()
+        # 表格列的 iid 即資料庫 id；與 app.py 相同採軟刪除：以 IN (...) 分批在 deleted_at
+        # 記下刪除時間 (全部在同一個交易內完成)，實際刪除交給背景清理
+        ids = [int(iid) for iid in selected_items]
+
+        def work(task):
+            conn = task.connect()
+            try:
+                cursor = conn.cursor()
+                for start in range(0, len(ids), ID_CHUNK_SIZE):
+                    chunk = ids[start:start + ID_CHUNK_SIZE]
+                    marks = ",".join("?" * len(chunk))
+                    cursor.execute("UPDATE projects SET deleted_at = CURRENT_TIMESTAMP "
+                                   f"WHERE deleted_at IS NULL AND id IN ({marks})", chunk)
+                conn.commit()
+            finally:
+                conn.close()
+
+        def done(result):
+            mark_data_changed()
+            messagebox.showinfo("成功", "選定的專案已刪除")
+            clear_entries()
+            remove_tree_rows(selected_items)
+            unindex_projects(ids)
+            schedule_compaction()
+
+        run_write(work, done, "刪除專案…")
+
+def compact_deleted_projects(task):
+    # 背景工作：真正刪除已標記 deleted_at 的列，回傳刪除筆數；取消時只退回進行中的那一批
+    conn = task.connect()
+    removed = 0
+    try:
+        while True:
+            task.check()
+            count = conn.execute(
+                "DELETE FROM projects WHERE id IN "
+                "(SELECT id FROM projects WHERE deleted_at IS NOT NULL LIMIT ?)",
+                (COMPACT_BATCH_SIZE,)).rowcount
+            conn.commit()
+            if count <= 0:
+                return removed
+            removed += count
+    finally:
         conn.close()
-        messagebox.showinfo("成功", "選定的專案已刪除")
-        clear_entries()
-        refresh_table()
+
+def schedule_compaction():
+    # 清理失敗 (例如等待寫入鎖逾時) 時標記仍保留，下次刪除或啟動時再清理
+    run_task("compact", compact_deleted_projects, lambda removed: None, key="compact",
+             label="清理已刪除資料…", on_error=lambda error: None)
 
 def export_excel():
-    conn = sqlite3.connect("projects.db")
-    df = pd.read_sql_query("SELECT * FROM projects", conn)
-    conn.close()
-    df.columns = ["ID", "年度", "工地名稱", "承攬項目", "契約來價(未稅)", "執行預算(未稅)", "廠商發包價(未稅)", "管銷(契約間接費用)", "廠商", "備註"]
+    # 先選擇存檔位置，讀取資料與寫出 Excel 在背景執行
+    if task_running("export"):
+        return
     file_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel Files", "*.xlsx")])
-    if file_path:
+    if not file_path:
+        return
+
+    def work(task):
+        import pandas as pd
+        conn = task.connect()
+        try:
+            # 明確依 id 排序，匯出順序不受查詢計畫選用的部分索引影響
+            df = pd.read_sql_query(f"SELECT {PROJECT_COLUMNS} FROM projects "
+                                   "WHERE deleted_at IS NULL ORDER BY projects.id", conn)
+        finally:
+            conn.close()
+        task.check()
+        task.progress(None, f"寫入 {len(df)} 筆…")
+        df.columns = ["ID", "年度", "工地名稱", "承攬項目", "契約來價(未稅)", "執行預算(未稅)", "廠商發包價(未稅)", "管銷(契約間接費用)", "廠商", "備註"]
         df.to_excel(file_path, index=False)
-        messagebox.showinfo("成功", "資料已匯出至 Excel")
+
+    run_task("export", work, lambda result: messagebox.showinfo("成功", "資料已匯出至 Excel"),
+             label="匯出 Excel…")
+
+# 匯入時每次 executemany 寫入的筆數
+IMPORT_CHUNK_SIZE = 1000
+
+INSERT_PROJECT_SQL = """
+    INSERT INTO projects (year, site_name, project_name, contract_price, 
+    execution_budget, contractor_price, contractor, remarks, indirect_cost_override)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def prepare_import_rows(df):
+    # 整欄轉換匯入資料，回傳 (待寫入的 tuple 清單, 失敗筆數)
+    # 必要欄位空白、或缺少管銷且無法由 契約來價 - 執行預算 計算的列視為失敗
+    # 管銷由資料庫生成欄位計算；檔案中的管銷與計算結果不同 (手動調整過) 時
+    # 寫入 indirect_cost_override 保留原值
+    import numpy as np
+    import pandas as pd
+    valid = df['year'].notna() & df['site_name'].notna() & df['project_name'].notna()
+    df = df[valid]
+
+    def price(col):
+        if col not in df.columns:
+            return pd.Series(0, index=df.index)
+        return df[col].fillna(0)
+
+    def optional(col):
+        if col not in df.columns:
+            return pd.Series("", index=df.index)
+        values = df[col].astype(object)
+        return values.where(values.notna(), None)
+
+    contract_price = price('contract_price')
+    execution_budget = price('execution_budget')
+    contractor_price = price('contractor_price')
+    computed = (pd.to_numeric(contract_price, errors='coerce')
+                - pd.to_numeric(execution_budget, errors='coerce'))
+    indirect_cost = computed
+    override = pd.Series(np.nan, index=df.index)
+    if 'indirect_cost' in df.columns:
+        indirect_cost = df['indirect_cost'].where(df['indirect_cost'].notna(), computed)
+        stored = pd.to_numeric(df['indirect_cost'], errors='coerce')
+        override = stored.where(stored.notna()
+                                & ~np.isclose(stored, computed, rtol=1e-9, atol=1e-6))
+    computable = indirect_cost.notna()
+    override = override.astype(object).where(override.notna(), None)
+
+    columns = [
+        df['year'],
+        df['site_name'],
+        df['project_name'],
+        contract_price,
+        execution_budget,
+        contractor_price,
+        optional('contractor'),
+        optional('remarks'),
+        override,
+    ]
+    # tolist() 會把 numpy 純量轉成 sqlite3 可直接綁定的 Python 型別
+    rows = list(zip(*(col[computable].tolist() for col in columns)))
+    error_count = int((~valid).sum() + (~computable).sum())
+    return rows, error_count
+
+def insert_import_rows(conn, rows, task=None):
+    # 在同一個交易中分批 executemany 寫入，回傳 (成功筆數, 失敗筆數)
+    # 某一批失敗時退回該批再逐列重試，以逐列計算失敗筆數
+    # 在背景工作中執行時 (task)，每批之間回報進度並檢查是否已取消
+    cursor = conn.cursor()
+    if not conn.in_transaction:
+        cursor.execute("BEGIN")
+    success_count = 0
+    error_count = 0
+    for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+        if task is not None:
+            task.check()
+            task.progress(start / len(rows), f"{start} / {len(rows)}")
+        chunk = rows[start:start + IMPORT_CHUNK_SIZE]
+        cursor.execute("SAVEPOINT import_chunk")
+        try:
+            cursor.executemany(INSERT_PROJECT_SQL, chunk)
+            success_count += len(chunk)
+        except Exception:
+            if task is not None:
+                # 因取消而中斷的批次不逐列重試
+                task.check()
+            # 失敗的列由下面逐列重試計入 error_count，於匯入結果顯示
+            cursor.execute("ROLLBACK TO import_chunk")
+            for row in chunk:
+                try:
+                    cursor.execute(INSERT_PROJECT_SQL, row)
+                    success_count += 1
+                except Exception as e:
+                    error_count += 1
+                    print(f"Error inserting row: {e}")
+        cursor.execute("RELEASE import_chunk")
+    return success_count, error_count
+
+class ImportHeaderError(ValueError):
+    # 匯入檔缺少必要欄位
+    pass
 
 def import_excel():
+    if task_running("import"):
+        return
     file_path = filedialog.askopenfilename(filetypes=[("Excel Files", "*.xlsx")])
     if not file_path:
         return
+    run_task("import", lambda task: import_excel_file(file_path, task), show_import_result,
+             label="匯入 Excel…", on_error=show_import_error)
+
+def import_excel_file(file_path, task):
+    # 背景工作：讀取活頁簿並在單一交易中寫入，回傳 (成功筆數, 失敗筆數)；取消時整批退回
+    import pandas as pd
+    task.progress(None, "讀取檔案…")
+    df = pd.read_excel(file_path)
+    chinese_to_eng = {
+        "ID": "id",
+        "年度": "year",
+        "工地名稱": "site_name",
+        "承攬項目": "project_name",
+        "契約來價(未稅)": "contract_price",
+        "執行預算(未稅)": "execution_budget",
+        "廠商發包價(未稅)": "contractor_price",
+        "管銷(契約間接費用)": "indirect_cost",
+        "廠商": "contractor",
+        "備註": "remarks"
+    }
+    required_columns = ["年度", "工地名稱", "承攬項目"]
+    for req in required_columns:
+        if req not in df.columns:
+            raise ImportHeaderError(f"Excel檔案缺少必要欄位：{req}")
+    df = df.rename(columns=chinese_to_eng)
+    if 'id' in df.columns:
+        df = df.drop('id', axis=1)
+    task.check()
+    rows, error_count = prepare_import_rows(df)
+    conn = task.connect()
     try:
-        df = pd.read_excel(file_path)
-        chinese_to_eng = {
-            "ID": "id",
-            "年度": "year",
-            "工地名稱": "site_name",
-            "承攬項目": "project_name",
-            "契約來價(未稅)": "contract_price",
-            "執行預算(未稅)": "execution_budget",
-            "廠商發包價(未稅)": "contractor_price",
-            "管銷(契約間接費用)": "indirect_cost",
-            "廠商": "contractor",
-            "備註": "remarks"
-        }
-        required_columns = ["年度", "工地名稱", "承攬項目"]
-        for req in required_columns:
-            if req not in df.columns:
-                messagebox.showerror("錯誤", f"Excel檔案缺少必要欄位：{req}")
-                return
-        df = df.rename(columns=chinese_to_eng)
-        if 'id' in df.columns:
-            df = df.drop('id', axis=1)
-        conn = sqlite3.connect("projects.db")
-        cursor = conn.cursor()
-        success_count = 0
-        error_count = 0
-        for _, row in df.iterrows():
-            try:
-                if pd.isna(row['year']) or pd.isna(row['site_name']) or pd.isna(row['project_name']):
-                    error_count += 1
-                    continue
-                year_val = row['year']
-                site_val = row['site_name']
-                project_val = row['project_name']
-                contract_price_val = 0 if pd.isna(row.get('contract_price', 0)) else row.get('contract_price', 0)
-                execution_budget_val = 0 if pd.isna(row.get('execution_budget', 0)) else row.get('execution_budget', 0)
-                contractor_price_val = 0 if pd.isna(row.get('contractor_price', 0)) else row.get('contractor_price', 0)
-                if 'indirect_cost' in row and pd.notna(row['indirect_cost']):
-                    indirect_cost_val = row['indirect_cost']
-                else:
-                    indirect_cost_val = contract_price_val - execution_budget_val
-                contractor_val = row.get('contractor', "")
-                remarks_val = row.get('remarks', "")
-                values = [
-                    year_val,
-                    site_val,
-                    project_val,
-                    contract_price_val,
-                    execution_budget_val,
-                    contractor_price_val,
-                    indirect_cost_val,
-                    contractor_val,
-                    remarks_val
-                ]
-                cursor.execute("""
-                    INSERT INTO projects (year, site_name, project_name, contract_price, 
-                    execution_budget, contractor_price, indirect_cost, contractor, remarks)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, values)
-                success_count += 1
-            except Exception as e:
-                error_count += 1
-                print(f"Error inserting row: {e}")
+        success_count, failed = insert_import_rows(conn, rows, task)
+        task.check()
         conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
         conn.close()
-        msg = f"匯入完成\n成功: {success_count} 筆\n"
-        if error_count > 0:
-            msg += f"失敗: {error_count} 筆"
-        messagebox.showinfo("匯入結果", msg)
-        refresh_table()
-    except Exception as e:
-        messagebox.showerror("錯誤", f"匯入過程發生錯誤：{str(e)}")
+    return success_count, error_count + failed
+
+def show_import_result(result):
+    success_count, error_count = result
+    mark_data_changed()
+    reset_search_index()
+    msg = f"匯入完成\n成功: {success_count} 筆\n"
+    if error_count > 0:
+        msg += f"失敗: {error_count} 筆"
+    messagebox.showinfo("匯入結果", msg)
+    refresh_table()
+
+def show_import_error(error):
+    if isinstance(error, ImportHeaderError):
+        messagebox.showerror("錯誤", str(error))
+    else:
+        messagebox.showerror("錯誤", f"匯入過程發生錯誤：{str(error)}")
 
 # ========================
 # 分析功能函式
@@ -407,16 +1038,25 @@ def import_excel():
 
 # 1. 年度趨勢分析（直條圖上加數據標籤）
 def analyze_yearly_trend():
-    conn = sqlite3.connect("projects.db")
-    df = pd.read_sql_query("SELECT * FROM projects", conn)
-    conn.close()
-    df["contract_price"] = pd.to_numeric(df["contract_price"], errors="coerce")
-    yearly_sum = df.groupby("year")["contract_price"].sum()
-    yearly_count = df.groupby("year")["id"].count()
+    # 直接讀取觸發器維護的年度彙總表，不需載入全部專案；讀取在背景執行，繪圖回到主執行緒
+    def work(task):
+        conn = task.connect()
+        try:
+            return conn.execute("SELECT year, total_contract_price, project_count "
+                                "FROM yearly_summary ORDER BY year").fetchall()
+        finally:
+            conn.close()
+    run_task("yearly_trend", work, draw_yearly_trend, key="yearly_trend", label="統計年度資料…")
+
+def draw_yearly_trend(rows):
+    years = [str(r[0]) for r in rows]
+    yearly_sum = [r[1] for r in rows]
+    yearly_count = [r[2] for r in rows]
     
+    plt = get_pyplot()
     fig, ax = plt.subplots(1, 2, figsize=(12, 5))
     
-    bars1 = ax[0].bar(yearly_sum.index, yearly_sum.values, color="skyblue")
+    bars1 = ax[0].bar(years, yearly_sum, color="skyblue")
     ax[0].set_title("每年度總契約來價")
     ax[0].set_xlabel("年度")
     ax[0].set_ylabel("契約來價")
@@ -424,7 +1064,7 @@ def analyze_yearly_trend():
         height = bar.get_height()
         ax[0].text(bar.get_x() + bar.get_width()/2, height, f"{height:,.0f}", ha="center", va="bottom", fontsize=9, color="black")
     
-    bars2 = ax[1].bar(yearly_count.index, yearly_count.values, color="salmon")
+    bars2 = ax[1].bar(years, yearly_count, color="salmon")
     ax[1].set_title("每年度專案數量")
     ax[1].set_xlabel("年度")
     ax[1].set_ylabel("專案數量")
@@ -435,66 +1075,91 @@ def analyze_yearly_trend():
     plt.tight_layout()
     plt.show()
 
+# 圓餅圖顯示的廠商數，其餘合併為「其他」
+CONTRACTOR_TOP_N = 10
+OTHERS_LABEL = "其他"
+# 同一側相鄰標籤的最小垂直間距，標籤過多時自動拉長排列範圍
+LABEL_MIN_GAP = 0.12
+
 # 2. 廠商與市場分佈分析（圓餅圖：各廠商專案數比例，標籤固定放置於視窗左右兩側垂直排列，貼齊邊緣）
-def analyze_contractor_distribution():
-    conn = sqlite3.connect("projects.db")
-    df = pd.read_sql_query("SELECT * FROM projects", conn)
-    conn.close()
-    contractor_count = df.groupby("contractor")["id"].count()
-    total = contractor_count.sum()
+def analyze_contractor_distribution(top_n=CONTRACTOR_TOP_N):
+    # 以 SQL GROUP BY 計算各廠商專案數 (依數量遞減)，第 top_n 名之後合併為「其他」
+    # 統計在背景執行，繪圖回到主執行緒
+    def work(task):
+        conn = task.connect()
+        try:
+            rows = conn.execute("""
+                SELECT contractor, COUNT(*) AS project_count FROM projects
+                WHERE contractor IS NOT NULL AND deleted_at IS NULL
+                GROUP BY contractor ORDER BY project_count DESC, contractor
+            """).fetchall()
+        finally:
+            conn.close()
+        if top_n and len(rows) > top_n:
+            # 前 top_n 名中若有廠商名稱就叫「其他」，合併為同一筆
+            counts = dict(rows[:top_n])
+            counts[OTHERS_LABEL] = counts.get(OTHERS_LABEL, 0) + sum(r[1] for r in rows[top_n:])
+            rows = list(counts.items())
+        return rows
+    run_task("contractor_distribution", work, draw_contractor_distribution,
+             key=("contractor_distribution", top_n), label="統計廠商資料…")
+
+def draw_contractor_distribution(rows):
+    import numpy as np  # 用於計算角度與座標
+    vendors = [r[0] for r in rows]
+    counts = np.array([r[1] for r in rows], dtype=float)
+    total = counts.sum()
     
+    plt = get_pyplot()
     fig, ax = plt.subplots(figsize=(8, 6))
-    explode = [0.05] * len(contractor_count)
-    wedges, _ = ax.pie(contractor_count.values, explode=explode, startangle=90, labels=None)
+    explode = [0.05] * len(counts)
+    wedges, _ = ax.pie(counts, explode=explode, startangle=90, labels=None)
     ax.set_title("各廠商專案數比例")
     
-    # 收集各扇區資訊
-    labels_info = []
-    for i, wedge in enumerate(wedges):
-        angle = (wedge.theta2 + wedge.theta1) / 2.0
-        x = np.cos(np.deg2rad(angle))
-        y = np.sin(np.deg2rad(angle))
-        percentage = contractor_count.values[i] / total * 100
-        vendor = contractor_count.index[i]
-        group = "right" if x >= 0 else "left"
-        labels_info.append({
-            "vendor": vendor,
-            "percentage": percentage,
-            "wedge_center": (x, y),
-            "group": group
-        })
+    # 各扇區中心座標一次以向量計算
+    angles = np.deg2rad([(w.theta2 + w.theta1) / 2.0 for w in wedges])
+    xs = np.cos(angles)
+    ys = np.sin(angles)
+    percentages = counts / total * 100 if total else counts
     
-    # 分組
-    left_labels = [d for d in labels_info if d["group"] == "left"]
-    right_labels = [d for d in labels_info if d["group"] == "right"]
-    left_labels.sort(key=lambda d: d["wedge_center"][1], reverse=True)
-    right_labels.sort(key=lambda d: d["wedge_center"][1], reverse=True)
-    
-    # 為左右兩組分配固定垂直位置：左右固定 x 座標分別 -1.3 與 +1.3，y 均勻分佈
-    def assign_y_positions(group, side):
-        n = len(group)
+    # 左右兩組各自依 y 值由上而下排列，固定 x 座標分別 -1.3 與 +1.3，y 均勻分佈
+    # 標籤數多到間距小於 LABEL_MIN_GAP 時拉長排列範圍，避免重疊
+    max_span = 0.9
+    for side, mask in (("left", xs < 0), ("right", xs >= 0)):
+        order = np.flatnonzero(mask)
+        order = order[np.argsort(-ys[order], kind="stable")]
+        n = len(order)
         if n == 0:
-            return
-        ys = np.linspace(0.9, -0.9, n)
-        fixed_x = -1.3 if side=="left" else 1.3
-        for i, d in enumerate(group):
-            d["label_pos"] = (fixed_x, ys[i])
-    assign_y_positions(left_labels, "left")
-    assign_y_positions(right_labels, "right")
-    
-    # 標註各標籤：標籤內容為「百分比 廠商名稱」
-    for d in left_labels + right_labels:
-        x, y = d["wedge_center"]
-        label_x, label_y = d["label_pos"]
-        label_text = f"{d['percentage']:.1f}% {d['vendor']}"
-        ha = "right" if d["group"]=="left" else "left"
-        ax.annotate(label_text, xy=(x, y), xytext=(label_x, label_y),
-                    horizontalalignment=ha, verticalalignment="center",
-                    arrowprops=dict(arrowstyle="->", connectionstyle="arc3,rad=0.2"),
-                    fontsize=10)
+            continue
+        span = max(0.9, (n - 1) * LABEL_MIN_GAP / 2)
+        max_span = max(max_span, span)
+        fixed_x = -1.3 if side == "left" else 1.3
+        ha = "right" if side == "left" else "left"
+        # 標註各標籤：標籤內容為「百分比 廠商名稱」
+        for i, label_y in zip(order, np.linspace(span, -span, n)):
+            label_text = f"{percentages[i]:.1f}% {vendors[i]}"
+            ax.annotate(label_text, xy=(xs[i], ys[i]), xytext=(fixed_x, label_y),
+                        horizontalalignment=ha, verticalalignment="center",
+                        arrowprops=dict(arrowstyle="->", connectionstyle="arc3,rad=0.2"),
+                        fontsize=10)
+    if max_span > 0.9:
+        ax.set_ylim(-max_span - 0.2, max_span + 0.2)
+        fig.set_figheight(6 * (max_span + 0.2) / 1.1)
     plt.tight_layout()
     plt.show()
 
+# ========================
+# 狀態列 (背景工作進度與取消)
+# ========================
+frame_status = tk.Frame(root)
+frame_status.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 5))
+status_var = tk.StringVar(value="就緒")
+tk.Label(frame_status, textvariable=status_var, anchor="w").pack(side=tk.LEFT)
+btn_cancel = tk.Button(frame_status, text="取消", command=cancel_all_tasks, state=tk.DISABLED)
+btn_cancel.pack(side=tk.RIGHT, padx=5)
+progress_bar = ttk.Progressbar(frame_status, length=200, mode="determinate")
+progress_bar.pack(side=tk.RIGHT)
+
 # ========================
 # 建立 Notebook 分頁
 # ========================
@@ -563,6 +1228,13 @@ btn_query = tk.Button(frame_query, text="查詢專案", command=query_projects)
 btn_query.grid(row=0, column=6, padx=5)
 btn_reset_query = tk.Button(frame_query, text="重置查詢", command=refresh_table)
 btn_reset_query.grid(row=0, column=7, padx=5)
+live_search_var = tk.BooleanVar(value=False)
+tk.Checkbutton(frame_query, text="即時查詢", variable=live_search_var,
+               command=schedule_live_search).grid(row=0, column=8, padx=5)
+rank_var = tk.BooleanVar(value=False)
+tk.Checkbutton(frame_query, text="依相關度排序", variable=rank_var).grid(row=0, column=9, padx=5)
+for entry in (entry_query_year, entry_query_site, entry_query_project):
+    entry.bind("<KeyRelease>", schedule_live_search)
 
 frame_table = tk.Frame(tab_manage)
 frame_table.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -588,12 +1260,17 @@ tree.heading("廠商", text="廠商")
 tree.column("廠商", width=100)
 tree.heading("備註", text="備註")
 tree.column("備註", width=200)
-v_scrollbar = ttk.Scrollbar(frame_table, orient=tk.VERTICAL, command=tree.yview)
+v_scrollbar = ttk.Scrollbar(frame_table, orient=tk.VERTICAL, command=on_vertical_scroll)
 v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 h_scrollbar = ttk.Scrollbar(frame_table, orient=tk.HORIZONTAL, command=tree.xview)
 h_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
-tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+tree.configure(yscrollcommand=on_tree_yscroll, xscrollcommand=h_scrollbar.set)
 tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+tree.bind("<<TreeviewSelect>>", on_tree_select)
+tree.bind("<MouseWheel>", on_tree_mousewheel)
+tree.bind("<Button-4>", on_tree_mousewheel)
+tree.bind("<Button-5>", on_tree_mousewheel)
+tree.bind("<Configure>", on_tree_configure)
 
 # 設定交替列背景色
 tree.tag_configure("evenrow", background="lightblue")
@@ -616,5 +1293,9 @@ btn_contractor.grid(row=0, column=1, padx=5, pady=5)
 # ========================
 init_db()
 refresh_table()
+# 上次結束前 (或 app.py) 可能還有未清理的軟刪除資料
+schedule_compaction()
+root.after(RESULT_POLL_MS, poll_results)
+root.protocol("WM_DELETE_WINDOW", on_close)
 
 root.mainloop()
@@ -1,18 +1,48 @@
 import streamlit as st
 import sqlite3
+import db_migrations
+import column_store
+import perf_monitor
+import search_index
+import search_query
+import json
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 import io
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
 
-# 設定 matplotlib 使用支援中文的備選字型清單
-plt.rcParams['font.sans-serif'] = [
+# matplotlib / openpyxl 只在需要繪圖或匯出時才載入，以縮短啟動時間
+
+# 支援中文的備選字型清單 (依序採用第一個已安裝的字型)
+CJK_FONT_CANDIDATES = [
     'Noto Sans CJK TC',  # Google 推出的免費中文字型，跨平台支援不錯
     'Microsoft JhengHei', # Windows 預設
     'SimHei',             # Linux 部分環境有安裝
     'WenQuanYi Zen Hei'   # Ubuntu 常見中文字型
 ]
-plt.rcParams['axes.unicode_minus'] = False
+
+
+@st.cache_resource
+def _pyplot():
+    """第一次繪圖時才載入 matplotlib，並在每個程序中只解析一次中文字型"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib import font_manager
+
+    installed = {f.name for f in font_manager.fontManager.ttflist}
+    available = [name for name in CJK_FONT_CANDIDATES if name in installed]
+    # 只放入實際安裝的中文字型，避免每次繪圖都逐一嘗試不存在的字型
+    plt.rcParams['font.sans-serif'] = available[:1] + plt.rcParams['font.sans-serif']
+    plt.rcParams['axes.unicode_minus'] = False
+    return plt
 
 # ==================================
 # 版本及作者資訊 (對應原程式)
@@ -34,76 +64,649 @@ UPDATE_LOG = """版本更新紀錄：
 """
 AUTHOR = "KIM"
 
+# 「英文欄位 → 中文欄位」對應表 (顯示、排序選單共用)
+COLUMN_LABELS = {
+    "id": "ID",
+    "year": "年度",
+    "site_name": "工地名稱",
+    "project_name": "承攬項目",
+    "contract_price": "契約來價(未稅)",
+    "execution_budget": "執行預算(未稅)",
+    "contractor_price": "廠商發包價(未稅)",
+    "indirect_cost": "管銷(契約間接費用)",
+    "contractor": "廠商",
+    "remarks": "備註"
+}
+
+# ==================================
+# 0. 資料庫連線管理 (連線池)
+# ==================================
+DB_PATH = "projects.db"
+# 等待寫入鎖的時間 (毫秒)，可用環境變數 PROJECTS_DB_BUSY_TIMEOUT 調整
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("PROJECTS_DB_BUSY_TIMEOUT", "5000"))
+# 連線池保留的閒置連線數上限
+DB_POOL_SIZE = 8
+# 每條連線快取的預備陳述式 (prepared statement) 數量
+DB_STATEMENT_CACHE_SIZE = 128
+
+
+def _open_connection():
+    """建立一條新的資料庫連線，並套用 WAL 與 busy_timeout 設定"""
+    conn = sqlite3.connect(DB_PATH,
+                           timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           check_same_thread=False,
+                           cached_statements=DB_STATEMENT_CACHE_SIZE)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@st.cache_resource
+def _connection_pool():
+    """整個程序共用的閒置連線池 (跨 rerun 與 session 保留)"""
+    return queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+
+@contextmanager
+def get_connection():
+    """從連線池借出一條連線，用完自動歸還；發生例外時先 rollback"""
+    pool = _connection_pool()
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        with perf.span("db.connect"):
+            conn = _open_connection()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+# ==================================
+# 0-1. 資料版本與查詢結果快取
+# ==================================
+# 最多保留的查詢結果 (全表與各組查詢條件) 數量
+RESULT_CACHE_SIZE = 32
+
+
+@st.cache_resource
+def _version_probe():
+    """專門讀取 PRAGMA data_version 的連線，本身從不寫入"""
+    return {"conn": _open_connection(), "lock": threading.Lock()}
+
+
+def get_data_version():
+    """回傳資料庫目前的變更版本。
+
+    data_version 只在「其他連線」提交寫入後改變，因此用一條從不寫入的
+    連線來讀取，任何寫入 (包含本程序的連線池與 PD-9 等其他程式) 都會反映出來。
+    """
+    probe = _version_probe()
+    with probe["lock"]:
+        return probe["conn"].execute("PRAGMA data_version").fetchone()[0]
+
+
+@st.cache_resource
+def _result_cache():
+    """整個程序共用的 LRU 查詢結果快取：key -> (資料版本, DataFrame)"""
+    return {"entries": OrderedDict(), "lock": threading.Lock()}
+
+
+def _cached_read(key, loader, store=None, max_size=RESULT_CACHE_SIZE, name="result"):
+    """以資料版本為鍵讀取快取；版本不同 (資料已變更) 時重新載入。
+
+    版本號必須在查詢前取得：若查詢途中有寫入，存入的舊版本號會在下次讀取時
+    失配而重新載入，不會把舊資料當成新版本回傳。
+    DataFrame 回傳的是副本，呼叫端可自由修改 (pandas 的 Copy-on-Write 下為淺複製，
+    呼叫端修改時才會真正複製資料)。
+    store 可指定其他快取 (預設為查詢結果快取)，max_size 為其容量上限，
+    name 為效能記錄中的快取名稱 (記為「name_cache.key[0]」)。
+    """
+    with perf.span(f"{name}_cache.{key[0]}") as span:
+        version = get_data_version()
+        cache = (store or _result_cache)()
+        with cache["lock"]:
+            hit = cache["entries"].get(key)
+            if hit is not None and hit[0] == version:
+                cache["entries"].move_to_end(key)
+                span.cache = "hit"
+                return _copy_result(hit[1])
+        span.cache = "miss"
+        result = loader()
+        with cache["lock"]:
+            cache["entries"][key] = (version, result)
+            cache["entries"].move_to_end(key)
+            while len(cache["entries"]) > max_size:
+                cache["entries"].popitem(last=False)
+        return _copy_result(result)
+
+
+def _copy_result(result):
+    if isinstance(result, pd.DataFrame):
+        return result.copy(deep=not PANDAS_COPY_ON_WRITE)
+    return result
+
+# ==================================
+# 0-2. 效能量測 (見 perf_monitor.py 與「效能診斷」分頁)
+# ==================================
+# PROJECTS_PERF=0 時停用量測，量測點幾乎沒有額外負擔
+PERF_ENABLED = os.environ.get("PROJECTS_PERF", "1") != "0"
+# 結構化記錄檔 (每行一個 JSON 事件)；設為空字串則只保留在記憶體中
+PERF_LOG_PATH = os.environ.get("PROJECTS_PERF_LOG", "projects_perf.log")
+# 效能診斷分頁列出的最慢查詢數
+PERF_SLOWEST_COUNT = 20
+
+
+@st.cache_resource
+def _perf_recorder():
+    """整個程序共用的效能記錄器 (跨 rerun 與 session 累計)"""
+    return perf_monitor.Recorder(PERF_LOG_PATH or None, enabled=PERF_ENABLED)
+
+
+# 每次執行腳本時取得一次，量測點直接使用，不必每次都經過 cache_resource
+perf = _perf_recorder()
+
+
+def _read_frame(op, query, params=(), display=False):
+    """執行查詢並建立 DataFrame，記錄耗時、筆數與 SQL (效能診斷分頁可查看查詢計畫)。
+
+    欄位型別依 compact_dtypes() 縮小；display=True 表示只供畫面顯示，金額欄位可降為 float32。
+    """
+    with perf.span(op, query, params) as span, get_connection() as conn:
+        df = compact_dtypes(pd.read_sql_query(query, conn, params=params), display)
+        span.rows = len(df)
+        if perf.enabled:
+            span.bytes = int(df.memory_usage(deep=True).sum())
+    return df
+
+
+def explain_query(sql, params=()):
+    """回傳查詢計畫 (EXPLAIN QUERY PLAN) 文字"""
+    with get_connection() as conn:
+        return perf_monitor.explain_query_plan(conn, sql, params)
+
+# ==================================
+# 0-3. 寫入佇列 (所有 session 的寫入由單一執行緒合併成交易)
+# ==================================
+# PROJECTS_DB_WRITE_QUEUE=0 時改由呼叫端的執行緒直接寫入 (一樣會在忙碌時重試)
+DB_WRITE_QUEUE = os.environ.get("PROJECTS_DB_WRITE_QUEUE", "1") != "0"
+# 同一個交易最多合併的寫入數
+WRITE_BATCH_MAX = 64
+# 遇到 SQLITE_BUSY / SQLITE_LOCKED 時的重試次數與退避時間 (秒)：每次加倍，上限 WRITE_RETRY_MAX_DELAY
+WRITE_RETRY_LIMIT = 8
+WRITE_RETRY_BASE_DELAY = 0.02
+WRITE_RETRY_MAX_DELAY = 1.0
+
+
+class _WriteJob:
+    """一次寫入：work(conn) 在交易中執行，reindex(結果) 回傳要更新索引的 id"""
+    __slots__ = ("work", "reindex", "future")
+
+    def __init__(self, work, reindex):
+        self.work = work
+        self.reindex = reindex
+        self.future = Future()
+
+
+def _is_busy(error):
+    """是否為其他連線佔用資料庫造成的錯誤 (可以稍後重試)"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is None:
+        return "locked" in str(error) or "busy" in str(error)
+    # 延伸錯誤碼 (例如 SQLITE_BUSY_SNAPSHOT) 的低 8 位元為主要錯誤碼
+    return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+def retry_busy(func, *args):
+    """執行 func(*args)；資料庫忙碌時以指數退避 (加上隨機抖動) 重試，超過次數才丟出例外"""
+    for attempt in range(WRITE_RETRY_LIMIT + 1):
+        try:
+            return func(*args)
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == WRITE_RETRY_LIMIT:
+                raise
+            delay = min(WRITE_RETRY_BASE_DELAY * 2 ** attempt, WRITE_RETRY_MAX_DELAY)
+            with perf.span("db.busy_retry"):
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def run_write(work, reindex=None):
+    """執行一次寫入，等交易提交後回傳 work(conn) 的結果 (work 丟出的例外會在此丟出)。
+
+    work 會和其他 session 同時送出的寫入合併在同一個交易中執行，因此不可自行 commit，
+    也不可在 work 中再呼叫 run_write。
+    reindex(結果) 回傳受影響的 id 以遞增更新搜尋索引；未提供時索引會在下次查詢時重建。
+    """
+    job = _WriteJob(work, reindex)
+    if DB_WRITE_QUEUE:
+        _write_queue().put(job)
+    else:
+        with get_connection() as conn:
+            _execute_writes(conn, [job])
+    return job.future.result()
+
+
+@st.cache_resource
+def _write_queue():
+    """整個程序共用的寫入佇列，以及唯一的寫入執行緒"""
+    jobs = queue.SimpleQueue()
+    threading.Thread(target=_writer_loop, args=(jobs,),
+                     name="projects-writer", daemon=True).start()
+    return jobs
+
+
+def _writer_loop(jobs):
+    conn = _open_connection()
+    while True:
+        batch = [jobs.get()]
+        # 等待期間累積的寫入一併取出，合併成同一個交易
+        while len(batch) < WRITE_BATCH_MAX:
+            try:
+                batch.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        _execute_writes(conn, batch)
+
+
+def _execute_writes(conn, batch):
+    """以單一交易執行一批寫入並設定各自的結果；忙碌時整批退回重試"""
+    try:
+        with perf.span("db.write_batch") as span:
+            span.rows = len(batch)
+            version, writer_version, outcomes = retry_busy(_run_writes, conn, batch)
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        for job in batch:
+            job.future.set_exception(e)
+        return
+    # 提交後才更新索引 / 欄式儲存：寫入交易進行中絕不等待 Python 的鎖
+    _refresh_after_commit(conn, version, writer_version, batch, outcomes)
+    for job, (result, error) in zip(batch, outcomes):
+        if error is None:
+            job.future.set_result(result)
+        else:
+            job.future.set_exception(error)
+
+
+def _run_writes(conn, batch):
+    """BEGIN IMMEDIATE 後逐一執行 (尚未提交)；單一寫入失敗只退回它自己的 SAVEPOINT。
+
+    回傳 (交易開始時的資料版本, 寫入連線自己看到的資料版本, [(結果, 例外), ...])。
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # 已取得寫入鎖，其他連線在提交前無法再改變資料版本
+        version = get_data_version()
+        writer_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        outcomes = []
+        for job in batch:
+            conn.execute("SAVEPOINT write_job")
+            try:
+                outcomes.append((job.work(conn), None))
+            except Exception as e:
+                if _is_busy(e):
+                    raise
+                conn.execute("ROLLBACK TO write_job")
+                outcomes.append((None, e))
+            conn.execute("RELEASE write_job")
+    except BaseException:
+        conn.rollback()
+        raise
+    return version, writer_version, outcomes
+
+
+def _refresh_after_commit(conn, version, writer_version, batch, outcomes):
+    """一批寫入提交後，遞增更新與交易開始時版本一致的搜尋索引與欄式儲存。
+
+    寫入連線自己的 data_version 只在「其他連線」提交後改變：先讀取提交後的資料版本，
+    再確認寫入連線的 data_version 沒變，即可確定這個版本只多了本批寫入；
+    提交後已有其他連線寫入時不遞增更新，下次查詢時依版本不符整個重建。
+    """
+    try:
+        committed = get_data_version()
+        if conn.execute("PRAGMA data_version").fetchone()[0] != writer_version:
+            return
+        ids = _written_ids(batch, outcomes)
+    except Exception:
+        return
+    _update_search_index(_search_index_state(), conn, version, committed, ids)
+    _update_column_store(_column_store_state(), conn, version, committed, ids)
+
+# ==================================
+# 0-4. DataFrame 欄位型別 (縮小查詢結果與各 session 保留的資料)
+# ==================================
+# PROJECTS_COMPACT_DTYPES=0 時保留 read_sql_query 原本的型別 (比較用)
+COMPACT_DTYPES = os.environ.get("PROJECTS_COMPACT_DTYPES", "1") != "0"
+# 文字欄位：不重複值比例不超過 CATEGORY_MAX_RATIO 時存成 category
+# (每列只存整數代碼，相同的字串只存一份)，其餘改用 pyarrow 字串
+TEXT_COLUMNS = ["year", "site_name", "project_name", "contractor", "remarks"]
+CATEGORY_MAX_RATIO = 0.5
+# 只供顯示的資料中，轉成 float32 不會失真的金額欄位改用 float32
+DISPLAY_FLOAT32_COLUMNS = ["contract_price", "execution_budget", "contractor_price", "indirect_cost"]
+# pandas 3 (或開啟 copy_on_write 的 pandas 2) 下，快取結果的副本只需淺複製
+PANDAS_COPY_ON_WRITE = (int(pd.__version__.split(".")[0]) >= 3
+                        or pd.get_option("mode.copy_on_write") is True)
+
+
+@st.cache_resource
+def _string_dtype():
+    """pyarrow 字串型別 (缺值為 NaN，與 object 字串相同)；沒有安裝 pyarrow 時回傳 None"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)
+    except TypeError:
+        # pandas 2.3 以前以 storage 名稱區分缺值的表示方式
+        return pd.StringDtype("pyarrow_numpy")
+
+
+def compact_dtypes(df, display=False):
+    """依欄位型別政策縮小 DataFrame 的記憶體用量 (就地轉換並回傳 df)"""
+    if not COMPACT_DTYPES or df.empty:
+        return df
+    string_dtype = _string_dtype()
+    for column in TEXT_COLUMNS:
+        if column not in df:
+            continue
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        if values.nunique() <= len(values) * CATEGORY_MAX_RATIO:
+            df[column] = values.astype("category")
+        elif string_dtype is not None and values.dtype != string_dtype:
+            try:
+                df[column] = values.astype(string_dtype)
+            except (TypeError, ValueError):
+                # 例如年度欄位混有數字與文字的舊資料，維持原型別
+                pass
+    if display:
+        for column in DISPLAY_FLOAT32_COLUMNS:
+            if column not in df or df[column].dtype != np.float64:
+                continue
+            narrowed = df[column].astype(np.float32)
+            # 只在每個值轉換後都完全相同時採用 (大金額的個位數不會被捨入)
+            if np.array_equal(narrowed.to_numpy(np.float64), df[column].to_numpy(), equal_nan=True):
+                df[column] = narrowed
+    return df
+
 # ==================================
 # 1. 初始化資料庫 (若無則建立)
 # ==================================
+@st.cache_resource
+def ensure_db():
+    """每個程序只執行一次 init_db，而不是每次 rerun 都執行"""
+    init_db()
+    # 上次程序結束前可能還有未清理的軟刪除資料
+    schedule_compaction()
+    return True
+
+
 def init_db():
-    conn = sqlite3.connect("projects.db")
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            year TEXT NOT NULL,
-            site_name TEXT NOT NULL,
-            project_name TEXT NOT NULL,
-            contract_price REAL DEFAULT 0,
-            execution_budget REAL DEFAULT 0,
-            contractor_price REAL DEFAULT 0,
-            indirect_cost REAL DEFAULT 0,
-            contractor TEXT,
-            remarks TEXT
-        );
-    ''')
-    conn.commit()
-    conn.close()
+    """建立資料表或將既有資料庫升級到最新結構 (見 db_migrations.py)"""
+    with perf.span("db.migrate"), get_connection() as conn:
+        db_migrations.migrate(conn)
 
 # ==================================
 # 2. 新增專案
 # ==================================
 def add_project(year, site_name, project_name, contract_price,
                 execution_budget, contractor_price, contractor, remarks):
-    try:
-        indirect_cost = contract_price - execution_budget
-    except:
-        indirect_cost = 0
-    conn = sqlite3.connect("projects.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO projects (year, site_name, project_name, contract_price,
-        execution_budget, contractor_price, indirect_cost, contractor, remarks)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (year, site_name, project_name, contract_price,
-          execution_budget, contractor_price, indirect_cost, contractor, remarks))
-    conn.commit()
-    conn.close()
+    # 管銷 (indirect_cost) 為資料庫生成欄位：契約來價 - 執行預算
+    def work(conn):
+        return conn.execute("""
+            INSERT INTO projects (year, site_name, project_name, contract_price,
+            execution_budget, contractor_price, contractor, remarks)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (year, site_name, project_name, contract_price,
+              execution_budget, contractor_price, contractor, remarks)).lastrowid
+
+    with perf.span("db.add_project") as span:
+        span.rows = 1
+        return run_write(work, reindex=lambda pid: [pid])
 
 # ==================================
 # 3. 查詢專案 (依條件過濾)
 # ==================================
-def query_projects(year="", site="", project=""):
-    conn = sqlite3.connect("projects.db")
-    query = "SELECT * FROM projects WHERE 1=1"
-    params = []
-    if year:
-        query += " AND year LIKE ?"
-        params.append(f"%{year}%")
-    if site:
-        query += " AND site_name LIKE ?"
-        params.append(f"%{site}%")
-    if project:
-        query += " AND project_name LIKE ?"
-        params.append(f"%{project}%")
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    return df
+# 顯示 / 匯出用的欄位 (不含軟刪除標記 deleted_at)
+PROJECT_COLUMNS_SQL = ", ".join(f"projects.{col}" for col in COLUMN_LABELS)
+
+
+def build_search_query(year="", site="", project="", keyword="", rank=False):
+    """依查詢條件組出 SQL 與參數 (規則見 search_query.py，與 PD-9.py 共用)"""
+    return search_query.build_search_query(PROJECT_COLUMNS_SQL, year, site, project, keyword, rank)
+
+
+def query_projects(year="", site="", project="", keyword="", rank=False):
+    query, params = build_search_query(year, site, project, keyword, rank)
+    if " ORDER BY " not in query:
+        # 未依相關度排序時維持依 id 的順序 (不受查詢計畫選用的索引影響)
+        query += " ORDER BY projects.id"
+
+    def load():
+        return _read_frame("db.query_projects", query, params)
+    return _cached_read(("query", year, site, project, keyword, rank), load)
 
 # ==================================
 # 4. 讀取所有專案 (顯示用)
 # ==================================
 def get_all_projects():
-    conn = sqlite3.connect("projects.db")
-    df = pd.read_sql_query("SELECT * FROM projects", conn)
-    conn.close()
+    def load():
+        # 明確依 id 排序：否則查詢計畫可能改走 deleted_at IS NULL 的部分索引，順序跟著改變
+        return _read_frame("db.get_all_projects",
+                           f"SELECT {PROJECT_COLUMNS_SQL} FROM projects WHERE deleted_at IS NULL "
+                           "ORDER BY projects.id")
+    return _cached_read(("all",), load)
+
+# ==================================
+# 4-1. 分頁讀取 (排序與分頁都在 SQL 端完成)
+# ==================================
+PAGE_SIZE_OPTIONS = [25, 50, 100, 200]
+
+
+def count_projects(year="", site="", project="", keyword=""):
+    """符合查詢條件的專案筆數 (驅動分頁控制項)"""
+    query, params = build_search_query(year, site, project, keyword)
+    count_sql = f"SELECT COUNT(*) FROM ({query})"
+
+    def load():
+        with perf.span("db.count_projects", count_sql, params), get_connection() as conn:
+            return conn.execute(count_sql, params).fetchone()[0]
+    return _cached_read(("count", year, site, project, keyword), load)
+
+
+def fetch_projects_page(year="", site="", project="", keyword="", rank=False,
+                        sort_by="id", descending=False, page=1, page_size=50):
+    """只取出一頁資料；rank=True 且有全文條件時依相關度排序，否則依 sort_by 排序"""
+    if sort_by not in COLUMN_LABELS:
+        raise ValueError(f"不支援的排序欄位：{sort_by}")
+    query, params = build_search_query(year, site, project, keyword, rank)
+    if " ORDER BY " not in query:
+        direction = "DESC" if descending else "ASC"
+        # 以 id 作為次要排序，讓相同值的資料在翻頁時順序穩定
+        query += f" ORDER BY projects.{sort_by} {direction}, projects.id {direction}"
+    query += " LIMIT ? OFFSET ?"
+    page_params = params + [page_size, (max(page, 1) - 1) * page_size]
+
+    def load():
+        return _read_frame("db.fetch_projects_page", query, page_params, display=True)
+    return _cached_read(("page", year, site, project, keyword, rank,
+                         sort_by, descending, page, page_size), load)
+
+# ==================================
+# 4-2. 即時查詢 (記憶體內索引，見 search_index.py)
+# ==================================
+@st.cache_resource
+def _search_index_state():
+    """整個程序共用的搜尋索引，以及建立 / 最後更新時的資料版本"""
+    return {"index": None, "version": None, "lock": threading.Lock(), "build_lock": threading.Lock()}
+
+
+def _shared_snapshot(state, key, build):
+    """回傳與資料庫目前版本一致的 state[key]；版本不符時以 build(conn) 重建。
+
+    重建不持有 state["lock"] (同一時間只有一個重建，其餘在 state["build_lock"] 等待)，
+    寫入執行緒提交後的遞增更新只需短暫取得 state["lock"]。
+    資料版本在讀取資料前取得，重建期間若有寫入，下次查詢時會因版本不符再重建。
+    """
+    version = get_data_version()
+    with state["lock"]:
+        if state[key] is not None and state["version"] == version:
+            return state[key]
+    with state["build_lock"]:
+        version = get_data_version()
+        with state["lock"]:
+            if state[key] is not None and state["version"] == version:
+                return state[key]
+        with get_connection() as conn:
+            value = build(conn)
+        with state["lock"]:
+            state[key] = value
+            state["version"] = version
+        return value
+
+
+def get_search_index():
+    """回傳與資料庫目前版本一致的搜尋索引；資料被其他連線變更過 (例如匯入、PD-9) 時重建"""
+    def build(conn):
+        with perf.span("index.rebuild", search_index.INDEX_SOURCE_SQL) as span:
+            index = search_index.SearchIndex.from_connection(conn)
+            span.rows = len(index)
+        return index
+    return _shared_snapshot(_search_index_state(), "index", build)
+
+
+def _written_ids(batch, outcomes):
+    """一批寫入中成功的寫入所影響的 id；任何一個未提供 reindex 時回傳 None"""
+    ids = set()
+    for job, (result, error) in zip(batch, outcomes):
+        if error is not None:
+            continue
+        if job.reindex is None:
+            return None
+        ids.update(job.reindex(result))
+    return ids
+
+
+def _update_search_index(state, conn, version, committed, ids):
+    """一批寫入提交後遞增更新索引，並記錄為提交後的資料版本 committed。
+
+    索引在交易開始前若已過期 (或尚未建立) 則不處理，下次查詢時整個重建；
+    ids 為 None (有寫入未提供 reindex) 時直接捨棄索引。
+    本程序自己的寫入因此不會造成重建。
+    """
+    with state["lock"]:
+        index = state["index"]
+        if index is None or state["version"] != version:
+            return
+        if ids is None:
+            state["index"] = None
+            return
+        try:
+            if ids:
+                _reindex_projects(index, conn, ids)
+            state["version"] = committed
+        except Exception:
+            state["index"] = None
+
+
+def _reindex_projects(index, conn, ids):
+    """依資料庫中的實際內容 (例如 year 轉型後的值) 更新索引；已不存在的 id 從索引移除"""
+    ids = [int(pid) for pid in ids]
+    rows = conn.execute(f"{search_index.INDEX_SOURCE_SQL} "
+                        "AND id IN (SELECT value FROM json_each(?))",
+                        (json.dumps(ids),)).fetchall()
+    for pid, year, site_name, project_name in rows:
+        index.update(pid, year, site_name, project_name)
+    index.remove(set(ids) - {row[0] for row in rows})
+
+
+def live_search(year="", site="", project="", previous=None):
+    """以記憶體內索引比對年度 / 工地名稱 / 承攬項目 (與 LIKE '%詞%' 相同)。
+
+    previous 為同一使用者上一次的結果；條件只是加長時直接在其中篩選。
+    """
+    index = get_search_index()
+    with perf.span("index.live_search") as span:
+        result = index.search(year, site, project, previous=previous)
+        span.rows = len(result.ids)
+    return result
+
+
+def fetch_projects_by_ids(ids, sort_by="id", descending=False, page=1, page_size=50):
+    """依 id 清單取出一頁資料，排序與分頁仍在 SQL 端完成"""
+    if sort_by not in COLUMN_LABELS:
+        raise ValueError(f"不支援的排序欄位：{sort_by}")
+    direction = "DESC" if descending else "ASC"
+    # id 清單以單一 JSON 參數傳入，不受 SQLite 參數個數上限限制
+    query = (f"SELECT {PROJECT_COLUMNS_SQL} FROM projects "
+             "WHERE projects.deleted_at IS NULL "
+             "AND projects.id IN (SELECT value FROM json_each(?)) "
+             f"ORDER BY projects.{sort_by} {direction}, projects.id {direction} "
+             "LIMIT ? OFFSET ?")
+    params = [json.dumps(list(ids)), page_size, (max(page, 1) - 1) * page_size]
+    return _read_frame("db.fetch_projects_by_ids", query, params, display=True)
+
+# ==================================
+# 4-3. 分析用欄式儲存 (記憶體內 NumPy 陣列，見 column_store.py)
+# ==================================
+@st.cache_resource
+def _column_store_state():
+    """整個程序共用的欄式儲存，以及建立 / 最後更新時的資料版本"""
+    return {"store": None, "version": None, "lock": threading.Lock(), "build_lock": threading.Lock()}
+
+
+def get_column_store():
+    """回傳與資料庫目前版本一致的欄式儲存；資料被其他連線變更過時重新載入"""
+    def build(conn):
+        with perf.span("store.rebuild", column_store.STORE_SOURCE_SQL) as span:
+            store = column_store.ColumnStore.from_connection(conn)
+            span.rows = len(store)
+            span.bytes = store.nbytes()
+        return store
+    return _shared_snapshot(_column_store_state(), "store", build)
+
+
+def _update_column_store(state, conn, version, committed, ids):
+    """一批寫入提交後遞增更新欄式儲存；規則與 _update_search_index 相同"""
+    with state["lock"]:
+        store = state["store"]
+        if store is None or state["version"] != version:
+            return
+        if ids is None:
+            state["store"] = None
+            return
+        try:
+            if ids:
+                ids = [int(pid) for pid in ids]
+                rows = conn.execute(f"{column_store.STORE_SOURCE_SQL} "
+                                    "AND id IN (SELECT value FROM json_each(?))",
+                                    (json.dumps(ids),)).fetchall()
+                store.upsert(rows)
+                store.remove(set(ids) - {row[0] for row in rows})
+            state["version"] = committed
+        except Exception:
+            state["store"] = None
+
+
+def group_totals(by, columns=()):
+    """以欄式儲存分組彙總 (np.bincount)，回傳 DataFrame：by、project_count 與 columns 的合計"""
+    store = get_column_store()
+    with perf.span(f"store.group_totals.{by}") as span:
+        totals = store.group_totals(by, columns)
+        df = pd.DataFrame({by: totals.labels, "project_count": totals.counts,
+                           **{f"total_{column}": totals.sums[column] for column in columns}})
+        span.rows = len(df)
     return df
 
 # ==================================
@@ -111,140 +714,587 @@ def get_all_projects():
 # ==================================
 def update_project(pid, year, site_name, project_name, contract_price,
                    execution_budget, contractor_price, contractor, remarks):
-    try:
-        indirect_cost = contract_price - execution_budget
-    except:
-        indirect_cost = 0
-    conn = sqlite3.connect("projects.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE projects
-        SET year=?, site_name=?, project_name=?, contract_price=?,
-            execution_budget=?, contractor_price=?, indirect_cost=?,
-            contractor=?, remarks=?
-        WHERE id=?
-    """, (year, site_name, project_name, contract_price,
-          execution_budget, contractor_price, indirect_cost,
-          contractor, remarks, pid))
-    conn.commit()
-    conn.close()
+    def work(conn):
+        return conn.execute("""
+            UPDATE projects
+            SET year=?, site_name=?, project_name=?, contract_price=?,
+                execution_budget=?, contractor_price=?,
+                contractor=?, remarks=?
+            WHERE id=? AND deleted_at IS NULL
+        """, (year, site_name, project_name, contract_price,
+              execution_budget, contractor_price,
+              contractor, remarks, pid)).rowcount
+
+    with perf.span("db.update_project") as span:
+        span.rows = run_write(work, reindex=lambda _: [pid])
+
+# ==================================
+# 5-1. 批次編輯 (表格編輯模式)
+# ==================================
+# 表格中可以編輯的欄位 (id 由資料庫產生，管銷為生成欄位)
+EDITABLE_COLUMNS = ["year", "site_name", "project_name", "contract_price",
+                    "execution_budget", "contractor_price", "contractor", "remarks"]
+REQUIRED_COLUMNS = ["year", "site_name", "project_name"]
+PRICE_COLUMNS = ["contract_price", "execution_budget", "contractor_price"]
+
+
+def _is_blank(value):
+    return (value is None or (isinstance(value, (float, np.floating)) and np.isnan(value))
+            or str(value).strip() == "")
+
+
+def _editor_value(column, value):
+    """表格輸入值轉成寫入資料庫的值：價格空白視為 0，文字去除前後空白"""
+    if column in PRICE_COLUMNS:
+        return 0.0 if _is_blank(value) else float(value)
+    return "" if _is_blank(value) else str(value).strip()
+
+
+def diff_project_edits(original, editor_state):
+    """將 st.data_editor 的編輯狀態轉成 (updates, inserts, deletes)。
+
+    original 為顯示在表格中的 DataFrame (含 id 欄位)；
+    updates 為 {id: {欄位: 新值}}，只包含值真的改變的儲存格；
+    inserts 為依 INSERT_PROJECT_SQL 欄位順序的 tuple 清單；deletes 為 id 清單。
+    必要欄位被清空時丟出 ValueError。
+    """
+    deletes = [int(original.iloc[row]["id"]) for row in editor_state.get("deleted_rows", [])]
+    updates = {}
+    for row, changes in editor_state.get("edited_rows", {}).items():
+        record = original.iloc[int(row)]
+        pid = int(record["id"])
+        if pid in deletes:
+            continue
+        changed = {}
+        for column, value in changes.items():
+            if column not in EDITABLE_COLUMNS:
+                continue
+            value = _editor_value(column, value)
+            if value != _editor_value(column, record[column]):
+                changed[column] = value
+        if any(column in REQUIRED_COLUMNS and value == "" for column, value in changed.items()):
+            raise ValueError(f"專案 ID {pid} 的必要欄位 (年度 / 工地名稱 / 承攬項目) 不可空白")
+        if changed:
+            updates[pid] = changed
+    inserts = []
+    for added in editor_state.get("added_rows", []):
+        if all(_is_blank(added.get(column)) for column in EDITABLE_COLUMNS):
+            continue
+        values = {column: _editor_value(column, added.get(column)) for column in EDITABLE_COLUMNS}
+        if any(values[column] == "" for column in REQUIRED_COLUMNS):
+            raise ValueError("新增的列必須填寫必要欄位：年度 / 工地名稱 / 承攬項目")
+        # 表格新增的列沒有手動調整的管銷 (indirect_cost_override 為 NULL)
+        inserts.append(tuple(values[column] for column in EDITABLE_COLUMNS) + (None,))
+    return updates, inserts, deletes
+
+
+def apply_project_edits(updates=None, inserts=(), deletes=()):
+    """在同一個交易中套用批次編輯，回傳 (修改, 新增, 刪除) 筆數。
+
+    修改只寫入有變更的欄位：變更欄位相同的列合併成一次 executemany。
+    管銷由資料庫生成欄位計算，因此只有價格變更的列會重新計算；
+    全文索引與年度彙總的觸發器也只在相關欄位變更時執行。
+    """
+    updates = updates or {}
+    groups = {}
+    for pid, changes in updates.items():
+        columns = tuple(sorted(changes))
+        if not set(columns) <= set(EDITABLE_COLUMNS):
+            raise ValueError(f"不支援修改的欄位：{set(columns) - set(EDITABLE_COLUMNS)}")
+        groups.setdefault(columns, []).append(tuple(changes[c] for c in columns) + (int(pid),))
+    inserts = list(inserts)
+    deletes = [int(pid) for pid in deletes]
+
+    def work(conn):
+        updated = 0
+        for columns, rows in groups.items():
+            assignments = ", ".join(f"{column}=?" for column in columns)
+            updated += conn.executemany(
+                f"UPDATE projects SET {assignments} WHERE id=? AND deleted_at IS NULL",
+                rows).rowcount
+        inserted_ids = []
+        if inserts:
+            # 交易中持有寫入鎖，新增的 id 必定大於目前最大的 id
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM projects").fetchone()[0]
+            conn.executemany(INSERT_PROJECT_SQL, inserts)
+            inserted_ids = [row[0] for row in conn.execute(
+                "SELECT id FROM projects WHERE id > ?", (last_id,))]
+        deleted = 0
+        if deletes:
+            deleted = conn.execute(
+                "DELETE FROM projects WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(deletes),)).rowcount
+        return updated, inserted_ids, deleted
+
+    # 只改金額的列也要更新欄式儲存，因此所有修改過的列都重新讀取
+    changed = [int(pid) for pid in updates]
+    with perf.span("db.apply_project_edits") as span:
+        updated, inserted_ids, deleted = run_write(
+            work, reindex=lambda result: changed + result[1] + deletes)
+        span.rows = updated + len(inserted_ids) + deleted
+    return updated, len(inserted_ids), deleted
 
 # ==================================
 # 6. 刪除專案 (可一次多筆)
 # ==================================
-def delete_projects(ids):
-    conn = sqlite3.connect("projects.db")
-    cursor = conn.cursor()
-    for pid in ids:
-        cursor.execute("DELETE FROM projects WHERE id=?", (pid,))
-    conn.commit()
-    conn.close()
+# 每個 IN (...) 的 id 數量 (低於 SQLite 參數上限)
+DELETE_CHUNK_SIZE = 500
+# 背景清理每批真正刪除的筆數；每批是各自的寫入，不會長時間佔住寫入佇列
+COMPACT_BATCH_SIZE = 1000
+# 可回收的空頁佔資料庫頁數達此比例時，清理後再執行 VACUUM
+VACUUM_FREE_RATIO = 0.25
+
+
+def delete_projects(ids, soft=False):
+    """以 IN (...) 分批刪除，全部在同一個交易內完成。
+
+    soft=True 時只在 deleted_at 記下刪除時間 (不需更新全文索引，大量刪除也能立即完成)，
+    所有讀取都會排除這些列，實際刪除與空間回收交給背景清理。
+    """
+    ids = [int(pid) for pid in ids]
+
+    def work(conn):
+        for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+            chunk = ids[start:start + DELETE_CHUNK_SIZE]
+            marks = ",".join("?" * len(chunk))
+            if soft:
+                conn.execute("UPDATE projects SET deleted_at = CURRENT_TIMESTAMP "
+                             f"WHERE deleted_at IS NULL AND id IN ({marks})", chunk)
+            else:
+                conn.execute(f"DELETE FROM projects WHERE id IN ({marks})", chunk)
+
+    op = "db.delete_projects[soft]" if soft else "db.delete_projects"
+    with perf.span(op) as span:
+        span.rows = len(ids)
+        run_write(work, reindex=lambda _: ids)
+    if soft:
+        schedule_compaction()
+
+
+def compact_deleted_projects(batch_size=COMPACT_BATCH_SIZE):
+    """真正刪除已標記 deleted_at 的列，回傳刪除筆數；必要時執行 VACUUM 回收空間"""
+    def work(conn):
+        return conn.execute(
+            "DELETE FROM projects WHERE id IN "
+            "(SELECT id FROM projects WHERE deleted_at IS NOT NULL LIMIT ?)",
+            (batch_size,)).rowcount
+
+    removed = 0
+    with perf.span("db.compact") as span:
+        while True:
+            # 標記刪除的列早已不在搜尋索引中，不需更新索引
+            count = run_write(work, reindex=lambda _: ())
+            if count <= 0:
+                break
+            removed += count
+        if removed:
+            with get_connection() as conn:
+                page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if page_count and free_pages / page_count >= VACUUM_FREE_RATIO:
+                    # VACUUM 不能在交易中執行，直接在連線上執行 (其他連線寫入中則稍後重試)
+                    retry_busy(conn.execute, "VACUUM")
+        span.rows = removed
+    return removed
+
+
+@st.cache_resource
+def _compaction_state():
+    """整個程序共用的背景清理狀態 (同一時間只有一個清理執行緒)"""
+    return {"lock": threading.Lock(), "running": False, "pending": False}
+
+
+def schedule_compaction():
+    """請背景執行緒清理已標記刪除的資料；執行中再次呼叫會在本輪結束後再清一次"""
+    state = _compaction_state()
+    with state["lock"]:
+        state["pending"] = True
+        if state["running"]:
+            return
+        state["running"] = True
+    threading.Thread(target=_compaction_worker, args=(state,),
+                     name="projects-compaction", daemon=True).start()
+
+
+def _compaction_worker(state):
+    while True:
+        with state["lock"]:
+            if not state["pending"]:
+                state["running"] = False
+                return
+            state["pending"] = False
+        try:
+            compact_deleted_projects()
+        except sqlite3.Error:
+            # 例如等待寫入鎖逾時：標記仍保留，下次刪除時會再排入清理
+            pass
 
 # ==================================
 # 7. 匯出 Excel
 # ==================================
+# 超過此筆數時改用 openpyxl write_only 逐列串流寫出，記憶體用量不隨資料量成長
+EXPORT_STREAMING_THRESHOLD = 50000
+
+
 def export_excel():
-    """回傳一個 bytes 物件，給 streamlit download_button 使用"""
+    """回傳一個 bytes 物件，給 streamlit download_button 使用。
+
+    結果依資料版本快取，資料未變更時重複下載不會重新產生活頁簿。
+    """
+    return _cached_read(("export",), _build_export_bytes)
+
+
+def _build_export_bytes():
+    if count_projects() > EXPORT_STREAMING_THRESHOLD:
+        return _build_export_bytes_streaming()
     df = get_all_projects()
     # 重新命名欄位(與原 Tkinter 程式對應)
-    df.columns = ["ID", "年度", "工地名稱", "承攬項目", "契約來價(未稅)",
-                  "執行預算(未稅)", "廠商發包價(未稅)", "管銷(契約間接費用)",
-                  "廠商", "備註"]
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="projects")
-    processed_data = output.getvalue()
+    df.columns = list(COLUMN_LABELS.values())
+    with perf.span("excel.write") as span:
+        output = io.BytesIO()
+        with pd.ExcelWriter(output, engine="openpyxl") as writer:
+            df.to_excel(writer, index=False, sheet_name="projects")
+        processed_data = output.getvalue()
+        span.rows = len(df)
+        span.bytes = len(processed_data)
     return processed_data
 
+
+def _build_export_bytes_streaming():
+    """直接從資料庫游標逐列寫入 write_only 活頁簿，不建立 DataFrame"""
+    from openpyxl import Workbook
+
+    query = (f"SELECT {PROJECT_COLUMNS_SQL} FROM projects WHERE deleted_at IS NULL "
+             "ORDER BY projects.id")
+    with perf.span("excel.write_streaming", query) as span:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("projects")
+        ws.append(list(COLUMN_LABELS.values()))
+        rows = 0
+        with get_connection() as conn:
+            for row in conn.execute(query):
+                ws.append(row)
+                rows += 1
+        output = io.BytesIO()
+        wb.save(output)
+        span.rows = rows
+        span.bytes = output.tell()
+    return output.getvalue()
+
 # ==================================
 # 8. 匯入 Excel
 # ==================================
+# 預期的中文欄位與英文欄位對應
+IMPORT_HEADER_MAP = {
+    "ID": "id",
+    "年度": "year",
+    "工地名稱": "site_name",
+    "承攬項目": "project_name",
+    "契約來價(未稅)": "contract_price",
+    "執行預算(未稅)": "execution_budget",
+    "廠商發包價(未稅)": "contractor_price",
+    "管銷(契約間接費用)": "indirect_cost",
+    "廠商": "contractor",
+    "備註": "remarks"
+}
+IMPORT_REQUIRED_HEADERS = ["年度", "工地名稱", "承攬項目"]
+
+
+def _rename_import_columns(df):
+    """中文欄位換成英文欄位；若有 id 欄位則移除，因為資料庫會自動產生"""
+    df = df.rename(columns=IMPORT_HEADER_MAP)
+    if "id" in df.columns:
+        df = df.drop("id", axis=1)
+    return df
+
+
 def import_excel(uploaded_file):
+    """匯入 Excel 並在畫面上顯示結果；成功時回傳 (成功筆數, 失敗筆數)，否則回傳 None"""
     if uploaded_file is not None:
         try:
-            df = pd.read_excel(uploaded_file)
-            # 預期的中文欄位與英文欄位對應
-            chinese_to_eng = {
-                "ID": "id",
-                "年度": "year",
-                "工地名稱": "site_name",
-                "承攬項目": "project_name",
-                "契約來價(未稅)": "contract_price",
-                "執行預算(未稅)": "execution_budget",
-                "廠商發包價(未稅)": "contractor_price",
-                "管銷(契約間接費用)": "indirect_cost",
-                "廠商": "contractor",
-                "備註": "remarks"
-            }
-            required_cols = ["年度", "工地名稱", "承攬項目"]
-            for req in required_cols:
+            with perf.span("excel.read") as span:
+                df = pd.read_excel(uploaded_file)
+                span.rows = len(df)
+                span.bytes = getattr(uploaded_file, "size", None)
+            for req in IMPORT_REQUIRED_HEADERS:
                 if req not in df.columns:
                     st.error(f"Excel 檔案缺少必要欄位：{req}")
                     return
 
             # 轉換欄位名稱
-            df = df.rename(columns=chinese_to_eng)
-            # 若有 id 欄位，先移除，因為資料庫會自動產生
-            if "id" in df.columns:
-                df.drop("id", axis=1, inplace=True)
-
-            # 將資料寫入資料庫
-            conn = sqlite3.connect("projects.db")
-            cursor = conn.cursor()
-            success_count = 0
-            error_count = 0
-            for _, row in df.iterrows():
-                # 必要欄位不能為空
-                if pd.isna(row["year"]) or pd.isna(row["site_name"]) or pd.isna(row["project_name"]):
-                    error_count += 1
-                    continue
-
-                year_val = str(row["year"]).strip()
-                site_val = str(row["site_name"]).strip()
-                proj_val = str(row["project_name"]).strip()
-                cp_val = 0 if pd.isna(row.get("contract_price", 0)) else row.get("contract_price", 0)
-                eb_val = 0 if pd.isna(row.get("execution_budget", 0)) else row.get("execution_budget", 0)
-                ctp_val = 0 if pd.isna(row.get("contractor_price", 0)) else row.get("contractor_price", 0)
-                if "indirect_cost" in row and pd.notna(row["indirect_cost"]):
-                    ic_val = row["indirect_cost"]
-                else:
-                    ic_val = cp_val - eb_val
-                contractor_val = str(row.get("contractor", "")).strip()
-                remarks_val = str(row.get("remarks", "")).strip()
+            df = _rename_import_columns(df)
 
-                try:
-                    cursor.execute("""
-                        INSERT INTO projects (year, site_name, project_name,
-                            contract_price, execution_budget, contractor_price,
-                            indirect_cost, contractor, remarks)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (year_val, site_val, proj_val, cp_val,
-                          eb_val, ctp_val, ic_val, contractor_val, remarks_val))
-                    success_count += 1
-                except Exception as e:
-                    error_count += 1
-            conn.commit()
-            conn.close()
+            # 整欄轉換後，以單一交易分批寫入資料庫
+            with perf.span("df.prepare_import") as span:
+                rows, error_count = _prepare_import_rows(df)
+                span.rows = len(rows)
+            # 以第一列作為代表參數，效能診斷分頁才能取得查詢計畫
+            with perf.span("db.import_insert", INSERT_PROJECT_SQL,
+                           rows[0] if rows else None) as span:
+                success_count, failed = run_write(lambda conn: _insert_import_rows(conn, rows))
+                span.rows = success_count
+            error_count += failed
             st.success(f"匯入完成！成功：{success_count}，失敗：{error_count}")
+            return success_count, error_count
         except Exception as e:
             st.error(f"匯入過程發生錯誤：{e}")
 
+
+# 每次 executemany 寫入的筆數
+IMPORT_CHUNK_SIZE = 1000
+
+INSERT_PROJECT_SQL = """
+    INSERT INTO projects (year, site_name, project_name,
+        contract_price, execution_budget, contractor_price,
+        contractor, remarks, indirect_cost_override)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _prepare_import_rows(df):
+    """將 (已換成英文欄位名稱的) 匯入資料整欄轉換為待寫入的 tuple 清單。
+
+    回傳 (rows, 失敗筆數)；必要欄位空白、或缺少管銷且無法由
+    契約來價 - 執行預算 計算的列視為失敗。管銷由資料庫生成欄位計算；
+    檔案中的管銷與計算結果不同 (手動調整過) 時寫入 indirect_cost_override 保留原值。
+    """
+    valid = df["year"].notna() & df["site_name"].notna() & df["project_name"].notna()
+    df = df[valid]
+
+    def price(col):
+        if col not in df.columns:
+            return pd.Series(0, index=df.index)
+        return df[col].fillna(0)
+
+    def text(col):
+        if col not in df.columns:
+            return pd.Series("", index=df.index)
+        return df[col].fillna("").astype(str).str.strip()
+
+    cp = price("contract_price")
+    eb = price("execution_budget")
+    ctp = price("contractor_price")
+    computed = (pd.to_numeric(cp, errors="coerce")
+                - pd.to_numeric(eb, errors="coerce"))
+    ic = computed
+    override = pd.Series(np.nan, index=df.index)
+    if "indirect_cost" in df.columns:
+        ic = df["indirect_cost"].where(df["indirect_cost"].notna(), computed)
+        stored = pd.to_numeric(df["indirect_cost"], errors="coerce")
+        override = stored.where(stored.notna()
+                                & ~np.isclose(stored, computed, rtol=1e-9, atol=1e-6))
+    computable = ic.notna()
+    override = override.astype(object).where(override.notna(), None)
+
+    columns = [
+        text("year")[computable],
+        text("site_name")[computable],
+        text("project_name")[computable],
+        cp[computable],
+        eb[computable],
+        ctp[computable],
+        text("contractor")[computable],
+        text("remarks")[computable],
+        override[computable],
+    ]
+    # tolist() 會把 numpy 純量轉成 sqlite3 可直接綁定的 Python 型別
+    rows = list(zip(*(col.tolist() for col in columns)))
+    error_count = int((~valid).sum() + (~computable).sum())
+    return rows, error_count
+
+
+def _insert_import_rows(conn, rows):
+    """分批 executemany 寫入，回傳 (成功筆數, 失敗筆數)；不自行 commit (經由 run_write 呼叫)。
+
+    某一批寫入失敗時，先退回該批，再逐列重試，以便逐列計算失敗筆數。
+    """
+    cursor = conn.cursor()
+    if not conn.in_transaction:
+        # 明確開始交易，否則最外層的 SAVEPOINT 在 RELEASE 時會直接提交
+        cursor.execute("BEGIN")
+    success_count = 0
+    error_count = 0
+    for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+        chunk = rows[start:start + IMPORT_CHUNK_SIZE]
+        cursor.execute("SAVEPOINT import_chunk")
+        try:
+            cursor.executemany(INSERT_PROJECT_SQL, chunk)
+            success_count += len(chunk)
+        except Exception:
+            cursor.execute("ROLLBACK TO import_chunk")
+            for row in chunk:
+                try:
+                    cursor.execute(INSERT_PROJECT_SQL, row)
+                    success_count += 1
+                except Exception:
+                    error_count += 1
+        cursor.execute("RELEASE import_chunk")
+    return success_count, error_count
+
+# ==================================
+# 8-1. 串流匯入 (大型 Excel / CSV)
+# ==================================
+# 串流匯入每批讀取並寫入的筆數；記憶體用量取決於此值而非檔案大小
+IMPORT_STREAM_BATCH_SIZE = 5000
+
+
+def _iter_excel_batches(uploaded_file, batch_size):
+    """以 openpyxl 唯讀模式逐列讀取工作表，每次產生 (表頭, 資料列, 進度)"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        total = ws.max_row or 0
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(h).strip() if h is not None else "" for h in header]
+        batch = []
+        read = 1
+        for values in rows:
+            read += 1
+            # 略過整列空白 (與 pd.read_excel 行為一致)
+            if all(v is None for v in values):
+                continue
+            batch.append(values)
+            if len(batch) >= batch_size:
+                yield header, batch, read / total if total else None
+                batch = []
+        yield header, batch, 1.0
+    finally:
+        wb.close()
+
+
+def _iter_csv_batches(uploaded_file, batch_size):
+    """以 pandas chunksize 分批讀取 CSV，每次產生 (表頭, 資料列, 進度)"""
+    size = getattr(uploaded_file, "size", None)
+    reader = pd.read_csv(uploaded_file, chunksize=batch_size,
+                         encoding="utf-8-sig", skipinitialspace=True)
+    for chunk in reader:
+        progress = min(uploaded_file.tell() / size, 1.0) if size else None
+        yield list(chunk.columns), chunk, progress
+
+
+def iter_import_batches(uploaded_file, batch_size=IMPORT_STREAM_BATCH_SIZE):
+    """依副檔名選擇串流讀取方式，逐批產生已換成英文欄位的 DataFrame 與進度 (0~1 或 None)。
+
+    第一批之前會先檢查必要欄位，缺少時丟出 ValueError。
+    """
+    name = getattr(uploaded_file, "name", "")
+    if name.lower().endswith(".csv"):
+        batches = _iter_csv_batches(uploaded_file, batch_size)
+    else:
+        batches = _iter_excel_batches(uploaded_file, batch_size)
+    checked = False
+    for header, rows, progress in batches:
+        if not checked:
+            for req in IMPORT_REQUIRED_HEADERS:
+                if req not in header:
+                    raise ValueError(f"檔案缺少必要欄位：{req}")
+            checked = True
+        df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows, columns=header)
+        yield _rename_import_columns(df), progress
+
+
+def import_streaming(uploaded_file, batch_size=IMPORT_STREAM_BATCH_SIZE):
+    """串流匯入：固定筆數分批讀取、轉換、寫入並提交，並在畫面上顯示進度。
+
+    全部完成時回傳 (成功筆數, 失敗筆數)，中途失敗回傳 None (已寫入的批次會保留)。
+    """
+    if uploaded_file is None:
+        return
+    progress_bar = st.progress(0.0, text="匯入中…")
+    success_count = 0
+    error_count = 0
+    try:
+        for df, progress in iter_import_batches(uploaded_file, batch_size):
+            with perf.span("df.prepare_import") as span:
+                rows, rejected = _prepare_import_rows(df)
+                span.rows = len(rows)
+            # 每批是各自的寫入，其他 session 的寫入可以穿插在批次之間
+            # 以第一列作為代表參數，效能診斷分頁才能取得查詢計畫
+            with perf.span("db.import_insert", INSERT_PROJECT_SQL,
+                           rows[0] if rows else None) as span:
+                inserted, failed = run_write(lambda conn: _insert_import_rows(conn, rows))
+                span.rows = inserted
+            success_count += inserted
+            error_count += rejected + failed
+            if progress is not None:
+                progress_bar.progress(min(progress, 1.0),
+                                      text=f"匯入中…已寫入 {success_count} 筆")
+        progress_bar.progress(1.0, text="匯入完成")
+        st.success(f"匯入完成！成功：{success_count}，失敗：{error_count}")
+        return success_count, error_count
+    except Exception as e:
+        st.error(f"匯入過程發生錯誤：{e}（已寫入 {success_count} 筆）")
+
+# ==================================
+# 8-2. 圖表快取 (分析分頁)
+# ==================================
+# 最多保留的已繪製圖表數量
+CHART_CACHE_SIZE = 16
+
+
+@st.cache_resource
+def _chart_cache():
+    """整個程序共用的 LRU 圖表快取：(圖表, 參數) -> (資料版本, PNG bytes)"""
+    return {"entries": OrderedDict(), "lock": threading.Lock()}
+
+
+def _cached_chart(key, render):
+    """依 (圖表種類, 參數, 資料版本) 取得已繪製的 PNG；未命中時呼叫 render() 重新繪製"""
+    def timed_render():
+        with perf.span(f"chart.{key[0]}") as span:
+            png = render()
+            span.bytes = len(png) if png else 0
+        return png
+    return _cached_read(key, timed_render, store=_chart_cache,
+                        max_size=CHART_CACHE_SIZE, name="chart")
+
+
+def _figure_to_png(fig):
+    """將圖表轉成 PNG bytes，並明確關閉 figure 以免長時間執行的伺服器累積記憶體"""
+    try:
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", dpi=150, bbox_inches="tight")
+        return buf.getvalue()
+    finally:
+        _pyplot().close(fig)
+
 # ==================================
 # 9. 分析功能：年度趨勢分析
 # ==================================
+def get_yearly_trend():
+    """每年度總契約來價與專案數 (欄式儲存依年度 bincount)"""
+    df = group_totals("year", ["contract_price"])
+    # 年度欄位可能混有數字與文字：與 SQLite 的 ORDER BY 相同，數字排在文字前面
+    df = df.sort_values("year", key=lambda years: years.map(lambda y: (isinstance(y, str), y)),
+                        ignore_index=True)
+    return df[["year", "total_contract_price", "project_count"]]
+
+
 def analyze_yearly_trend():
-    df = get_all_projects()
-    if df.empty:
+    png = _cached_chart(("yearly_trend",), _render_yearly_trend)
+    if png is None:
         st.warning("目前沒有專案資料，無法進行年度分析。")
         return
+    st.image(png)
+
 
-    # 轉數值
-    df["contract_price"] = pd.to_numeric(df["contract_price"], errors="coerce")
-    df["id"] = pd.to_numeric(df["id"], errors="coerce")
+def _render_yearly_trend():
+    """繪製年度趨勢圖並回傳 PNG bytes；沒有資料時回傳 None"""
+    df = get_yearly_trend()
+    if df.empty:
+        return None
 
-    yearly_sum = df.groupby("year")["contract_price"].sum()
-    yearly_count = df.groupby("year")["id"].count()
+    # 年度以文字作為類別軸
+    years = df["year"].astype(str)
+    yearly_sum = pd.Series(df["total_contract_price"].values, index=years)
+    yearly_count = pd.Series(df["project_count"].values, index=years)
 
+    plt = _pyplot()
     fig, ax = plt.subplots(1, 2, figsize=(12, 5))
 
     bars1 = ax[0].bar(yearly_sum.index, yearly_sum.values, color="skyblue")
@@ -265,221 +1315,522 @@ def analyze_yearly_trend():
         ax[1].text(bar.get_x() + bar.get_width()/2, height, f"{int(height)}",
                    ha="center", va="bottom", fontsize=9)
 
-    st.pyplot(fig)
+    return _figure_to_png(fig)
 
 # ==================================
 # 10. 分析功能：廠商分佈分析 (圓餅圖)
 # ==================================
-def analyze_contractor_distribution():
-    df = get_all_projects()
+# 圓餅圖預設顯示的廠商數，其餘合併為「其他」
+CONTRACTOR_TOP_N = 10
+# 可選的廠商數上限 (圓餅圖標籤過多時無法閱讀)
+CONTRACTOR_TOP_N_MAX = 50
+OTHERS_LABEL = "其他"
+# 同一側相鄰標籤的最小垂直間距 (資料座標)，標籤過多時會自動拉長排列範圍
+LABEL_MIN_GAP = 0.12
+# 廠商統計表的欄位名稱
+CONTRACTOR_SUMMARY_LABELS = {
+    "contractor": "廠商",
+    "project_count": "專案數",
+    "total_contract_price": "契約來價合計",
+    "total_contractor_price": "廠商發包價合計",
+    "total_indirect_cost": "管銷合計",
+}
+
+
+def get_contractor_counts(top_n=CONTRACTOR_TOP_N):
+    """各廠商專案數 (欄式儲存依廠商 bincount，依數量遞減)；第 top_n 名之後合併為「其他」"""
+    df = group_totals("contractor")
+    df = (df[df["contractor"].notna()]
+          .sort_values(["project_count", "contractor"], ascending=[False, True]))
+    counts = pd.Series(df["project_count"].values, index=df["contractor"])
+    if top_n and len(counts) > top_n:
+        others = counts.iloc[top_n:].sum()
+        counts = counts.iloc[:top_n].copy()
+        # 前 top_n 名中若有廠商名稱就叫「其他」，合併為同一筆而不是覆蓋
+        counts[OTHERS_LABEL] = counts.get(OTHERS_LABEL, 0) + others
+    return counts
+
+
+def get_contractor_summary():
+    """各廠商的專案數與契約來價 / 廠商發包價 / 管銷合計 (依契約來價合計遞減)"""
+    df = group_totals("contractor", ["contract_price", "contractor_price", "indirect_cost"])
+    return (df[df["contractor"].notna()]
+            .sort_values(["total_contract_price", "contractor"], ascending=[False, True],
+                         ignore_index=True))
+
+
+def show_contractor_summary():
+    df = get_contractor_summary()
     if df.empty:
+        st.warning("資料中沒有廠商資訊，無法統計。")
+        return
+    st.dataframe(df, hide_index=True, use_container_width=True,
+                 column_config=CONTRACTOR_SUMMARY_LABELS)
+
+
+def _spread_label_positions(n):
+    """在 [-span, span] 間由上而下均分 n 個標籤位置，保證間距不小於 LABEL_MIN_GAP"""
+    span = max(0.9, (n - 1) * LABEL_MIN_GAP / 2)
+    return np.linspace(span, -span, n), span
+
+
+def analyze_contractor_distribution(top_n=CONTRACTOR_TOP_N):
+    top_n = min(max(int(top_n), 1), CONTRACTOR_TOP_N_MAX)
+    if count_projects() == 0:
         st.warning("目前沒有專案資料，無法進行廠商分佈分析。")
         return
 
-    contractor_count = df.groupby("contractor")["id"].count()
-    if contractor_count.empty:
+    png = _cached_chart(("contractor_distribution", top_n),
+                        lambda: _render_contractor_distribution(top_n))
+    if png is None:
         st.warning("資料中沒有廠商資訊，無法分析。")
         return
+    st.image(png)
+
+
+def _render_contractor_distribution(top_n):
+    """繪製廠商專案數圓餅圖並回傳 PNG bytes；沒有廠商資料時回傳 None"""
+    contractor_count = get_contractor_counts(top_n)
+    if contractor_count.empty:
+        return None
 
     total = contractor_count.sum()
+    plt = _pyplot()
     fig, ax = plt.subplots(figsize=(8, 6))
     explode = [0.05] * len(contractor_count)
     wedges, _ = ax.pie(contractor_count.values, explode=explode, startangle=90, labels=None)
     ax.set_title("各廠商專案數比例")
 
-    # 收集各扇區資訊
-    labels_info = []
-    for i, wedge in enumerate(wedges):
-        angle = (wedge.theta2 + wedge.theta1) / 2.0
-        x = np.cos(np.deg2rad(angle))
-        y = np.sin(np.deg2rad(angle))
-        percentage = contractor_count.values[i] / total * 100
-        vendor = contractor_count.index[i] if contractor_count.index[i] else "未填廠商"
-        group = "right" if x >= 0 else "left"
-        labels_info.append({
-            "vendor": vendor,
-            "percentage": percentage,
-            "wedge_center": (x, y),
-            "group": group
-        })
-
-    # 分組 (左/右)
-    left_labels = [d for d in labels_info if d["group"] == "left"]
-    right_labels = [d for d in labels_info if d["group"] == "right"]
-    # 依 y 值排序，讓標籤由上而下排列
-    left_labels.sort(key=lambda d: d["wedge_center"][1], reverse=True)
-    right_labels.sort(key=lambda d: d["wedge_center"][1], reverse=True)
-
-    def assign_y_positions(group, side):
-        n = len(group)
-        if n == 0:
-            return
-        ys = np.linspace(0.9, -0.9, n)
-        fixed_x = -1.3 if side == "left" else 1.3
-        for i, d in enumerate(group):
-            d["label_pos"] = (fixed_x, ys[i])
-
-    assign_y_positions(left_labels, "left")
-    assign_y_positions(right_labels, "right")
-
-    # 繪製標籤
-    for d in left_labels + right_labels:
-        x, y = d["wedge_center"]
-        label_x, label_y = d["label_pos"]
-        label_text = f"{d['percentage']:.1f}% {d['vendor']}"
-        ha = "right" if d["group"] == "left" else "left"
-        ax.annotate(label_text, xy=(x, y), xytext=(label_x, label_y),
-                    ha=ha, va="center",
-                    arrowprops=dict(arrowstyle="->", connectionstyle="arc3,rad=0.2"),
-                    fontsize=10)
-    st.pyplot(fig)
+    # 各扇區中心座標一次以向量計算
+    angles = np.deg2rad([(w.theta2 + w.theta1) / 2.0 for w in wedges])
+    xs = np.cos(angles)
+    ys = np.sin(angles)
+    percentages = contractor_count.values / total * 100
+    vendors = [v if v else "未填廠商" for v in contractor_count.index]
+
+    # 分組 (左/右)，依 y 值由上而下排列後均分標籤位置
+    max_span = 0.9
+    for side, mask in (("left", xs < 0), ("right", xs >= 0)):
+        order = np.flatnonzero(mask)
+        order = order[np.argsort(-ys[order], kind="stable")]
+        if len(order) == 0:
+            continue
+        label_ys, span = _spread_label_positions(len(order))
+        max_span = max(max_span, span)
+        label_x = -1.3 if side == "left" else 1.3
+        ha = "right" if side == "left" else "left"
+        for i, label_y in zip(order, label_ys):
+            label_text = f"{percentages[i]:.1f}% {vendors[i]}"
+            ax.annotate(label_text, xy=(xs[i], ys[i]), xytext=(label_x, label_y),
+                        ha=ha, va="center",
+                        arrowprops=dict(arrowstyle="->", connectionstyle="arc3,rad=0.2"),
+                        fontsize=10)
+    if max_span > 0.9:
+        # 標籤超出預設範圍時放大座標範圍與圖高，避免標籤重疊或被裁切
+        ax.set_ylim(-max_span - 0.2, max_span + 0.2)
+        fig.set_figheight(6 * (max_span + 0.2) / 1.1)
+    return _figure_to_png(fig)
+
+# ==================================
+# 11. 效能診斷
+# ==================================
+PERF_SUMMARY_LABELS = {
+    "op": "操作",
+    "count": "次數",
+    "p50_ms": "P50 (ms)",
+    "p90_ms": "P90 (ms)",
+    "p99_ms": "P99 (ms)",
+    "max_ms": "最大 (ms)",
+    "rows": "筆數合計",
+    "bytes": "Bytes 合計",
+    "hit_ratio": "快取命中率",
+    "errors": "錯誤次數",
+}
+PERF_EVENT_LABELS = {
+    "ts": "時間",
+    "op": "操作",
+    "ms": "耗時 (ms)",
+    "rows": "筆數",
+    "bytes": "Bytes",
+    "cache": "快取",
+    "error": "錯誤",
+    "sql": "SQL",
+}
+
+
+def render_perf_diagnostics():
+    """各操作的耗時百分位數、最近最慢的查詢及其查詢計畫 (整個程序累計)"""
+    col1, col2 = st.columns(2)
+    # 紀錄器為整個程序共用，開關會影響所有使用者的 session，屬於管理者設定
+    perf.enabled = col1.checkbox("記錄效能資料（全域設定，影響所有使用者）", value=perf.enabled,
+                                 help="效能紀錄器由整個程序共用：關閉後所有 session 都停止記錄，"
+                                      "重新開啟前的操作不會出現在統計中。")
+    if col2.button("清除統計"):
+        perf.reset()
+    if perf.log_path:
+        st.caption(f"結構化記錄檔：{perf.log_path}（每行一個 JSON 事件）")
+
+    summary = perf.summary()
+    if not summary:
+        st.info("目前沒有效能資料。")
+        return
+    st.dataframe(pd.DataFrame(summary).rename(columns=PERF_SUMMARY_LABELS),
+                 use_container_width=True, hide_index=True)
+
+    st.markdown("**最近最慢的查詢**")
+    slowest = perf.slowest(PERF_SLOWEST_COUNT)
+    if not slowest:
+        st.caption("目前沒有查詢紀錄。")
+        return
+    events = pd.DataFrame([span.to_dict() for span in slowest])
+    st.dataframe(events.rename(columns=PERF_EVENT_LABELS),
+                 use_container_width=True, hide_index=True)
+    choice = st.selectbox("查看查詢計畫 (EXPLAIN QUERY PLAN)", range(len(slowest)),
+                          format_func=lambda i: f"{slowest[i].ms:.1f} ms - {slowest[i].op}")
+    span = slowest[choice]
+    st.code(span.sql, language="sql")
+    if "?" in span.sql and not span.params:
+        st.caption("此查詢未記錄參數，無法取得查詢計畫。")
+        return
+    try:
+        st.code(explain_query(span.sql, span.params), language="text")
+    except sqlite3.Error as e:
+        st.error(f"無法取得查詢計畫：{e}")
 
 # ==================================
 # Streamlit 主程式
 # ==================================
-def main():
-    st.set_page_config(page_title="工程專案資料庫", layout="wide")
-    st.title("🏗️ 工程專案資料庫")
+# 各區塊是獨立的 fragment：區塊內的操作只重新執行該區塊，不會重跑整頁。
+# 寫入成功後以 st.rerun(鍵) 只重新執行受影響的區塊 (表單本身與專案列表)。
+RESULTS_FRAGMENT = "results"
+ADD_FRAGMENT = "add_project"
+EDIT_FRAGMENT = "edit_projects"
+# 表格編輯模式的 st.data_editor 鍵
+EDITOR_KEY = "project_editor"
 
-    # 初始化資料庫
-    init_db()
 
-    # 建立三個分頁 (專案管理 / 資料分析 / 關於)
-    tab1, tab2, tab3 = st.tabs(["專案管理", "資料分析", "關於"])
+def _flash(area, kind, message):
+    """記下要在某個區塊下次執行時顯示的訊息 (kind 為 success / warning / error)"""
+    st.session_state.setdefault("flash", {})[area] = (kind, message)
 
-    # ============== 專案管理 ==============
-    with tab1:
-        st.subheader("🔨 專案管理")
 
-        # --- 新增專案表單 ---
-        with st.expander("新增專案"):
-            with st.form("add_project_form"):
-                col1, col2, col3 = st.columns(3)
-                year = col1.text_input("年度")
-                site_name = col2.text_input("工地名稱")
-                project_name = col3.text_input("承攬項目")
-                col4, col5, col6 = st.columns(3)
-                contract_price = col4.number_input("契約來價(未稅)", min_value=0.0, format="%.2f")
-                execution_budget = col5.number_input("執行預算(未稅)", min_value=0.0, format="%.2f")
-                contractor_price = col6.number_input("廠商發包價(未稅)", min_value=0.0, format="%.2f")
-                contractor = st.text_input("廠商")
-                remarks = st.text_area("備註")
-
-                submitted = st.form_submit_button("新增專案")
-                if submitted:
-                    if year and site_name and project_name:
-                        add_project(year, site_name, project_name, contract_price,
-                                    execution_budget, contractor_price, contractor, remarks)
-                        st.success("✅ 專案已新增！")
-                    else:
-                        st.error("請填寫必要欄位：年度 / 工地名稱 / 承攬項目")
-
-        # --- 查詢專案 ---
-        st.subheader("🔍 專案查詢")
+def _show_flash(area):
+    kind, message = st.session_state.get("flash", {}).pop(area, (None, None))
+    if kind is not None:
+        getattr(st, kind)(message)
+
+
+def _session_cached(name, key, load):
+    """同一個 session 內，條件與資料版本都沒變時直接沿用上一次的結果。
+
+    翻頁、排序以外的操作 (例如其他區塊的按鈕) 不會重新查詢，也不必複製快取中的 DataFrame。
+    """
+    with perf.span(f"session_cache.{name}") as span:
+        key = (key, get_data_version())
+        cached = st.session_state.setdefault("results", {}).get(name)
+        if cached is not None and cached[0] == key:
+            span.cache = "hit"
+            return cached[1]
+        span.cache = "miss"
+        value = load()
+        st.session_state["results"][name] = (key, value)
+        return value
+
+
+def _clear_query():
+    """清除目前的查詢條件並回到第一頁 (按鈕 callback)"""
+    st.session_state.pop("query", None)
+    st.session_state["page_no"] = 1
+
+
+def _submit_add_project():
+    """新增專案表單送出 (callback)：成功後只重新執行表單與專案列表"""
+    s = st.session_state
+    if not (s["add_year"] and s["add_site_name"] and s["add_project_name"]):
+        _flash(ADD_FRAGMENT, "error", "請填寫必要欄位：年度 / 工地名稱 / 承攬項目")
+        return
+    add_project(s["add_year"], s["add_site_name"], s["add_project_name"],
+                s["add_contract_price"], s["add_execution_budget"], s["add_contractor_price"],
+                s["add_contractor"], s["add_remarks"])
+    _flash(ADD_FRAGMENT, "success", "✅ 專案已新增！")
+    st.rerun([ADD_FRAGMENT, RESULTS_FRAGMENT])
+
+
+def _submit_update_project():
+    """修改專案表單送出 (callback)"""
+    s = st.session_state
+    pid = s["upd_pid"]
+    if not pid.isdigit():
+        _flash(EDIT_FRAGMENT, "error", "請輸入有效的專案 ID（數字）")
+        return
+    if not (s["upd_year"] and s["upd_site_name"] and s["upd_project_name"]):
+        _flash(EDIT_FRAGMENT, "error", "請填寫必要欄位：年度 / 工地名稱 / 承攬項目")
+        return
+    update_project(int(pid), s["upd_year"], s["upd_site_name"], s["upd_project_name"],
+                   s["upd_contract_price"], s["upd_execution_budget"],
+                   s["upd_contractor_price"], s["upd_contractor"], s["upd_remarks"])
+    _flash(EDIT_FRAGMENT, "success", f"✅ 專案 ID {pid} 已更新！")
+    st.rerun([EDIT_FRAGMENT, RESULTS_FRAGMENT])
+
+
+def _submit_delete_projects():
+    """刪除專案按鈕 (callback)"""
+    del_input = st.session_state["del_ids"]
+    if not del_input.strip():
+        _flash(EDIT_FRAGMENT, "error", "請輸入要刪除的專案 ID")
+        return
+    # 分割多個 ID
+    id_list = [x.strip() for x in del_input.split(",") if x.strip().isdigit()]
+    if not id_list:
+        _flash(EDIT_FRAGMENT, "error", "請輸入有效的專案 ID（數字），多筆以逗號分隔。")
+        return
+    delete_projects(id_list, soft=st.session_state["del_soft"])
+    _flash(EDIT_FRAGMENT, "warning", f"已刪除以下專案 ID：{', '.join(id_list)}")
+    st.rerun([EDIT_FRAGMENT, RESULTS_FRAGMENT])
+
+
+def _save_project_edits(original):
+    """表格編輯模式的「儲存變更」(callback)：只寫入有變更的儲存格，全部在同一個交易中完成"""
+    try:
+        updates, inserts, deletes = diff_project_edits(original, st.session_state.get(EDITOR_KEY, {}))
+    except ValueError as e:
+        _flash(RESULTS_FRAGMENT, "error", str(e))
+        return
+    if not (updates or inserts or deletes):
+        _flash(RESULTS_FRAGMENT, "info", "沒有需要儲存的變更。")
+        return
+    updated, inserted, deleted = apply_project_edits(updates, inserts, deletes)
+    # 表格重新載入後列號會改變，已儲存的編輯不再保留
+    st.session_state.pop(EDITOR_KEY, None)
+    _flash(RESULTS_FRAGMENT, "success",
+           f"✅ 已儲存：修改 {updated} 筆、新增 {inserted} 筆、刪除 {deleted} 筆")
+
+
+def _project_editor(df_page, view_key):
+    """可編輯的專案表格；編輯內容在按下「儲存變更」前只保留在瀏覽器與 session 中"""
+    # 換頁、排序或查詢條件改變時捨棄尚未儲存的編輯 (編輯狀態以目前這一頁的列號記錄)
+    if st.session_state.get("editor_view") != view_key:
+        st.session_state.pop(EDITOR_KEY, None)
+        st.session_state["editor_view"] = view_key
+    # 年度以文字編輯 (可能有「112年度」這類非數字的舊資料)；
+    # category 欄位改回一般文字，否則表格只能從既有的值中選擇
+    original = df_page.astype({column: object for column in df_page.select_dtypes("category")})
+    original = original.astype({"year": str})
+    st.data_editor(original, key=EDITOR_KEY, num_rows="dynamic", hide_index=True,
+                   use_container_width=True, column_config=COLUMN_LABELS,
+                   disabled=["id", "indirect_cost"])
+    st.button("儲存變更", on_click=_save_project_edits, args=(original,))
+
+
+@st.fragment(key=ADD_FRAGMENT)
+def add_project_section():
+    with st.expander("新增專案"):
+        with st.form("add_project_form"):
+            col1, col2, col3 = st.columns(3)
+            col1.text_input("年度", key="add_year")
+            col2.text_input("工地名稱", key="add_site_name")
+            col3.text_input("承攬項目", key="add_project_name")
+            col4, col5, col6 = st.columns(3)
+            col4.number_input("契約來價(未稅)", min_value=0.0, format="%.2f", key="add_contract_price")
+            col5.number_input("執行預算(未稅)", min_value=0.0, format="%.2f", key="add_execution_budget")
+            col6.number_input("廠商發包價(未稅)", min_value=0.0, format="%.2f", key="add_contractor_price")
+            st.text_input("廠商", key="add_contractor")
+            st.text_area("備註", key="add_remarks")
+            st.form_submit_button("新增專案", on_click=_submit_add_project)
+        _show_flash(ADD_FRAGMENT)
+
+
+@st.fragment(key=RESULTS_FRAGMENT)
+def results_section():
+    """查詢條件、排序 / 分頁控制與專案列表"""
+    st.subheader("🔍 專案查詢")
+    live = st.checkbox("即時查詢（輸入年度 / 工地名稱 / 承攬項目後立即篩選）", key="live_mode")
+    live_result = None
+    query_btn = False
+    if live:
+        # 每個欄位輸入完成 (Enter 或離開欄位) 就重新篩選，不必按查詢
+        l_col1, l_col2, l_col3 = st.columns(3)
+        live_terms = (l_col1.text_input("查詢 - 年度", key="live_year"),
+                      l_col2.text_input("查詢 - 工地名稱", key="live_site"),
+                      l_col3.text_input("查詢 - 承攬項目", key="live_project"))
+        if live_terms != st.session_state.get("live_terms"):
+            st.session_state["live_terms"] = live_terms
+            st.session_state["page_no"] = 1
+        if any(term.strip() for term in live_terms):
+            live_result = live_search(*live_terms,
+                                      previous=st.session_state.get("live_result"))
+            st.session_state["live_result"] = live_result
+    else:
         with st.form("query_form"):
-            q_col1, q_col2, q_col3, q_col4 = st.columns([1,1,1,0.5])
+            q_col1, q_col2, q_col3, q_col4, q_col5 = st.columns([1,1,1,1,0.5])
             query_year = q_col1.text_input("查詢 - 年度")
             query_site = q_col2.text_input("查詢 - 工地名稱")
             query_project_name = q_col3.text_input("查詢 - 承攬項目")
-            query_btn = q_col4.form_submit_button("查詢")
-
-        # 這裡定義一個「英文欄位 → 中文欄位」對應表
-        rename_dict = {
-            "id": "ID",
-            "year": "年度",
-            "site_name": "工地名稱",
-            "project_name": "承攬項目",
-            "contract_price": "契約來價(未稅)",
-            "execution_budget": "執行預算(未稅)",
-            "contractor_price": "廠商發包價(未稅)",
-            "indirect_cost": "管銷(契約間接費用)",
-            "contractor": "廠商",
-            "remarks": "備註"
+            query_keyword = q_col4.text_input("查詢 - 關鍵字(含廠商/備註)")
+            query_rank = st.checkbox("依相關度排序")
+            query_btn = q_col5.form_submit_button("查詢")
+
+    if query_btn:
+        # 查詢條件保存在 session 中，翻頁、排序時沿用
+        st.session_state["query"] = {
+            "year": query_year,
+            "site": query_site,
+            "project": query_project_name,
+            "keyword": query_keyword,
+            "rank": query_rank,
         }
+        st.session_state["page_no"] = 1
+    active_query = {} if live else st.session_state.get("query", {})
 
-        if query_btn:
-            df_query = query_projects(query_year, query_site, query_project_name)
-            df_query.rename(columns=rename_dict, inplace=True)
-            st.dataframe(df_query, use_container_width=True)
-        else:
-            df_all = get_all_projects()
-            df_all.rename(columns=rename_dict, inplace=True)
-            st.dataframe(df_all, use_container_width=True)
-
-        # --- 修改專案 ---
-        st.subheader("✏️ 修改專案")
-        with st.expander("修改指定專案"):
-            st.write("請輸入要修改的專案 ID，並填寫更新後的資訊")
-            with st.form("update_form"):
-                pid = st.text_input("專案 ID（僅能輸入單筆）")
-                col_u1, col_u2, col_u3 = st.columns(3)
-                u_year = col_u1.text_input("年度")
-                u_site_name = col_u2.text_input("工地名稱")
-                u_project_name = col_u3.text_input("承攬項目")
-                col_u4, col_u5, col_u6 = st.columns(3)
-                u_contract_price = col_u4.number_input("契約來價(未稅)", min_value=0.0, format="%.2f")
-                u_execution_budget = col_u5.number_input("執行預算(未稅)", min_value=0.0, format="%.2f")
-                u_contractor_price = col_u6.number_input("廠商發包價(未稅)", min_value=0.0, format="%.2f")
-                u_contractor = st.text_input("廠商")
-                u_remarks = st.text_area("備註")
-
-                update_submitted = st.form_submit_button("更新專案")
-                if update_submitted:
-                    if not pid.isdigit():
-                        st.error("請輸入有效的專案 ID（數字）")
-                    else:
-                        if u_year and u_site_name and u_project_name:
-                            update_project(int(pid), u_year, u_site_name, u_project_name,
-                                           u_contract_price, u_execution_budget,
-                                           u_contractor_price, u_contractor, u_remarks)
-                            st.success(f"✅ 專案 ID {pid} 已更新！")
-                        else:
-                            st.error("請填寫必要欄位：年度 / 工地名稱 / 承攬項目")
-
-        # --- 刪除專案 ---
-        st.subheader("🗑️ 刪除專案")
-        with st.expander("刪除指定專案（可多筆）"):
-            st.write("輸入專案 ID（多筆以逗號分隔，如：1,3,5）")
-            del_input = st.text_input("專案 ID 清單")
-            if st.button("刪除專案"):
-                if del_input.strip():
-                    # 分割多個 ID
-                    id_list = [x.strip() for x in del_input.split(",") if x.strip().isdigit()]
-                    if id_list:
-                        delete_projects(id_list)
-                        st.warning(f"已刪除以下專案 ID：{', '.join(id_list)}")
-                    else:
-                        st.error("請輸入有效的專案 ID（數字），多筆以逗號分隔。")
-                else:
-                    st.error("請輸入要刪除的專案 ID")
-
-        # --- 匯入 / 匯出 Excel ---
-        st.subheader("📂 匯入 / 匯出 Excel")
-        col_ie1, col_ie2 = st.columns(2)
-        with col_ie1:
-            uploaded_file = st.file_uploader("選擇要匯入的 Excel 檔案（.xlsx）", type=["xlsx"])
-            if uploaded_file and st.button("匯入Excel"):
-                import_excel(uploaded_file)
-        with col_ie2:
-            excel_data = export_excel()
-            st.download_button(
-                label="匯出Excel",
-                data=excel_data,
-                file_name="projects_export.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+    # --- 分頁顯示 ---
+    p_col1, p_col2, p_col3, p_col4 = st.columns(4)
+    sort_by = p_col1.selectbox("排序欄位", list(COLUMN_LABELS),
+                               format_func=COLUMN_LABELS.get)
+    descending = p_col2.radio("排序方式", ["遞增", "遞減"], horizontal=True) == "遞減"
+    page_size = p_col3.selectbox("每頁筆數", PAGE_SIZE_OPTIONS, index=1)
+    filters = {k: v for k, v in active_query.items() if k != "rank"}
+    if live_result is not None:
+        total = len(live_result.ids)
+        # 即時查詢結果以索引版本識別 (同一版本、同一條件的 id 清單必定相同)
+        result_key = ("live", live_result.terms, live_result.generation)
+    else:
+        total = _session_cached("count", tuple(sorted(filters.items())),
+                                lambda: count_projects(**filters))
+        result_key = ("query", tuple(sorted(active_query.items())))
+    total_pages = max(1, -(-total // page_size))
+    if st.session_state.get("page_no", 1) > total_pages:
+        st.session_state["page_no"] = total_pages
+    page = p_col4.number_input("頁次", min_value=1, max_value=total_pages,
+                               step=1, key="page_no")
+
+    def load_page():
+        if live_result is not None:
+            return fetch_projects_by_ids(live_result.ids, sort_by=sort_by,
+                                         descending=descending, page=page,
+                                         page_size=page_size)
+        return fetch_projects_page(**active_query, sort_by=sort_by,
+                                   descending=descending, page=page,
+                                   page_size=page_size)
+    view_key = (result_key, sort_by, descending, page, page_size)
+    df_page = _session_cached("page", view_key, load_page)
+    if st.checkbox("表格編輯模式（直接修改、新增或刪除列，按「儲存變更」後一次寫入）",
+                   key="edit_mode"):
+        _project_editor(df_page, view_key)
+    else:
+        st.dataframe(df_page.rename(columns=COLUMN_LABELS), use_container_width=True)
+    _show_flash(RESULTS_FRAGMENT)
+    st.caption(f"共 {total} 筆，第 {page} / {total_pages} 頁")
+    if active_query:
+        st.button("顯示全部專案", on_click=_clear_query)
+
+
+@st.fragment(key=EDIT_FRAGMENT)
+def edit_projects_section():
+    """修改與刪除專案"""
+    st.subheader("✏️ 修改專案")
+    with st.expander("修改指定專案"):
+        st.write("請輸入要修改的專案 ID，並填寫更新後的資訊")
+        with st.form("update_form"):
+            st.text_input("專案 ID（僅能輸入單筆）", key="upd_pid")
+            col_u1, col_u2, col_u3 = st.columns(3)
+            col_u1.text_input("年度", key="upd_year")
+            col_u2.text_input("工地名稱", key="upd_site_name")
+            col_u3.text_input("承攬項目", key="upd_project_name")
+            col_u4, col_u5, col_u6 = st.columns(3)
+            col_u4.number_input("契約來價(未稅)", min_value=0.0, format="%.2f", key="upd_contract_price")
+            col_u5.number_input("執行預算(未稅)", min_value=0.0, format="%.2f", key="upd_execution_budget")
+            col_u6.number_input("廠商發包價(未稅)", min_value=0.0, format="%.2f", key="upd_contractor_price")
+            st.text_input("廠商", key="upd_contractor")
+            st.text_area("備註", key="upd_remarks")
+            st.form_submit_button("更新專案", on_click=_submit_update_project)
+
+    st.subheader("🗑️ 刪除專案")
+    with st.expander("刪除指定專案（可多筆）"):
+        st.write("輸入專案 ID（多筆以逗號分隔，如：1,3,5）")
+        st.text_input("專案 ID 清單", key="del_ids")
+        st.checkbox("快速刪除（先標記為已刪除，稍後於背景清除）", key="del_soft")
+        st.button("刪除專案", on_click=_submit_delete_projects)
+    _show_flash(EDIT_FRAGMENT)
+
+
+@st.fragment
+def import_export_section():
+    st.subheader("📂 匯入 / 匯出 Excel")
+    _show_flash("import")
+    col_ie1, col_ie2 = st.columns(2)
+    with col_ie1:
+        uploaded_file = st.file_uploader("選擇要匯入的檔案（.xlsx / .csv）", type=["xlsx", "csv"])
+        streaming = st.checkbox("串流匯入（大型檔案分批寫入，CSV 一律使用）")
+        if uploaded_file and st.button("匯入Excel"):
+            if streaming or uploaded_file.name.lower().endswith(".csv"):
+                result = import_streaming(uploaded_file)
+            else:
+                result = import_excel(uploaded_file)
+            if result is not None:
+                # 匯入需要在頁面上顯示進度，無法放在 callback 中；
+                # 完成後重新執行整頁，讓專案列表顯示新資料
+                _flash("import", "success", "匯入完成！成功：{}，失敗：{}".format(*result))
+                st.rerun()
+    with col_ie2:
+        # 活頁簿在按下下載時才產生 (依資料版本快取)，其他操作不會重新產生
+        st.download_button(
+            label="匯出Excel",
+            data=export_excel,
+            file_name="projects_export.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            on_click="ignore",
+        )
+
+
+@st.fragment
+def analysis_section():
+    st.write("使用下方按鈕進行圖表分析：")
+    col_a1, col_a2 = st.columns(2)
+    with col_a1:
+        if st.button("年度趨勢分析"):
+            analyze_yearly_trend()
+    with col_a2:
+        top_n = st.number_input("顯示前 N 大廠商（其餘合併為「其他」）",
+                                min_value=1, max_value=CONTRACTOR_TOP_N_MAX,
+                                value=CONTRACTOR_TOP_N, step=1)
+        if st.button("廠商與市場分佈分析"):
+            analyze_contractor_distribution(int(top_n))
+    if st.button("廠商承攬金額統計"):
+        show_contractor_summary()
+
+
+@st.fragment
+def perf_diagnostics_section():
+    render_perf_diagnostics()
+
+
+def main():
+    st.set_page_config(page_title="工程專案資料庫", layout="wide")
+    st.title("🏗️ 工程專案資料庫")
+
+    # 初始化資料庫 (每個程序一次)
+    ensure_db()
+
+    # 建立四個分頁 (專案管理 / 資料分析 / 效能診斷 / 關於)
+    tab1, tab2, tab_perf, tab3 = st.tabs(["專案管理", "資料分析", "效能診斷", "關於"])
+
+    # ============== 專案管理 ==============
+    with tab1:
+        st.subheader("🔨 專案管理")
+        add_project_section()
+        results_section()
+        edit_projects_section()
+        import_export_section()
 
     # ============== 資料分析 ==============
     with tab2:
         st.subheader("📊 資料分析")
-        st.write("使用下方按鈕進行圖表分析：")
-        col_a1, col_a2 = st.columns(2)
-        with col_a1:
-            if st.button("年度趨勢分析"):
-                analyze_yearly_trend()
-        with col_a2:
-            if st.button("廠商與市場分佈分析"):
-                analyze_contractor_distribution()
+        analysis_section()
+
+    # ============== 效能診斷 ==============
+    with tab_perf:
+        st.subheader("⏱️ 效能診斷")
+        perf_diagnostics_section()
 
     # ============== 關於 ==============
     with tab3:
@@ -0,0 +1,113 @@
+"""啟動時間量測：比較 app.py / PD-9.py 模組載入 (冷啟動) 所需時間。
+
+每次量測都啟動一個全新的 Python 直譯器：
+  - app.py：完整 import 模組 (不會執行 main())
+  - PD-9.py：只執行檔案最上層的 import 敘述 (不建立 Tk 視窗)
+
+用法：
+    python benchmarks/bench_import_time.py                 # 量測目前工作目錄中的版本
+    python benchmarks/bench_import_time.py --compare HEAD~1  # 同時量測指定 git 版本做比較
+    python benchmarks/bench_import_time.py --repeat 10 --json result.json
+"""
+import argparse
+import ast
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ["app.py", "PD-9.py"]
+
+
+def _top_level_imports(source):
+    """取出檔案最上層 (含 try 區塊內) 的 import 敘述原始碼"""
+    tree = ast.parse(source)
+    nodes = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            nodes.append(node)
+        elif isinstance(node, ast.Try):
+            nodes.extend(n for n in node.body if isinstance(n, (ast.Import, ast.ImportFrom)))
+    return "\n".join(ast.unparse(n) for n in nodes)
+
+
+def _measure_snippet(code, cwd, repeat):
+    """在全新直譯器中執行 code，回傳每次的耗時 (秒)"""
+    timer = (
+        "import time, logging\n"
+        "logging.disable(logging.WARNING)\n"
+        "_t = time.perf_counter()\n"
+        f"{code}\n"
+        "print(time.perf_counter() - _t)\n"
+    )
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", timer], cwd=cwd,
+                             capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def measure_tree(root, repeat):
+    """量測 root 目錄中兩個進入點的冷啟動時間"""
+    results = {}
+    for name in ENTRY_POINTS:
+        path = os.path.join(root, name)
+        if not os.path.exists(path):
+            continue
+        if name == "app.py":
+            code = "import app"
+        else:
+            with open(path, encoding="utf-8") as f:
+                code = _top_level_imports(f.read())
+        samples = _measure_snippet(code, root, repeat)
+        results[name] = {
+            "median_s": statistics.median(samples),
+            "min_s": min(samples),
+            "samples": samples,
+        }
+    return results
+
+
+def export_revision(rev, dest):
+    """將指定 git 版本的整個檔案樹輸出到 dest 目錄 (進入點會 import 同目錄的共用模組)"""
+    out = subprocess.run(["git", "archive", "--format=tar", rev], cwd=REPO_ROOT,
+                         capture_output=True, check=True)
+    with tarfile.open(fileobj=io.BytesIO(out.stdout)) as archive:
+        archive.extractall(dest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量測 app.py / PD-9.py 冷啟動 import 時間")
+    parser.add_argument("--repeat", type=int, default=5, help="每個進入點量測次數")
+    parser.add_argument("--compare", metavar="REV", help="同時量測指定 git 版本做比較")
+    parser.add_argument("--json", metavar="PATH", help="將結果寫入 JSON 檔")
+    args = parser.parse_args()
+
+    report = {"current": measure_tree(REPO_ROOT, args.repeat)}
+    if args.compare:
+        with tempfile.TemporaryDirectory() as tmp:
+            export_revision(args.compare, tmp)
+            report[args.compare] = measure_tree(tmp, args.repeat)
+
+    for label, results in report.items():
+        for name, r in results.items():
+            print(f"{label:>12}  {name:<8}  median {r['median_s'] * 1000:8.1f} ms"
+                  f"  min {r['min_s'] * 1000:8.1f} ms")
+    if args.compare:
+        for name, r in report["current"].items():
+            old = report[args.compare].get(name)
+            if old:
+                print(f"{name}: {old['median_s'] / r['median_s']:.2f}x faster than {args.compare}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""app.py 主要功能的效能量測 (不需啟動 Streamlit 介面)。
+
+對每個資料量 (--rows) 建立一個暫存資料庫並寫入假資料 (見 project_data.py)，
+再量測下列函式的執行時間與 Python 端記憶體高峰 (tracemalloc)：
+    add_project、query_projects、get_all_projects、update_project、delete_projects、
+    import_excel、export_excel、analyze_yearly_trend、analyze_contractor_distribution
+
+讀取類函式每次量測前都會清空查詢結果 / 圖表快取，量到的是實際查詢的成本。
+時間與記憶體分開量測 (tracemalloc 本身會拖慢執行)。
+
+用法：
+    python benchmarks/bench_projects.py                          # 預設 10000 筆
+    python benchmarks/bench_projects.py --rows 10000 100000 1000000 --json result.json
+    python benchmarks/bench_projects.py --baseline old.json      # 與先前的結果比較
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import project_data  # noqa: E402
+
+# 每個單筆寫入測試執行的次數
+WRITE_OPS = 100
+# 批次刪除測試的筆數
+DELETE_BATCH = 1000
+# 匯入測試的活頁簿筆數上限
+IMPORT_ROWS = 10000
+# 查詢測試使用的條件 (工地名稱走全文索引、短條件走 LIKE、關鍵字含廠商 / 備註)
+QUERIES = {
+    "site_fts": {"site": "青埔住宅"},
+    "site_like": {"site": "台中"},
+    "keyword": {"keyword": "營造有限公司"},
+    "year_and_project": {"year": "2020", "project": "機電工程"},
+}
+
+
+def _load_app(db_path):
+    """載入 app.py 並指向 db_path；切換資料庫時清除所有程序層級的資源 (連線池、快取)"""
+    logging.disable(logging.WARNING)
+    # 測試環境可能沒有中文字型，略過 matplotlib 的缺字警告
+    warnings.filterwarnings("ignore", category=UserWarning)
+    # 效能量測照常在記憶體中累計，但不寫結構化記錄檔
+    os.environ.setdefault("PROJECTS_PERF_LOG", "")
+    import app
+    app.st.cache_resource.clear()
+    app.DB_PATH = db_path
+    app.init_db()
+    return app
+
+
+def _clear_caches(app):
+    app._result_cache()["entries"].clear()
+    app._chart_cache()["entries"].clear()
+
+
+def _wait_for_compaction(app, timeout=60):
+    deadline = time.time() + timeout
+    while app._compaction_state()["running"] and time.time() < deadline:
+        time.sleep(0.05)
+
+
+def _measure(func, repeat):
+    """回傳 (每次耗時清單, 記憶體高峰 bytes)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return samples, peak
+
+
+def _summary(samples, peak, ops=1):
+    return {
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "per_op_s": statistics.median(samples) / ops,
+        "ops": ops,
+        "peak_bytes": peak,
+        "samples": samples,
+    }
+
+
+def _workbook_bytes(rows):
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=["年度", "工地名稱", "承攬項目", "契約來價(未稅)", "執行預算(未稅)",
+                                     "廠商發包價(未稅)", "廠商", "備註"])
+    output = io.BytesIO()
+    df.to_excel(output, index=False)
+    return output.getvalue()
+
+
+def bench_size(rows, repeat, seed):
+    """建立 rows 筆的暫存資料庫並量測所有函式"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "projects.db")
+        start = time.perf_counter()
+        project_data.populate(db_path, rows, seed)
+        results["populate"] = {"median_s": time.perf_counter() - start}
+        app = _load_app(db_path)
+        extra = project_data.generate_projects(WRITE_OPS, seed + 1)
+
+        def add_projects():
+            for row in extra:
+                app.add_project(*row)
+        results["add_project"] = _summary(*_measure(add_projects, repeat), ops=WRITE_OPS)
+
+        for name, query in QUERIES.items():
+            def run_query(query=query):
+                _clear_caches(app)
+                app.query_projects(**query)
+            results[f"query_projects[{name}]"] = _summary(*_measure(run_query, repeat))
+
+        def get_all():
+            _clear_caches(app)
+            app.get_all_projects()
+        results["get_all_projects"] = _summary(*_measure(get_all, repeat))
+
+        conn = sqlite3.connect(db_path)
+        ids = [r[0] for r in conn.execute(
+            "SELECT id FROM projects WHERE deleted_at IS NULL ORDER BY id LIMIT ?",
+            (WRITE_OPS + DELETE_BATCH * (repeat + 1) * 2,))]
+        conn.close()
+
+        update_ids = ids[:WRITE_OPS]
+
+        def update_projects():
+            for pid, row in zip(update_ids, extra):
+                app.update_project(pid, *row)
+        results["update_project"] = _summary(*_measure(update_projects, repeat), ops=WRITE_OPS)
+
+        # 每次刪除不同的一批 id
+        pending = ids[WRITE_OPS:]
+
+        def next_batch():
+            batch = pending[:DELETE_BATCH]
+            del pending[:DELETE_BATCH]
+            return batch
+
+        results["delete_projects"] = _summary(
+            *_measure(lambda: app.delete_projects(next_batch()), repeat), ops=DELETE_BATCH)
+        results["delete_projects[soft]"] = _summary(
+            *_measure(lambda: app.delete_projects(next_batch(), soft=True), repeat), ops=DELETE_BATCH)
+        _wait_for_compaction(app)
+
+        import_rows = min(rows, IMPORT_ROWS)
+        workbook = _workbook_bytes(project_data.generate_projects(import_rows, seed + 2))
+        results["import_excel"] = _summary(
+            *_measure(lambda: app.import_excel(io.BytesIO(workbook)), repeat), ops=import_rows)
+
+        def export():
+            _clear_caches(app)
+            app.export_excel()
+        results["export_excel"] = _summary(*_measure(export, repeat))
+
+        def yearly():
+            _clear_caches(app)
+            app.analyze_yearly_trend()
+        results["analyze_yearly_trend"] = _summary(*_measure(yearly, repeat))
+
+        def contractors():
+            _clear_caches(app)
+            app.analyze_contractor_distribution()
+        results["analyze_contractor_distribution"] = _summary(*_measure(contractors, repeat))
+
+        app.st.cache_resource.clear()
+    return results
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    for rows, results in report["results"].items():
+        print(f"== {rows} 筆 ==")
+        old = (baseline or {}).get("results", {}).get(rows, {})
+        for name, r in results.items():
+            line = f"  {name:<40} median {r['median_s'] * 1000:10.1f} ms"
+            if "peak_bytes" in r:
+                line += f"  peak {r['peak_bytes'] / 1024 / 1024:8.1f} MB"
+            if name in old:
+                line += f"  ({old[name]['median_s'] / r['median_s']:.2f}x vs baseline)"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量測 app.py 主要功能在不同資料量下的效能")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000],
+                        help="資料筆數，可指定多個 (例如 10000 100000 1000000)")
+    parser.add_argument("--repeat", type=int, default=3, help="每個項目量測次數")
+    parser.add_argument("--seed", type=int, default=project_data.DEFAULT_SEED, help="假資料亂數種子")
+    parser.add_argument("--json", metavar="PATH", help="將結果寫入 JSON 檔")
+    parser.add_argument("--baseline", metavar="PATH", help="與先前輸出的 JSON 結果比較")
+    args = parser.parse_args()
+
+    report = {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": {},
+    }
+    for rows in args.rows:
+        report["results"][str(rows)] = bench_size(rows, args.repeat, args.seed)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""查詢結果 DataFrame 的記憶體用量報告 (欄位型別政策與 Copy-on-Write 淺複製前後比較)。
+
+建立 --rows 筆 (預設 100000) 的暫存資料庫，分別在
+  - 調整前：保留 read_sql_query 原本的型別，快取結果每次回傳深複製
+  - 調整後：compact_dtypes() 的型別政策 (category / pyarrow 字串 / 顯示用 float32)，
+            pandas 支援 Copy-on-Write 時快取結果只淺複製
+兩種設定下列出：
+  - 各讀取函式回傳的 DataFrame 大小與欄位型別
+  - 程序共用的查詢結果快取中保存的大小 (所有 session 共用一份)
+  - 每個 session 實際多配置的記憶體：快取已有結果時再取得一次並保留
+    (tracemalloc 追蹤的 Python / NumPy 配置，加上 pyarrow 記憶體池)
+
+用法：
+    python benchmarks/memory_report.py
+    python benchmarks/memory_report.py --rows 100000 --sessions 50
+"""
+import argparse
+import gc
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+import warnings
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import project_data  # noqa: E402
+
+# 每個 session 會取得的資料：名稱 -> (函式名稱, 參數, 在查詢結果快取中的 key 開頭)
+SESSION_READS = {
+    "get_all_projects": ("get_all_projects", {}, "all"),
+    "query_projects[site]": ("query_projects", {"site": "台中"}, "query"),
+    "fetch_projects_page[200]": ("fetch_projects_page", {"page_size": 200}, "page"),
+}
+
+
+def _load_app(db_path):
+    logging.disable(logging.WARNING)
+    warnings.filterwarnings("ignore", category=UserWarning)
+    os.environ.setdefault("PROJECTS_PERF_LOG", "")
+    import app
+    app.st.cache_resource.clear()
+    app.DB_PATH = db_path
+    app.init_db()
+    return app
+
+
+def _arrow_allocated():
+    try:
+        import pyarrow
+    except ImportError:
+        return 0
+    return pyarrow.total_allocated_bytes()
+
+
+def _retained_bytes(func):
+    """呼叫 func() 並保留結果時多配置的記憶體 (bytes)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        arrow_before = _arrow_allocated()
+        result = func()
+        gc.collect()
+        traced = tracemalloc.get_traced_memory()[0]
+        arrow = _arrow_allocated() - arrow_before
+    finally:
+        tracemalloc.stop()
+    del result
+    return traced + arrow
+
+
+def measure(app, compact, copy_on_write):
+    """回傳 {讀取名稱: {"frame", "cached", "per_session", "dtypes"}}"""
+    app.COMPACT_DTYPES = compact
+    app.PANDAS_COPY_ON_WRITE = copy_on_write
+    app._result_cache()["entries"].clear()
+    results = {}
+    for name, (func_name, kwargs, key_prefix) in SESSION_READS.items():
+        func = getattr(app, func_name)
+        df = func(**kwargs)
+        # 快取中保存的結果 (所有 session 共用)
+        cached = next(entry[1] for key, entry in app._result_cache()["entries"].items()
+                      if key[0] == key_prefix)
+        results[name] = {
+            "frame": int(df.memory_usage(deep=True).sum()),
+            "cached": int(cached.memory_usage(deep=True).sum()),
+            "per_session": _retained_bytes(lambda: func(**kwargs)),
+            "dtypes": {column: str(dtype) for column, dtype in df.dtypes.items()},
+        }
+    return results
+
+
+def _mb(value):
+    return f"{value / 1024 / 1024:.2f} MB"
+
+
+def print_report(before, after, sessions):
+    total_before = total_after = 0
+    for name in SESSION_READS:
+        b, a = before[name], after[name]
+        print(f"== {name} ==")
+        for key, label in (("frame", "DataFrame 大小"), ("cached", "共用快取 (一份)"),
+                           ("per_session", "每個 session 多配置")):
+            print(f"  {label}：調整前 {_mb(b[key])} -> 調整後 {_mb(a[key])}")
+        for column, dtype in a["dtypes"].items():
+            if b["dtypes"].get(column) != dtype:
+                print(f"    {column}: {b['dtypes'][column]} -> {dtype}")
+        total_before += b["cached"] + b["per_session"] * sessions
+        total_after += a["cached"] + a["per_session"] * sessions
+    print(f"== 合計 (共用快取 + {sessions} 個 session 各取得上述資料並保留) ==")
+    print(f"  調整前 {_mb(total_before)} -> 調整後 {_mb(total_after)} "
+          f"({total_before / max(total_after, 1):.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查詢結果 DataFrame 的記憶體用量 (型別政策前後比較)")
+    parser.add_argument("--rows", type=int, default=100000, help="資料筆數")
+    parser.add_argument("--sessions", type=int, default=20, help="估算合計時的同時使用人數")
+    parser.add_argument("--seed", type=int, default=project_data.DEFAULT_SEED, help="假資料亂數種子")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "projects.db")
+        project_data.populate(db_path, args.rows, args.seed)
+        app = _load_app(db_path)
+        # 淺複製只在 pandas 支援 Copy-on-Write 時採用
+        copy_on_write = app.PANDAS_COPY_ON_WRITE
+        before = measure(app, compact=False, copy_on_write=False)
+        after = measure(app, compact=True, copy_on_write=copy_on_write)
+        app.st.cache_resource.clear()
+    print(f"== {args.rows} 筆 ==")
+    print_report(before, after, args.sessions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""效能測試用的 projects 假資料產生器 (固定亂數種子，結果可重現)。
+
+資料分佈盡量貼近實際使用情況：
+  - 工地名稱：縣市 + 地段 + 工程類型，例如「桃園青埔住宅新建工程」
+  - 承攬項目：常見的分包工項，例如「鋼筋工程」「機電工程」
+  - 廠商：數百家廠商，數量依 Zipf 分佈 (少數大廠承攬大部分專案)
+  - 金額：對數常態分佈；執行預算約為契約來價的 75%~95%
+"""
+import sqlite3
+
+import numpy as np
+
+DEFAULT_SEED = 20240101
+
+CITIES = ["台北", "新北", "桃園", "新竹", "台中", "彰化", "嘉義", "台南", "高雄", "屏東", "宜蘭", "花蓮"]
+DISTRICTS = ["信義", "板橋", "青埔", "竹北", "西屯", "員林", "太保", "安平", "左營", "潮州", "羅東", "吉安",
+             "中正", "三重", "中壢", "東區", "北屯", "鹿港", "民雄", "永康", "鳳山", "內湖", "林口", "南屯"]
+SITE_TYPES = ["住宅新建工程", "辦公大樓新建工程", "廠房新建工程", "社會住宅統包工程", "商場改建工程",
+              "醫院擴建工程", "學校校舍改建工程", "物流中心新建工程", "捷運站體工程", "污水處理廠工程"]
+TRADES = ["鋼筋工程", "模板工程", "混凝土工程", "機電工程", "空調工程", "消防工程", "給排水工程",
+          "帷幕牆工程", "鋁門窗工程", "油漆工程", "防水工程", "石材工程", "電梯工程", "景觀工程",
+          "土方工程", "基樁工程", "鋼構工程", "室內裝修工程", "弱電工程", "假設工程"]
+CONTRACTOR_PREFIXES = ["永信", "大成", "宏達", "長榮", "聯興", "建國", "日新", "華欣", "泰豐", "冠宇",
+                       "東昇", "鼎立", "富邦", "正隆", "國泰", "信義", "百勝", "德興", "恆春", "合眾"]
+CONTRACTOR_SUFFIXES = ["營造有限公司", "工程有限公司", "企業股份有限公司", "實業有限公司", "機電工程行"]
+REMARKS = ["", "", "", "", "追加減帳", "含保固三年", "分三期請款", "業主指定廠商", "已完成驗收", "變更設計中"]
+
+CONTRACTOR_COUNT = 300
+YEARS = list(range(2015, 2026))
+
+INSERT_SQL = """
+    INSERT INTO projects (year, site_name, project_name, contract_price,
+        execution_budget, contractor_price, contractor, remarks)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def contractor_names(count=CONTRACTOR_COUNT):
+    names = [f"{p}{s}" for s in CONTRACTOR_SUFFIXES for p in CONTRACTOR_PREFIXES]
+    # 前綴 x 後綴不夠時加上編號
+    i = 2
+    while len(names) < count:
+        names += [f"{p}{i}{s}" for s in CONTRACTOR_SUFFIXES for p in CONTRACTOR_PREFIXES]
+        i += 1
+    return names[:count]
+
+
+def generate_projects(n, seed=DEFAULT_SEED):
+    """產生 n 筆 (year, site_name, project_name, contract_price, execution_budget,
+    contractor_price, contractor, remarks)，與 INSERT_SQL 的欄位順序相同"""
+    rng = np.random.default_rng(seed)
+    contractors = np.array(contractor_names(), dtype=object)
+    # Zipf 權重：第 k 名廠商的機率與 1/k^1.1 成正比
+    weights = 1.0 / np.arange(1, len(contractors) + 1) ** 1.1
+    weights /= weights.sum()
+
+    years = rng.choice(YEARS, size=n)
+    sites = (np.array(CITIES, dtype=object)[rng.integers(len(CITIES), size=n)]
+             + np.array(DISTRICTS, dtype=object)[rng.integers(len(DISTRICTS), size=n)]
+             + np.array(SITE_TYPES, dtype=object)[rng.integers(len(SITE_TYPES), size=n)])
+    # 同一地段常有多期工程，加上期別讓工地名稱更分散
+    phases = rng.integers(1, 6, size=n)
+    sites = np.where(phases > 1, sites + np.char.mod("第%d期", phases).astype(object), sites)
+    trades = np.array(TRADES, dtype=object)[rng.integers(len(TRADES), size=n)]
+    contract = np.round(rng.lognormal(mean=15.5, sigma=1.0, size=n), 0)
+    budget = np.round(contract * rng.uniform(0.75, 0.95, size=n), 0)
+    contractor_price = np.round(budget * rng.uniform(0.85, 1.0, size=n), 0)
+    vendor = contractors[rng.choice(len(contractors), size=n, p=weights)]
+    remarks = np.array(REMARKS, dtype=object)[rng.integers(len(REMARKS), size=n)]
+    return list(zip(years.tolist(), sites.tolist(), trades.tolist(), contract.tolist(),
+                    budget.tolist(), contractor_price.tolist(), vendor.tolist(), remarks.tolist()))
+
+
+def populate(db_path, n, seed=DEFAULT_SEED, chunk_size=50000):
+    """在 db_path 建立最新結構的資料庫並寫入 n 筆假資料"""
+    import db_migrations
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        db_migrations.migrate(conn)
+        rows = generate_projects(n, seed)
+        for start in range(0, n, chunk_size):
+            conn.executemany(INSERT_SQL, rows[start:start + chunk_size])
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,292 @@
+"""多 session 同時讀寫的壓力測試 (模擬多位估算人員同時使用 app.py)。
+
+在同一個程序中啟動多個執行緒同時呼叫 app.py 的函式：
+  - 寫入執行緒：add_project / update_project / delete_projects (只改自己新增的資料)
+  - 匯入執行緒：反覆 import_excel 一份活頁簿
+  - 讀取執行緒：query_projects / fetch_projects_page / count_projects / live_search /
+    get_yearly_trend (欄式儲存)
+
+結束後檢查：
+  - 沒有任何呼叫失敗 (例如 database is locked)
+  - 資料筆數 = 原有 + 新增 - 刪除 + 匯入
+  - PRAGMA integrity_check、全文索引 integrity-check、年度彙總與 GROUP BY 一致
+  - 遞增更新後的欄式儲存與資料筆數一致
+
+並列出寫入 / 讀取延遲、匯入期間的讀取延遲與寫入佇列平均每個交易合併的寫入數。
+任一檢查失敗時結束代碼為 1。
+
+預設複製一份 projects.db 到暫存目錄再測試，不會改動原檔；--db 可直接指定資料庫。
+
+用法：
+    python benchmarks/stress_concurrency.py
+    python benchmarks/stress_concurrency.py --writers 16 --readers 16 --duration 30
+    python benchmarks/stress_concurrency.py --no-queue      # 不使用寫入佇列 (比較用)
+"""
+import argparse
+import io
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import project_data  # noqa: E402
+
+# 寫入執行緒的操作比例 (新增 / 修改 / 刪除)
+WRITE_MIX = {"add": 0.6, "update": 0.3, "delete": 0.1}
+# 查詢條件 (工地名稱走全文索引、短條件走 LIKE)
+READ_QUERIES = [{"site": "住宅新建"}, {"site": "台中"}, {"project": "機電工程"}, {"year": "202"}]
+# 匯入資料的備註，用來在結束後計算匯入筆數
+IMPORT_MARK = "stress-import"
+
+
+class Stats:
+    """各執行緒共用的計數與延遲紀錄"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = []
+        self.added = 0
+        self.deleted = 0
+        self.imports = 0
+        self.importing = threading.Event()
+
+    def record(self, op, seconds):
+        with self.lock:
+            self.latencies.setdefault(op, []).append(seconds)
+
+    def fail(self, op, error):
+        with self.lock:
+            self.errors.append(f"{op}: {type(error).__name__}: {error}")
+
+
+def _load_app(db_path, use_queue):
+    logging.disable(logging.WARNING)
+    warnings.filterwarnings("ignore", category=UserWarning)
+    os.environ.setdefault("PROJECTS_PERF_LOG", "")
+    import app
+    app.st.cache_resource.clear()
+    app.DB_PATH = db_path
+    app.DB_WRITE_QUEUE = use_queue
+    app.init_db()
+    return app
+
+
+def _timed(stats, op, func, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        stats.fail(op, e)
+        return None
+    elapsed = time.perf_counter() - start
+    stats.record(op, elapsed)
+    if op.startswith("read") and stats.importing.is_set():
+        stats.record("read (import running)", elapsed)
+    return result
+
+
+def writer(app, stats, deadline, seed):
+    rng = random.Random(seed)
+    rows = project_data.generate_projects(500, seed)
+    mine = []
+    ops, weights = zip(*WRITE_MIX.items())
+    while time.time() < deadline:
+        op = rng.choices(ops, weights)[0]
+        if op == "add" or not mine:
+            pid = _timed(stats, "write: add_project", app.add_project, *rng.choice(rows))
+            if pid is not None:
+                mine.append(pid)
+                with stats.lock:
+                    stats.added += 1
+        elif op == "update":
+            _timed(stats, "write: update_project", app.update_project,
+                   rng.choice(mine), *rng.choice(rows))
+        else:
+            pid = mine.pop(rng.randrange(len(mine)))
+            soft = rng.random() < 0.5
+            if _timed(stats, "write: delete_projects",
+                      lambda: app.delete_projects([pid], soft=soft) or True):
+                with stats.lock:
+                    stats.deleted += 1
+
+
+def importer(app, stats, deadline, rows, seed):
+    import pandas as pd
+
+    data = [row[:7] + (IMPORT_MARK,) for row in project_data.generate_projects(rows, seed)]
+    df = pd.DataFrame(data, columns=["年度", "工地名稱", "承攬項目", "契約來價(未稅)",
+                                     "執行預算(未稅)", "廠商發包價(未稅)", "廠商", "備註"])
+    output = io.BytesIO()
+    df.to_excel(output, index=False)
+    workbook = output.getvalue()
+    while time.time() < deadline:
+        stats.importing.set()
+        try:
+            # import_excel 以 st.error 回報錯誤，是否成功由結束後的匯入筆數檢查
+            _timed(stats, "write: import_excel", app.import_excel, io.BytesIO(workbook))
+        finally:
+            stats.importing.clear()
+        with stats.lock:
+            stats.imports += 1
+
+
+def reader(app, stats, deadline, seed):
+    rng = random.Random(seed)
+    while time.time() < deadline:
+        kind = rng.randrange(5)
+        query = rng.choice(READ_QUERIES)
+        if kind == 0:
+            _timed(stats, "read: query_projects", app.query_projects, **query)
+        elif kind == 1:
+            _timed(stats, "read: fetch_projects_page", app.fetch_projects_page,
+                   sort_by=rng.choice(["id", "year", "contract_price"]), page=rng.randint(1, 20))
+        elif kind == 2:
+            _timed(stats, "read: count_projects", app.count_projects, **query)
+        elif kind == 3:
+            _timed(stats, "read: live_search", app.live_search,
+                   query.get("year", ""), query.get("site", ""), query.get("project", ""))
+        else:
+            _timed(stats, "read: get_yearly_trend", app.get_yearly_trend)
+
+
+def _count(conn, where=""):
+    return conn.execute(f"SELECT COUNT(*) FROM projects WHERE deleted_at IS NULL {where}").fetchone()[0]
+
+
+def verify(db_path, expected_rows, expected_imported):
+    """回傳檢查失敗的訊息清單"""
+    problems = []
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = _count(conn)
+        if rows != expected_rows:
+            problems.append(f"資料筆數 {rows}，預期 {expected_rows}")
+        imported = _count(conn, f"AND remarks = '{IMPORT_MARK}'")
+        if imported != expected_imported:
+            problems.append(f"匯入筆數 {imported}，預期 {expected_imported}")
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            problems.append(f"integrity_check：{result}")
+        try:
+            conn.execute("INSERT INTO projects_fts(projects_fts, rank) VALUES ('integrity-check', 1)")
+            conn.commit()
+        except sqlite3.DatabaseError as e:
+            problems.append(f"全文索引不一致：{e}")
+        mismatch = conn.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT year, SUM(COALESCE(contract_price, 0)) AS total, COUNT(*) AS n
+                FROM projects WHERE deleted_at IS NULL GROUP BY year
+                EXCEPT
+                SELECT year, total_contract_price, project_count FROM yearly_summary
+                WHERE project_count > 0)
+        """).fetchone()[0]
+        if mismatch:
+            problems.append(f"年度彙總有 {mismatch} 個年度與 GROUP BY 不一致")
+    finally:
+        conn.close()
+    return problems
+
+
+def _copy_database(source, target):
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+def run(db_path, args):
+    app = _load_app(db_path, not args.no_queue)
+    conn = sqlite3.connect(db_path)
+    initial = _count(conn)
+    initial_imported = _count(conn, f"AND remarks = '{IMPORT_MARK}'")
+    conn.close()
+
+    stats = Stats()
+    deadline = time.time() + args.duration
+    threads = [threading.Thread(target=writer, args=(app, stats, deadline, args.seed + i))
+               for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(app, stats, deadline, args.seed + 100 + i))
+                for i in range(args.readers)]
+    if args.import_rows:
+        threads.append(threading.Thread(target=importer,
+                                        args=(app, stats, deadline, args.import_rows, args.seed)))
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    # 軟刪除的資料由背景清理，等清理結束再檢查
+    while app._compaction_state()["running"]:
+        time.sleep(0.05)
+
+    print(f"== {args.writers} 寫入 / {args.readers} 讀取 / "
+          f"{'1' if args.import_rows else '0'} 匯入執行緒，{elapsed:.1f} 秒，"
+          f"寫入佇列：{'否' if args.no_queue else '是'} ==")
+    for op, samples in sorted(stats.latencies.items()):
+        ms = np.array(samples) * 1000
+        print(f"  {op:<32} {len(ms):7d} 次  {len(ms) / elapsed:8.1f}/s  "
+              f"p50 {np.percentile(ms, 50):8.1f} ms  p99 {np.percentile(ms, 99):8.1f} ms  "
+              f"max {ms.max():8.1f} ms")
+    for row in app.perf.summary():
+        if row["op"] == "db.write_batch":
+            print(f"  每個交易平均合併 {row['rows'] / row['count']:.1f} 筆寫入 (共 {row['count']} 個交易)")
+        elif row["op"] == "db.busy_retry":
+            print(f"  資料庫忙碌重試 {row['count']} 次")
+
+    problems = [f"{len(stats.errors)} 次呼叫失敗，例如 {stats.errors[0]}"] if stats.errors else []
+    expected_imported = initial_imported + stats.imports * args.import_rows
+    expected_rows = initial + stats.added - stats.deleted + stats.imports * args.import_rows
+    problems += verify(db_path, expected_rows, expected_imported)
+    stored = int(app.get_yearly_trend()["project_count"].sum())
+    if stored != expected_rows:
+        problems.append(f"欄式儲存筆數 {stored}，預期 {expected_rows}")
+    app.st.cache_resource.clear()
+    for problem in problems:
+        print(f"  失敗：{problem}")
+    if not problems:
+        print("  檢查通過")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多執行緒同時讀寫 projects.db 的壓力測試")
+    parser.add_argument("--db", metavar="PATH",
+                        help="直接對此資料庫測試 (預設複製一份 projects.db 到暫存目錄)")
+    parser.add_argument("--writers", type=int, default=8, help="寫入執行緒數")
+    parser.add_argument("--readers", type=int, default=8, help="讀取執行緒數")
+    parser.add_argument("--duration", type=float, default=10, help="測試秒數")
+    parser.add_argument("--import-rows", type=int, default=5000,
+                        help="匯入執行緒每次匯入的筆數 (0 表示不匯入)")
+    parser.add_argument("--seed", type=int, default=project_data.DEFAULT_SEED, help="亂數種子")
+    parser.add_argument("--no-queue", action="store_true",
+                        help="不使用寫入佇列，各執行緒直接寫入 (比較用)")
+    args = parser.parse_args()
+
+    if args.db:
+        ok = run(args.db, args)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "projects.db")
+            _copy_database(os.path.join(REPO_ROOT, "projects.db"), db_path)
+            ok = run(db_path, args)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
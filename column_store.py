@@ -0,0 +1,168 @@
+"""分析功能使用的記憶體內欄式儲存 (app.py 使用)。
+
+分析不必每次都從 SQLite 讀出整張表再建立 DataFrame：每個欄位各存成一個 NumPy 陣列，
+  - 四個金額欄位為 float64 (NULL 視為 0，與 yearly_summary 的 COALESCE / TOTAL 相同)
+  - 年度、工地名稱、廠商以字典編碼存成 int32 代碼 (同一個值只存一份字串)
+  - id -> 列號的對照表，修改與刪除時直接找到該列
+
+分組彙總 (各年度契約來價合計、各廠商專案數…) 即為對代碼做 np.bincount，
+不需建立 DataFrame 或逐筆比對字串。
+
+新增、修改時以 upsert、刪除時以 remove 遞增更新：刪除的列由最後一列搬入補位，
+陣列前 len(store) 筆永遠都是有效資料，彙總時不需另外過濾。
+"""
+import sys
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+# 以字典編碼儲存、可作為分組依據的欄位
+GROUP_COLUMNS = ("year", "site_name", "contractor")
+# 以 float64 儲存、可加總的欄位
+VALUE_COLUMNS = ("contract_price", "execution_budget", "contractor_price", "indirect_cost")
+# 陣列的初始容量；空間不足時加倍
+INITIAL_CAPACITY = 1024
+
+# 建立 / 更新儲存用的資料 (不含已標記刪除的列)，欄位順序為 id、GROUP_COLUMNS、VALUE_COLUMNS；
+# NOT INDEXED 的原因同 search_index.INDEX_SOURCE_SQL
+STORE_SOURCE_SQL = (f"SELECT id, {', '.join(GROUP_COLUMNS + VALUE_COLUMNS)} FROM projects "
+                    "NOT INDEXED WHERE deleted_at IS NULL")
+
+
+class GroupTotals(NamedTuple):
+    labels: list        # 分組欄位的值 (依代碼順序，只含至少一筆資料的組)
+    counts: np.ndarray  # 各組筆數
+    sums: dict          # 欄位 -> 各組合計
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _floats(values):
+    """轉成 float64 陣列；NULL 與無法轉換的文字 (舊資料) 視為 0"""
+    try:
+        array = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        array = np.fromiter((_to_float(v) for v in values), dtype=np.float64, count=len(values))
+    return np.nan_to_num(array, nan=0.0, copy=False)
+
+
+class _Dictionary:
+    """值 <-> int32 代碼；代碼只增不減，已無資料使用的值彙總時筆數為 0 而被略過"""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def encode(self, values):
+        codes = self._codes
+        for value in set(values) - codes.keys():
+            codes[value] = len(self.values)
+            self.values.append(value)
+        return np.fromiter(map(codes.__getitem__, values), dtype=np.int32, count=len(values))
+
+
+class ColumnStore:
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self._size = 0
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._codes = {column: np.empty(capacity, dtype=np.int32) for column in GROUP_COLUMNS}
+        self._values = {column: np.empty(capacity, dtype=np.float64) for column in VALUE_COLUMNS}
+        self._dictionaries = {column: _Dictionary() for column in GROUP_COLUMNS}
+        self._rows = {}     # id -> 列號
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_rows(cls, rows):
+        """rows 為與 STORE_SOURCE_SQL 欄位順序相同的 tuple 清單"""
+        rows = list(rows)
+        store = cls(max(len(rows), INITIAL_CAPACITY))
+        store.upsert(rows)
+        return store
+
+    @classmethod
+    def from_connection(cls, conn):
+        return cls.from_rows(conn.execute(STORE_SOURCE_SQL).fetchall())
+
+    def __len__(self):
+        return self._size
+
+    def _arrays(self):
+        return [self._ids, *self._codes.values(), *self._values.values()]
+
+    def nbytes(self):
+        """陣列與字典中的值佔用的記憶體 (bytes，不含 id 對照表)"""
+        total = sum(array.nbytes for array in self._arrays())
+        for dictionary in self._dictionaries.values():
+            total += sum(sys.getsizeof(value) for value in dictionary.values)
+        return total
+
+    def upsert(self, rows):
+        """新增或整列覆蓋 (修改)；rows 的欄位順序與 STORE_SOURCE_SQL 相同，id 不可重複"""
+        rows = list(rows)
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        with self._lock:
+            ids = np.array(columns[0], dtype=np.int64)
+            positions = np.array([self._rows.get(pid, -1) for pid in columns[0]], dtype=np.int64)
+            new = np.flatnonzero(positions < 0)
+            if len(new):
+                # 新的 id 依序接在最後面
+                while self._size + len(new) > len(self._ids):
+                    self._grow()
+                positions[new] = np.arange(self._size, self._size + len(new))
+                self._rows.update(zip(ids[new].tolist(), positions[new].tolist()))
+                self._size += len(new)
+            self._ids[positions] = ids
+            for column, values in zip(GROUP_COLUMNS, columns[1:]):
+                self._codes[column][positions] = self._dictionaries[column].encode(values)
+            for column, values in zip(VALUE_COLUMNS, columns[1 + len(GROUP_COLUMNS):]):
+                self._values[column][positions] = _floats(values)
+
+    def remove(self, ids):
+        with self._lock:
+            for pid in ids:
+                position = self._rows.pop(pid, None)
+                if position is None:
+                    continue
+                last = self._size - 1
+                if position != last:
+                    # 最後一列搬到被刪除的位置
+                    for array in self._arrays():
+                        array[position] = array[last]
+                    self._rows[int(self._ids[position])] = position
+                self._size = last
+
+    def _grow(self):
+        capacity = len(self._ids) * 2
+
+        def grown(array):
+            result = np.empty(capacity, dtype=array.dtype)
+            result[:self._size] = array[:self._size]
+            return result
+
+        self._ids = grown(self._ids)
+        self._codes = {column: grown(array) for column, array in self._codes.items()}
+        self._values = {column: grown(array) for column, array in self._values.items()}
+
+    def group_totals(self, by, columns=()):
+        """依 by (GROUP_COLUMNS 之一) 分組，回傳各組筆數與 columns 的合計"""
+        if by not in GROUP_COLUMNS:
+            raise ValueError(f"不支援的分組欄位：{by}")
+        with self._lock:
+            codes = self._codes[by][:self._size]
+            labels = self._dictionaries[by].values
+            size = len(labels)
+            counts = np.bincount(codes, minlength=size)
+            sums = {column: np.bincount(codes, weights=self._values[column][:self._size],
+                                        minlength=size)
+                    for column in columns}
+            present = np.flatnonzero(counts)
+            labels = [labels[code] for code in present]
+        return GroupTotals(labels, counts[present], {c: s[present] for c, s in sums.items()})
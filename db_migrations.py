@@ -0,0 +1,263 @@
+"""projects.db 結構版本管理 (app.py 與 PD-9.py 共用)。
+
+資料庫目前的結構版本記錄在 PRAGMA user_version。MIGRATIONS 依序列出每一版的
+SQL，第 N 筆執行完畢後 user_version 即為 N；migrate() 只會執行尚未套用的版本，
+因此既有的 projects.db 會原地升級，全新的資料庫則從第 1 版一路建立。
+
+新增結構變更時，請在 MIGRATIONS 最後面加上新的一筆，不要修改已發布的版本。
+"""
+import sqlite3
+
+# 全文檢索索引的同步觸發器 (trigram 分詞，external content 指向 projects)
+SEARCH_TRIGGERS_SQL = """
+    CREATE TRIGGER IF NOT EXISTS projects_fts_ai AFTER INSERT ON projects BEGIN
+        INSERT INTO projects_fts(rowid, site_name, project_name, contractor, remarks)
+        VALUES (new.id, new.site_name, new.project_name, new.contractor, new.remarks);
+    END;
+    CREATE TRIGGER IF NOT EXISTS projects_fts_ad AFTER DELETE ON projects BEGIN
+        INSERT INTO projects_fts(projects_fts, rowid, site_name, project_name, contractor, remarks)
+        VALUES ('delete', old.id, old.site_name, old.project_name, old.contractor, old.remarks);
+    END;
+    CREATE TRIGGER IF NOT EXISTS projects_fts_au AFTER UPDATE ON projects BEGIN
+        INSERT INTO projects_fts(projects_fts, rowid, site_name, project_name, contractor, remarks)
+        VALUES ('delete', old.id, old.site_name, old.project_name, old.contractor, old.remarks);
+        INSERT INTO projects_fts(rowid, site_name, project_name, contractor, remarks)
+        VALUES (new.id, new.site_name, new.project_name, new.contractor, new.remarks);
+    END;
+"""
+
+# 年度彙總表的遞增維護觸發器
+YEARLY_SUMMARY_TRIGGERS_SQL = """
+    CREATE TRIGGER IF NOT EXISTS yearly_summary_ai AFTER INSERT ON projects BEGIN
+        INSERT INTO yearly_summary(year, total_contract_price, project_count)
+        VALUES (new.year, COALESCE(new.contract_price, 0), 1)
+        ON CONFLICT(year) DO UPDATE SET
+            total_contract_price = total_contract_price + excluded.total_contract_price,
+            project_count = project_count + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS yearly_summary_ad AFTER DELETE ON projects BEGIN
+        UPDATE yearly_summary
+        SET total_contract_price = total_contract_price - COALESCE(old.contract_price, 0),
+            project_count = project_count - 1
+        WHERE year = old.year;
+        DELETE FROM yearly_summary WHERE year = old.year AND project_count <= 0;
+    END;
+    CREATE TRIGGER IF NOT EXISTS yearly_summary_au AFTER UPDATE OF year, contract_price ON projects BEGIN
+        UPDATE yearly_summary
+        SET total_contract_price = total_contract_price - COALESCE(old.contract_price, 0),
+            project_count = project_count - 1
+        WHERE year = old.year;
+        DELETE FROM yearly_summary WHERE year = old.year AND project_count <= 0;
+        INSERT INTO yearly_summary(year, total_contract_price, project_count)
+        VALUES (new.year, COALESCE(new.contract_price, 0), 1)
+        ON CONFLICT(year) DO UPDATE SET
+            total_contract_price = total_contract_price + excluded.total_contract_price,
+            project_count = project_count + 1;
+    END;
+"""
+
+# 以 GROUP BY 重新計算年度彙總
+YEARLY_SUMMARY_REBUILD_SQL = """
+    DELETE FROM yearly_summary;
+    INSERT INTO yearly_summary(year, total_contract_price, project_count)
+    SELECT year, TOTAL(contract_price), COUNT(*) FROM projects GROUP BY year;
+"""
+
+MIGRATIONS = [
+    # 1. 原始的 projects 資料表
+    """
+    CREATE TABLE IF NOT EXISTS projects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        year TEXT NOT NULL,
+        site_name TEXT NOT NULL,
+        project_name TEXT NOT NULL,
+        contract_price REAL DEFAULT 0,
+        execution_budget REAL DEFAULT 0,
+        contractor_price REAL DEFAULT 0,
+        indirect_cost REAL DEFAULT 0,
+        contractor TEXT,
+        remarks TEXT
+    );
+    """,
+    # 2. 全文檢索索引 (工地名稱、承攬項目、廠商、備註)
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS projects_fts USING fts5(
+        site_name, project_name, contractor, remarks,
+        content='projects', content_rowid='id', tokenize='trigram'
+    );
+    """ + SEARCH_TRIGGERS_SQL + """
+    INSERT INTO projects_fts(projects_fts) VALUES ('rebuild');
+    """,
+    # 3. 年度彙總表
+    """
+    CREATE INDEX IF NOT EXISTS idx_projects_year ON projects(year, contract_price);
+    CREATE TABLE IF NOT EXISTS yearly_summary (
+        year TEXT PRIMARY KEY,
+        total_contract_price REAL NOT NULL DEFAULT 0,
+        project_count INTEGER NOT NULL DEFAULT 0
+    );
+    """ + YEARLY_SUMMARY_TRIGGERS_SQL + YEARLY_SUMMARY_REBUILD_SQL,
+    # 4. 欄位型別與索引：
+    #    - year 改為 INTEGER 親和性：'2023'、'2023.0' 會存成整數 2023，
+    #      無法轉成整數的原始文字 (例如 '112年度') 則原樣保留為文字
+    #    - indirect_cost 改為 contract_price - execution_budget 的生成欄位，
+    #      位置不變，SELECT * 的欄位順序與舊版相同
+    #    - 舊資料中與計算結果不同的管銷 (手動調整或匯入的數值) 保留在最後新增的
+    #      indirect_cost_override，生成欄位優先採用；之後修改契約來價或執行預算時
+    #      由觸發器清除，與舊版更新時重新計算管銷相同
+    #    - 新增 year、contractor、(year, contractor) 索引
+    #    SQLite 無法直接修改欄位型別，因此重建資料表並保留 id 與 AUTOINCREMENT 計數
+    """
+    ALTER TABLE projects RENAME TO projects_old;
+    CREATE TABLE projects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        year INTEGER NOT NULL,
+        site_name TEXT NOT NULL,
+        project_name TEXT NOT NULL,
+        contract_price REAL DEFAULT 0,
+        execution_budget REAL DEFAULT 0,
+        contractor_price REAL DEFAULT 0,
+        indirect_cost REAL GENERATED ALWAYS AS
+            (COALESCE(indirect_cost_override, contract_price - execution_budget)) VIRTUAL,
+        contractor TEXT,
+        remarks TEXT,
+        indirect_cost_override REAL
+    );
+    INSERT INTO projects (id, year, site_name, project_name, contract_price,
+                          execution_budget, contractor_price, contractor, remarks,
+                          indirect_cost_override)
+    SELECT id, trim(year), site_name, project_name, contract_price,
+           execution_budget, contractor_price, contractor, remarks,
+           CASE WHEN typeof(indirect_cost) IN ('integer', 'real')
+                 AND indirect_cost IS NOT contract_price - execution_budget
+                THEN indirect_cost END
+    FROM projects_old;
+    UPDATE sqlite_sequence
+    SET seq = MAX(seq, (SELECT seq FROM sqlite_sequence WHERE name = 'projects_old'))
+    WHERE name = 'projects';
+    INSERT INTO sqlite_sequence(name, seq)
+    SELECT 'projects', seq FROM sqlite_sequence
+    WHERE name = 'projects_old'
+      AND NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'projects');
+    DROP TABLE projects_old;
+
+    DROP TABLE yearly_summary;
+    CREATE TABLE yearly_summary (
+        year INTEGER NOT NULL UNIQUE,
+        total_contract_price REAL NOT NULL DEFAULT 0,
+        project_count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX idx_projects_year ON projects(year, contract_price);
+    CREATE INDEX idx_projects_contractor ON projects(contractor);
+    CREATE INDEX idx_projects_year_contractor ON projects(year, contractor);
+    CREATE TRIGGER indirect_cost_override_au
+    AFTER UPDATE OF contract_price, execution_budget ON projects
+    WHEN new.indirect_cost_override IS NOT NULL BEGIN
+        UPDATE projects SET indirect_cost_override = NULL WHERE id = new.id;
+    END;
+    """ + SEARCH_TRIGGERS_SQL + YEARLY_SUMMARY_TRIGGERS_SQL + YEARLY_SUMMARY_REBUILD_SQL + """
+    INSERT INTO projects_fts(projects_fts) VALUES ('rebuild');
+    """,
+    # 5. 軟刪除：deleted_at 不為 NULL 的列視為已刪除，稍後由背景清理真正刪除
+    #    - 年度彙總觸發器改為只計算未刪除的列
+    #    - 全文檢索觸發器只在文字欄位變更時更新 (標記刪除不需重建索引)，
+    #      查詢時再以 deleted_at IS NULL 過濾
+    #    - year / contractor 索引改為只含未刪除列的部分索引
+    """
+    ALTER TABLE projects ADD COLUMN deleted_at TEXT;
+    CREATE INDEX idx_projects_deleted ON projects(deleted_at) WHERE deleted_at IS NOT NULL;
+
+    DROP INDEX idx_projects_year;
+    DROP INDEX idx_projects_contractor;
+    DROP INDEX idx_projects_year_contractor;
+    CREATE INDEX idx_projects_year ON projects(year, contract_price) WHERE deleted_at IS NULL;
+    CREATE INDEX idx_projects_contractor ON projects(contractor) WHERE deleted_at IS NULL;
+    CREATE INDEX idx_projects_year_contractor ON projects(year, contractor) WHERE deleted_at IS NULL;
+
+    DROP TRIGGER projects_fts_au;
+    CREATE TRIGGER projects_fts_au
+    AFTER UPDATE OF site_name, project_name, contractor, remarks ON projects BEGIN
+        INSERT INTO projects_fts(projects_fts, rowid, site_name, project_name, contractor, remarks)
+        VALUES ('delete', old.id, old.site_name, old.project_name, old.contractor, old.remarks);
+        INSERT INTO projects_fts(rowid, site_name, project_name, contractor, remarks)
+        VALUES (new.id, new.site_name, new.project_name, new.contractor, new.remarks);
+    END;
+
+    DROP TRIGGER yearly_summary_ai;
+    DROP TRIGGER yearly_summary_ad;
+    DROP TRIGGER yearly_summary_au;
+    CREATE TRIGGER yearly_summary_ai AFTER INSERT ON projects
+    WHEN new.deleted_at IS NULL BEGIN
+        INSERT INTO yearly_summary(year, total_contract_price, project_count)
+        VALUES (new.year, COALESCE(new.contract_price, 0), 1)
+        ON CONFLICT(year) DO UPDATE SET
+            total_contract_price = total_contract_price + excluded.total_contract_price,
+            project_count = project_count + 1;
+    END;
+    CREATE TRIGGER yearly_summary_ad AFTER DELETE ON projects
+    WHEN old.deleted_at IS NULL BEGIN
+        UPDATE yearly_summary
+        SET total_contract_price = total_contract_price - COALESCE(old.contract_price, 0),
+            project_count = project_count - 1
+        WHERE year = old.year;
+        DELETE FROM yearly_summary WHERE year = old.year AND project_count <= 0;
+    END;
+    CREATE TRIGGER yearly_summary_au
+    AFTER UPDATE OF year, contract_price, deleted_at ON projects BEGIN
+        UPDATE yearly_summary
+        SET total_contract_price = total_contract_price - COALESCE(old.contract_price, 0),
+            project_count = project_count - 1
+        WHERE year = old.year AND old.deleted_at IS NULL;
+        DELETE FROM yearly_summary WHERE year = old.year AND project_count <= 0;
+        INSERT INTO yearly_summary(year, total_contract_price, project_count)
+        SELECT new.year, COALESCE(new.contract_price, 0), 1
+        WHERE new.deleted_at IS NULL
+        ON CONFLICT(year) DO UPDATE SET
+            total_contract_price = total_contract_price + excluded.total_contract_price,
+            project_count = project_count + 1;
+    END;
+    """,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def _split_statements(script):
+    """將多段 SQL 拆成單一敘述 (可正確處理 CREATE TRIGGER ... END;)"""
+    statements = []
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            statements.append(buf.strip())
+            buf = ""
+    if buf.strip():
+        statements.append(buf.strip())
+    return statements
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """將資料庫升級到最新版本，可重複呼叫。
+
+    每個版本在各自的 BEGIN IMMEDIATE 交易中執行並更新 user_version；
+    取得寫入鎖後會再檢查一次版本，多個程式同時啟動時也只會套用一次。
+    """
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return
+    for version, script in enumerate(MIGRATIONS, start=1):
+        if get_schema_version(conn) >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) < version:
+                for statement in _split_statements(script):
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
@@ -0,0 +1,198 @@
+"""輕量的效能量測 (app.py 使用)。
+
+在資料庫查詢、DataFrame 建立、Excel 讀寫、圖表繪製與快取存取外面包一層 span：
+
+    with recorder.span("db.query_projects", sql, params) as span:
+        df = pd.read_sql_query(sql, conn, params=params)
+        span.rows = len(df)
+
+每個 span 記下耗時、筆數、bytes、快取命中與否與 SQL，
+保留在記憶體中供「效能診斷」分頁計算百分位數，並可寫入結構化記錄檔
+(每行一個 JSON 事件)，方便以外部工具擷取分析。
+
+停用時 span() 直接回傳一個什麼都不做的共用物件，不計時、不配置記憶體。
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import numpy as np
+
+# 保留最近的事件數 (找出最慢的查詢用)
+RECENT_EVENTS = 2000
+# 每種操作保留最近幾次的耗時來計算百分位數
+SAMPLES_PER_OP = 1000
+# 記錄檔輪替：單檔大小上限與保留的舊檔數
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+PERCENTILES = (50, 90, 99)
+# 超過此長度的字串參數 (例如 json_each 的 id 清單) 不保留，EXPLAIN 時以 NULL 代入
+PARAM_MAX_LENGTH = 1000
+
+# 記錄檔路徑 -> 事件佇列；同一路徑在程序中只有一個寫檔執行緒
+_log_queues = {}
+_log_queues_lock = threading.Lock()
+
+
+class Span:
+    """一次量測；離開 with 區塊時計算耗時並交給 Recorder 記錄"""
+    __slots__ = ("_recorder", "_start", "op", "sql", "params", "rows", "bytes",
+                 "cache", "error", "ts", "ms")
+
+    def __init__(self, recorder, op, sql=None, params=None):
+        self._recorder = recorder
+        self.op = op
+        self.sql = sql
+        self.params = params
+        self.rows = None
+        self.bytes = None
+        self.cache = None       # "hit" / "miss"
+        self.error = None
+        self.ts = None
+        self.ms = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.ms = (time.perf_counter() - self._start) * 1000
+        self.ts = time.time()
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self._recorder._finish(self)
+        return False
+
+    def to_dict(self):
+        """記錄檔使用的欄位 (省略空值)"""
+        event = {"ts": datetime.fromtimestamp(self.ts).isoformat(timespec="milliseconds"),
+                 "op": self.op, "ms": round(self.ms, 3)}
+        for name in ("rows", "bytes", "cache", "error", "sql"):
+            value = getattr(self, name)
+            if value is not None:
+                event[name] = value
+        return event
+
+
+class _NullSpan:
+    """停用時使用：進出 with 與設定屬性都不做任何事"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Recorder:
+    def __init__(self, log_path=None, enabled=True):
+        self.enabled = enabled
+        self.log_path = os.path.abspath(log_path) if log_path else None
+        self._lock = threading.Lock()
+        self._log_queue = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._recent = deque(maxlen=RECENT_EVENTS)
+            self._samples = defaultdict(lambda: deque(maxlen=SAMPLES_PER_OP))
+            # 操作 -> 累計值 (次數、筆數、bytes、快取命中 / 未命中、錯誤)
+            self._totals = defaultdict(lambda: dict.fromkeys(
+                ("count", "rows", "bytes", "hits", "misses", "errors"), 0))
+
+    def span(self, op, sql=None, params=None):
+        if not self.enabled:
+            return NULL_SPAN
+        if params:
+            params = tuple(None if isinstance(p, str) and len(p) > PARAM_MAX_LENGTH else p
+                           for p in params)
+        return Span(self, op, sql, params)
+
+    def _finish(self, span):
+        with self._lock:
+            self._recent.append(span)
+            self._samples[span.op].append(span.ms)
+            totals = self._totals[span.op]
+            totals["count"] += 1
+            totals["rows"] += span.rows or 0
+            totals["bytes"] += span.bytes or 0
+            if span.cache == "hit":
+                totals["hits"] += 1
+            elif span.cache == "miss":
+                totals["misses"] += 1
+            if span.error:
+                totals["errors"] += 1
+        if self.log_path:
+            if self._log_queue is None:
+                self._log_queue = _log_queue(self.log_path)
+            self._log_queue.put(span)
+
+    def summary(self):
+        """每種操作一筆：次數、耗時百分位數與最大值 (毫秒)、筆數 / bytes 合計、快取命中率"""
+        with self._lock:
+            items = [(op, np.fromiter(samples, dtype=float), dict(self._totals[op]))
+                     for op, samples in self._samples.items()]
+        result = []
+        for op, ms, totals in sorted(items):
+            row = {"op": op, "count": totals["count"]}
+            for p, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+                row[f"p{p}_ms"] = float(value)
+            row["max_ms"] = float(ms.max())
+            row["rows"] = totals["rows"]
+            row["bytes"] = totals["bytes"]
+            lookups = totals["hits"] + totals["misses"]
+            row["hit_ratio"] = totals["hits"] / lookups if lookups else None
+            row["errors"] = totals["errors"]
+            result.append(row)
+        return result
+
+    def slowest(self, n=20, sql_only=True):
+        """最近的事件中耗時最長的 n 筆 (預設只取有 SQL 的查詢)"""
+        with self._lock:
+            events = [s for s in self._recent if s.sql or not sql_only]
+        return sorted(events, key=lambda s: s.ms, reverse=True)[:n]
+
+
+def _log_queue(path):
+    """第一次寫入時才建立記錄檔與寫檔執行緒；量測點只需把事件放進佇列"""
+    with _log_queues_lock:
+        events = _log_queues.get(path)
+        if events is None:
+            events = _log_queues[path] = queue.SimpleQueue()
+            threading.Thread(target=_write_log, args=(path, events),
+                             name="perf-log", daemon=True).start()
+        return events
+
+
+def _write_log(path, events):
+    handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES,
+                                  backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    while True:
+        span = events.get()
+        line = json.dumps(span.to_dict(), ensure_ascii=False)
+        handler.emit(logging.makeLogRecord({"msg": line}))
+
+
+def explain_query_plan(conn, sql, params=()):
+    """以 EXPLAIN QUERY PLAN 取得查詢計畫，依父子關係縮排成文字"""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return "\n".join(lines)
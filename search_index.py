@@ -0,0 +1,139 @@
+"""年度 / 工地名稱 / 承攬項目的記憶體內搜尋索引 (app.py 與 PD-9.py 共用)。
+
+即時查詢時不必每次都回到 SQLite：每個欄位保留 id -> 正規化文字，
+並以 trigram (連續 3 個字) 建立反向索引 (各欄位第一次用到時才建立)。
+比對規則與 SQL 的 LIKE '%詞%' 相同 (包含子字串即符合，英文不分大小寫)：
+  - 3 個字以上的條件先取各 trigram 的 id 交集作為候選，再逐筆確認子字串
+  - 較短的條件直接在候選 (或全部資料) 中比對子字串
+  - 若新條件只是把上一次的條件加長 (每個欄位都包含舊條件)，
+    結果必定是上一次結果的子集合，只需在上一次的結果中篩選
+
+新增、修改、刪除時以 add / update / remove 遞增更新，不需重建整個索引。
+"""
+import itertools
+import threading
+from typing import NamedTuple
+
+FIELDS = ("year", "site_name", "project_name")
+GRAM_SIZE = 3
+
+# 所有索引共用的版本計數器：重建索引後，舊索引的查詢結果也不會被誤用
+_generations = itertools.count(1)
+
+# 建立索引用的資料 (不含已標記刪除的列)；NOT INDEXED 讓全表讀取依 rowid 掃描，
+# 不會改走 WHERE deleted_at IS NULL 的部分索引 (較慢)，加上 id IN (...) 時仍以主鍵查找
+INDEX_SOURCE_SQL = ("SELECT id, year, site_name, project_name FROM projects NOT INDEXED "
+                    "WHERE deleted_at IS NULL")
+
+
+class SearchResult(NamedTuple):
+    terms: tuple        # 正規化後的 (年度, 工地名稱, 承攬項目) 條件
+    ids: tuple          # 符合的 id (遞增排序)
+    generation: int     # 查詢當時的索引版本；索引變更後不能再拿來縮小範圍
+
+
+def normalize(value):
+    return "" if value is None else str(value).strip().casefold()
+
+
+def _grams(text):
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class SearchIndex:
+    def __init__(self):
+        self._texts = {field: {} for field in FIELDS}
+        # 欄位 -> {trigram: id 集合}；None 表示尚未建立
+        self._postings = {field: None for field in FIELDS}
+        self._lock = threading.Lock()
+        self.generation = next(_generations)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """rows 為 (id, year, site_name, project_name) 的可迭代物件"""
+        index = cls()
+        for pid, *values in rows:
+            index._add(pid, values)
+        return index
+
+    @classmethod
+    def from_connection(cls, conn):
+        return cls.from_rows(conn.execute(INDEX_SOURCE_SQL))
+
+    def __len__(self):
+        return len(self._texts[FIELDS[0]])
+
+    def add(self, pid, year, site_name, project_name):
+        with self._lock:
+            self._remove(pid)
+            self._add(pid, (year, site_name, project_name))
+            self.generation = next(_generations)
+
+    # 修改時舊內容整筆換掉即可
+    update = add
+
+    def remove(self, pids):
+        with self._lock:
+            for pid in pids:
+                self._remove(pid)
+            self.generation = next(_generations)
+
+    def _add(self, pid, values):
+        for field, value in zip(FIELDS, values):
+            text = normalize(value)
+            self._texts[field][pid] = text
+            postings = self._postings[field]
+            if postings is not None:
+                for gram in _grams(text):
+                    postings.setdefault(gram, set()).add(pid)
+
+    def _remove(self, pid):
+        for field in FIELDS:
+            text = self._texts[field].pop(pid, None)
+            if text is None:
+                continue
+            postings = self._postings[field]
+            if postings is None:
+                continue
+            for gram in _grams(text):
+                ids = postings.get(gram)
+                if ids is not None:
+                    ids.discard(pid)
+                    if not ids:
+                        del postings[gram]
+
+    def search(self, year="", site_name="", project_name="", previous=None):
+        """回傳 SearchResult；previous 為同一個索引上一次的結果，可用來縮小比對範圍"""
+        terms = tuple(normalize(v) for v in (year, site_name, project_name))
+        with self._lock:
+            candidates = None
+            if (previous is not None and previous.generation == self.generation
+                    and all(old in new for old, new in zip(previous.terms, terms))):
+                candidates = previous.ids
+            for field, term in zip(FIELDS, terms):
+                if not term:
+                    continue
+                texts = self._texts[field]
+                if candidates is None and len(term) >= GRAM_SIZE:
+                    candidates = self._gram_candidates(field, term)
+                source = texts if candidates is None else candidates
+                candidates = [pid for pid in source if term in texts[pid]]
+            if candidates is None:
+                candidates = self._texts[FIELDS[0]]
+            return SearchResult(terms, tuple(sorted(candidates)), self.generation)
+
+    def _gram_candidates(self, field, term):
+        # 各 trigram 的 id 集合取交集，從最小的集合開始
+        postings = self._postings[field]
+        if postings is None:
+            postings = self._postings[field] = {}
+            for pid, text in self._texts[field].items():
+                for gram in _grams(text):
+                    postings.setdefault(gram, set()).add(pid)
+        sets = sorted((postings.get(gram, set()) for gram in _grams(term)), key=len)
+        result = set(sets[0])
+        for ids in sets[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
@@ -0,0 +1,58 @@
+"""依查詢條件組出 projects 的 SQL (app.py 與 PD-9.py 共用)。
+
+工地名稱 / 承攬項目 / 關鍵字 (工地、項目、廠商、備註) 走 projects_fts 全文索引；
+trigram 分詞至少需要 SEARCH_MIN_TERM_LENGTH 個字才能比對，較短的條件改用 LIKE '%詞%'。
+年度一律以 LIKE 比對。已標記刪除 (等待背景清理) 的資料不列入任何查詢結果。
+"""
+
+# trigram 分詞至少需要 3 個字才能走索引，較短的條件改用 LIKE
+SEARCH_MIN_TERM_LENGTH = 3
+
+
+def _fts_phrase(column, term):
+    """組成 FTS5 欄位限定的片語查詢 (雙引號需跳脫)"""
+    escaped = term.replace('"', '""')
+    if column is None:
+        return f'"{escaped}"'
+    return f'{column} : "{escaped}"'
+
+
+def build_search_query(columns, year="", site="", project="", keyword="", rank=False):
+    """回傳 (SQL, 參數)；columns 為 SELECT 的欄位 (例如只取 "projects.id")。
+
+    rank=True 且有全文索引條件時依 bm25 相關度排序，否則不指定順序。
+    """
+    match_terms = []
+    conditions = ["projects.deleted_at IS NULL"]
+    params = []
+    if year:
+        conditions.append("projects.year LIKE ?")
+        params.append(f"%{year}%")
+    for column, term in (("site_name", site), ("project_name", project)):
+        if not term:
+            continue
+        if len(term) >= SEARCH_MIN_TERM_LENGTH:
+            match_terms.append(_fts_phrase(column, term))
+        else:
+            conditions.append(f"projects.{column} LIKE ?")
+            params.append(f"%{term}%")
+    if keyword:
+        if len(keyword) >= SEARCH_MIN_TERM_LENGTH:
+            match_terms.append(_fts_phrase(None, keyword))
+        else:
+            conditions.append("(projects.site_name LIKE ? OR projects.project_name LIKE ?"
+                              " OR projects.contractor LIKE ? OR projects.remarks LIKE ?)")
+            params.extend([f"%{keyword}%"] * 4)
+
+    if match_terms:
+        query = (f"SELECT {columns} FROM projects_fts "
+                 "JOIN projects ON projects.id = projects_fts.rowid "
+                 "WHERE projects_fts MATCH ?")
+        params.insert(0, " AND ".join(match_terms))
+    else:
+        query = f"SELECT {columns} FROM projects WHERE 1=1"
+    for cond in conditions:
+        query += f" AND {cond}"
+    if match_terms and rank:
+        query += " ORDER BY projects_fts.rank"
+    return query, params
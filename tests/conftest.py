@@ -0,0 +1,21 @@
+"""測試共用設定：讓測試可匯入專案根目錄的模組，app 使用暫存資料庫。"""
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+# 不寫出結構化效能記錄檔
+os.environ.setdefault("PROJECTS_PERF_LOG", "")
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """指向空白暫存資料庫 (已升級到最新結構) 的 app 模組；程序共用的快取與連線每次重建"""
+    import app as app_module
+    app_module.st.cache_resource.clear()
+    monkeypatch.setattr(app_module, "DB_PATH", str(tmp_path / "projects.db"))
+    app_module.init_db()
+    yield app_module
+    app_module.st.cache_resource.clear()
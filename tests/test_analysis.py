@@ -0,0 +1,20 @@
+"""app 廠商分佈：第 top_n 名之後合併為「其他」。"""
+
+
+def _add(app, contractors):
+    app.apply_project_edits(inserts=[
+        ("2024", "台中西屯住宅新建工程", "鋼筋工程", 0.0, 0.0, 0.0, contractor, "", None)
+        for contractor in contractors])
+
+
+def test_contractor_counts_merge_tail_into_others(app):
+    _add(app, ["永信"] * 3 + ["大成"] * 2 + ["宏達", "鼎立"])
+    counts = app.get_contractor_counts(top_n=2)
+    assert counts.to_dict() == {"永信": 3, "大成": 2, app.OTHERS_LABEL: 2}
+
+
+def test_contractor_named_others_is_merged_not_overwritten(app):
+    _add(app, [app.OTHERS_LABEL] * 4 + ["永信"] * 3 + ["大成", "宏達"])
+    counts = app.get_contractor_counts(top_n=2)
+    assert counts.to_dict() == {app.OTHERS_LABEL: 6, "永信": 3}
+    assert counts.sum() == 9
@@ -0,0 +1,116 @@
+"""column_store.ColumnStore：遞增更新後的分組彙總與 SQLite GROUP BY 相同。"""
+import random
+import sqlite3
+
+import numpy as np
+import pytest
+
+import column_store
+import db_migrations
+
+CONTRACTORS = ["永信營造有限公司", "大成工程有限公司", "宏達機電工程行", None]
+SITES = ["台中西屯住宅新建工程", "高雄左營商場改建工程", "桃園青埔物流中心新建工程"]
+
+
+def _random_row(rng):
+    contract_price = rng.choice([None, round(rng.uniform(0, 1e6), 2)])
+    return (rng.choice([2022, 2023, 2024, "112年度"]), rng.choice(SITES), "鋼筋工程",
+            contract_price, round(rng.uniform(0, 1e6), 2), round(rng.uniform(0, 1e6), 2),
+            rng.choice(CONTRACTORS))
+
+
+def _source_rows(conn, ids=None):
+    query = column_store.STORE_SOURCE_SQL
+    if ids is None:
+        return conn.execute(query).fetchall()
+    return conn.execute(query + " AND id IN (SELECT value FROM json_each(?))",
+                        (str(list(ids)),)).fetchall()
+
+
+def _assert_matches_sql(store, conn):
+    assert len(store) == conn.execute(
+        "SELECT COUNT(*) FROM projects WHERE deleted_at IS NULL").fetchone()[0]
+    for by in column_store.GROUP_COLUMNS:
+        expected = {row[0]: row[1:] for row in conn.execute(
+            f"SELECT {by}, COUNT(*), TOTAL(contract_price), TOTAL(indirect_cost) "
+            f"FROM projects WHERE deleted_at IS NULL GROUP BY {by}")}
+        totals = store.group_totals(by, ["contract_price", "indirect_cost"])
+        assert sorted(totals.labels, key=repr) == sorted(expected, key=repr)
+        for i, label in enumerate(totals.labels):
+            count, contract_price, indirect_cost = expected[label]
+            assert totals.counts[i] == count
+            assert totals.sums["contract_price"][i] == pytest.approx(contract_price)
+            assert totals.sums["indirect_cost"][i] == pytest.approx(indirect_cost)
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    db_migrations.migrate(conn)
+    return conn
+
+
+def _insert(conn, rows):
+    ids = []
+    for row in rows:
+        ids.append(conn.execute(
+            "INSERT INTO projects (year, site_name, project_name, contract_price, "
+            "execution_budget, contractor_price, contractor) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            row).lastrowid)
+    return ids
+
+
+def test_from_connection_matches_group_by(conn):
+    rng = random.Random(1)
+    _insert(conn, [_random_row(rng) for _ in range(200)])
+    _assert_matches_sql(column_store.ColumnStore.from_connection(conn), conn)
+
+
+def test_incremental_updates_match_group_by(conn):
+    # 初始容量很小，新增時會多次 _grow；刪除時最後一列搬到被刪除的位置
+    rng = random.Random(2)
+    store = column_store.ColumnStore(capacity=4)
+    for step in range(60):
+        action = rng.random()
+        existing = [row[0] for row in conn.execute("SELECT id FROM projects")]
+        if action < 0.5 or not existing:
+            ids = _insert(conn, [_random_row(rng) for _ in range(rng.randint(1, 20))])
+            store.upsert(_source_rows(conn, ids))
+        elif action < 0.75:
+            ids = rng.sample(existing, min(len(existing), rng.randint(1, 5)))
+            for pid in ids:
+                conn.execute("UPDATE projects SET year = ?, contractor = ?, contract_price = ? "
+                             "WHERE id = ?", (rng.choice([2023, 2025]), rng.choice(CONTRACTORS),
+                                              rng.uniform(0, 1e5), pid))
+            store.upsert(_source_rows(conn, ids))
+        else:
+            ids = rng.sample(existing, min(len(existing), rng.randint(1, 10)))
+            conn.executemany("DELETE FROM projects WHERE id = ?", [(pid,) for pid in ids])
+            store.remove(ids + [10 ** 9])  # 不存在的 id 直接略過
+        _assert_matches_sql(store, conn)
+
+
+def test_remove_last_and_only_rows(conn):
+    ids = _insert(conn, [(2023, SITES[0], "鋼筋工程", 100, 60, 0, CONTRACTORS[0]),
+                         (2024, SITES[1], "模板工程", 50, 20, 0, CONTRACTORS[1])])
+    store = column_store.ColumnStore.from_connection(conn)
+    store.remove([ids[1]])
+    conn.execute("DELETE FROM projects WHERE id = ?", (ids[1],))
+    _assert_matches_sql(store, conn)
+    store.remove([ids[0]])
+    assert len(store) == 0
+    totals = store.group_totals("year", ["contract_price"])
+    assert totals.labels == [] and len(totals.counts) == 0
+
+
+def test_null_and_text_values_count_as_zero():
+    store = column_store.ColumnStore.from_rows(
+        [(1, 2023, "a", "x", None, "abc", 1.5, np.nan)])
+    totals = store.group_totals("year", column_store.VALUE_COLUMNS)
+    assert totals.labels == [2023]
+    assert [totals.sums[c][0] for c in column_store.VALUE_COLUMNS] == [0, 0, 1.5, 0]
+
+
+def test_unknown_group_column():
+    with pytest.raises(ValueError):
+        column_store.ColumnStore().group_totals("remarks")
@@ -0,0 +1,70 @@
+"""db_migrations 的升級測試：以舊版 (未設定 user_version) 的資料表升級到最新版本。"""
+import sqlite3
+
+import db_migrations
+
+# 舊版程式建立的資料表 (管銷為一般欄位，由程式寫入)
+LEGACY_SCHEMA_SQL = """
+    CREATE TABLE projects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        year TEXT NOT NULL,
+        site_name TEXT NOT NULL,
+        project_name TEXT NOT NULL,
+        contract_price REAL DEFAULT 0,
+        execution_budget REAL DEFAULT 0,
+        contractor_price REAL DEFAULT 0,
+        indirect_cost REAL DEFAULT 0,
+        contractor TEXT,
+        remarks TEXT
+    )
+"""
+
+
+def _legacy_db(rows):
+    """rows 為 (year, contract_price, execution_budget, indirect_cost)"""
+    conn = sqlite3.connect(":memory:")
+    conn.execute(LEGACY_SCHEMA_SQL)
+    conn.executemany("""
+        INSERT INTO projects (year, site_name, project_name, contract_price,
+                              execution_budget, contractor_price, indirect_cost)
+        VALUES (?, '工地', '項目', ?, ?, 0, ?)
+    """, rows)
+    conn.commit()
+    return conn
+
+
+def _indirect_costs(conn):
+    return [row[0] for row in conn.execute("SELECT indirect_cost FROM projects ORDER BY id")]
+
+
+def test_fresh_database_reaches_latest_version():
+    conn = sqlite3.connect(":memory:")
+    db_migrations.migrate(conn)
+    db_migrations.migrate(conn)
+    assert db_migrations.get_schema_version(conn) == db_migrations.SCHEMA_VERSION
+    conn.execute("INSERT INTO projects (year, site_name, project_name, contract_price, execution_budget) "
+                 "VALUES (2023, '工地', '項目', 100, 60)")
+    assert _indirect_costs(conn) == [40]
+
+
+def test_stored_indirect_cost_different_from_computed_is_kept():
+    conn = _legacy_db([
+        ("2023", 100, 60, 40),      # 與計算結果相同
+        ("2023", 100, 60, 99),      # 手動調整過的管銷
+        ("2024", 100, 0, 0),        # 舊資料記錄為 0
+        ("2024", 50, 20, None),     # 未記錄管銷
+    ])
+    db_migrations.migrate(conn)
+    assert db_migrations.get_schema_version(conn) == db_migrations.SCHEMA_VERSION
+    assert _indirect_costs(conn) == [40, 99, 0, 30]
+    overrides = [row[0] for row in conn.execute("SELECT indirect_cost_override FROM projects ORDER BY id")]
+    assert overrides == [None, 99, 0, None]
+
+
+def test_override_cleared_when_prices_change():
+    conn = _legacy_db([("2023", 100, 60, 99)])
+    db_migrations.migrate(conn)
+    conn.execute("UPDATE projects SET remarks = '備註' WHERE id = 1")
+    assert _indirect_costs(conn) == [99]
+    conn.execute("UPDATE projects SET contract_price = 150 WHERE id = 1")
+    assert _indirect_costs(conn) == [90]
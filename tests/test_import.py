@@ -0,0 +1,54 @@
+"""app 匯入 Excel：檔案中手動調整過的管銷要保留，匯出再匯入後數值不變。"""
+import io
+
+import pandas as pd
+
+
+def _workbook(df):
+    output = io.BytesIO()
+    df.to_excel(output, index=False)
+    output.seek(0)
+    return output
+
+
+def _indirect_costs(app):
+    return app.get_all_projects()["indirect_cost"].astype(float).tolist()
+
+
+def _overrides(app):
+    with app.get_connection() as conn:
+        return [row[0] for row in conn.execute(
+            "SELECT indirect_cost_override FROM projects ORDER BY id")]
+
+
+SHEET = pd.DataFrame({
+    "年度": [2023, 2023, 2024],
+    "工地名稱": ["台中西屯住宅新建工程", "台中西屯住宅新建工程", "高雄左營商場改建工程"],
+    "承攬項目": ["鋼筋工程", "模板工程", "機電工程"],
+    "契約來價(未稅)": [100, 100, 50],
+    "執行預算(未稅)": [60, 60, 20],
+    # 第一列手動調整過，第二列與計算結果相同，第三列未填
+    "管銷(契約間接費用)": [99, 40, None],
+})
+
+
+def test_import_keeps_adjusted_indirect_cost(app):
+    assert app.import_excel(_workbook(SHEET)) == (3, 0)
+    assert _indirect_costs(app) == [99, 40, 30]
+    assert _overrides(app) == [99, None, None]
+
+
+def test_export_then_import_round_trip(app):
+    app.import_excel(_workbook(SHEET))
+    exported = io.BytesIO(app.export_excel())
+    with app.get_connection() as conn:
+        conn.execute("DELETE FROM projects")
+        conn.commit()
+    assert app.import_excel(exported) == (3, 0)
+    assert _indirect_costs(app) == [99, 40, 30]
+
+
+def test_streaming_import_keeps_adjusted_indirect_cost(app):
+    assert app.import_streaming(_workbook(SHEET), batch_size=2) == (3, 0)
+    assert _indirect_costs(app) == [99, 40, 30]
+    assert _overrides(app) == [99, None, None]
@@ -0,0 +1,89 @@
+"""app 表格編輯模式：diff_project_edits 只取出真的變更的儲存格，apply_project_edits 在一個交易中套用。"""
+import pytest
+
+ROWS = [
+    # (year, site_name, project_name, contract_price, execution_budget, contractor_price, contractor, remarks)
+    ("2023", "台中西屯住宅新建工程", "鋼筋工程", 100.0, 60.0, 50.0, "永信營造有限公司", ""),
+    ("2023", "台中北屯辦公大樓新建工程", "模板工程", 200.0, 150.0, 120.0, "大成工程有限公司", "追加減帳"),
+    ("2024", "高雄左營商場改建工程", "機電工程", 300.0, 250.0, 200.0, "宏達機電工程行", ""),
+]
+
+
+@pytest.fixture
+def seeded(app):
+    app.apply_project_edits(inserts=[row + (None,) for row in ROWS])
+    return app
+
+
+def _rows(app):
+    return {row.id: row for row in app.get_all_projects().itertuples(index=False)}
+
+
+def test_diff_keeps_only_changed_cells(seeded):
+    app = seeded
+    original = app.get_all_projects()
+    pid = [int(v) for v in original["id"]]
+    updates, inserts, deletes = app.diff_project_edits(original, {
+        "edited_rows": {
+            0: {"site_name": " 台中西屯住宅新建工程 ", "contract_price": 120},  # 名稱只多了空白
+            1: {"remarks": "已完成驗收", "indirect_cost": 1},                    # 管銷不可編輯
+            2: {"project_name": "空調工程"},                                     # 同時被刪除
+        },
+        "added_rows": [
+            {"year": 2025, "site_name": "新北板橋廠房新建工程", "project_name": "空調工程",
+             "contract_price": None},
+            {},                                                                   # 空白列略過
+        ],
+        "deleted_rows": [2],
+    })
+    assert updates == {pid[0]: {"contract_price": 120.0}, pid[1]: {"remarks": "已完成驗收"}}
+    assert inserts == [("2025", "新北板橋廠房新建工程", "空調工程", 0.0, 0.0, 0.0, "", "", None)]
+    assert deletes == [pid[2]]
+
+
+def test_diff_rejects_blank_required_fields(seeded):
+    original = seeded.get_all_projects()
+    with pytest.raises(ValueError):
+        seeded.diff_project_edits(original, {"edited_rows": {0: {"site_name": "  "}}})
+    with pytest.raises(ValueError):
+        seeded.diff_project_edits(original, {"added_rows": [{"year": 2025, "site_name": "工地"}]})
+
+
+def test_apply_updates_inserts_and_deletes(seeded):
+    app = seeded
+    before = _rows(app)
+    first, second, third = sorted(before)
+    result = app.apply_project_edits(
+        updates={first: {"contract_price": 150.0}, second: {"remarks": "已完成驗收"}},
+        inserts=[("2025", "新北板橋廠房新建工程", "空調工程", 80.0, 30.0, 20.0, "", "", None)],
+        deletes=[third])
+    assert result == (2, 1, 1)
+    after = _rows(app)
+    assert third not in after
+    assert after[first].contract_price == 150 and after[first].indirect_cost == 90
+    assert after[second].remarks == "已完成驗收"
+    assert after[second].site_name == before[second].site_name
+    (new_id,) = set(after) - set(before)
+    assert after[new_id].indirect_cost == 50
+
+
+def test_apply_reindexes_inserted_ids(seeded):
+    # 新增的列要依實際取得的 id 遞增更新搜尋索引與欄式儲存，不必整個重建
+    app = seeded
+    index = app.get_search_index()
+    store = app.get_column_store()
+    app.apply_project_edits(
+        inserts=[("2026", "宜蘭羅東醫院擴建工程", "景觀工程", 10.0, 5.0, 0.0, "", "", None),
+                 ("2026", "宜蘭羅東醫院擴建工程", "油漆工程", 20.0, 5.0, 0.0, "", "", None)])
+    assert app.get_search_index() is index
+    assert app.get_column_store() is store
+    new_ids = {pid for pid, row in _rows(app).items() if row.site_name == "宜蘭羅東醫院擴建工程"}
+    assert len(new_ids) == 2
+    assert set(index.search(site_name="羅東醫院").ids) == new_ids
+    totals = store.group_totals("year", ["contract_price"])
+    assert totals.sums["contract_price"][totals.labels.index(2026)] == 30
+
+
+def test_apply_rejects_non_editable_columns(seeded):
+    with pytest.raises(ValueError):
+        seeded.apply_project_edits(updates={1: {"indirect_cost": 5.0}})
@@ -0,0 +1,98 @@
+"""search_index.SearchIndex：結果與 SQL 的 LIKE '%詞%' 相同，並正確沿用 / 捨棄上一次的結果。"""
+import random
+import sqlite3
+
+import pytest
+
+import db_migrations
+import search_index
+
+# 字元種類少，隨機條件才常有符合的資料；英文字母混用大小寫 (LIKE 不分大小寫)
+ALPHABET = "台中北屯住宅工程鋼筋aAbB12"
+
+
+def _random_text(rng, low=0, high=8):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(low, high)))
+
+
+def _like_ids(conn, year, site, project):
+    query = "SELECT id FROM projects WHERE deleted_at IS NULL"
+    params = []
+    for column, term in (("year", year), ("site_name", site), ("project_name", project)):
+        if term:
+            query += f" AND {column} LIKE ?"
+            params.append(f"%{term}%")
+    return tuple(sorted(row[0] for row in conn.execute(query, params)))
+
+
+@pytest.fixture
+def conn():
+    rng = random.Random(7)
+    conn = sqlite3.connect(":memory:")
+    db_migrations.migrate(conn)
+    conn.executemany(
+        "INSERT INTO projects (year, site_name, project_name) VALUES (?, ?, ?)",
+        [(rng.choice([2023, 2024, "112年度"]), _random_text(rng, 1), _random_text(rng, 1))
+         for _ in range(300)])
+    conn.execute("UPDATE projects SET deleted_at = CURRENT_TIMESTAMP WHERE id % 10 = 0")
+    return conn
+
+
+def test_random_terms_match_like(conn):
+    # 1~2 個字的條件直接比對子字串，3 個字以上先以 trigram 取候選
+    rng = random.Random(11)
+    index = search_index.SearchIndex.from_connection(conn)
+    for _ in range(300):
+        terms = (rng.choice(["", "", "202", "4", "年度"]),
+                 rng.choice(["", _random_text(rng, 1, 4)]),
+                 rng.choice(["", _random_text(rng, 1, 4)]))
+        assert index.search(*terms).ids == _like_ids(conn, *terms)
+
+
+def test_narrowing_from_previous_result(conn):
+    index = search_index.SearchIndex.from_connection(conn)
+    previous = index.search(site_name="台")
+    narrowed = index.search(site_name="台中", previous=previous)
+    assert narrowed.ids == _like_ids(conn, "", "台中", "")
+    # 條件加長時只在上一次的結果中篩選
+    subset = previous._replace(ids=previous.ids[:5])
+    assert set(index.search(site_name="台中", previous=subset).ids) <= set(subset.ids)
+    # 條件不是加長 (改成別的字) 時不沿用上一次的結果
+    assert index.search(site_name="北", previous=subset).ids == _like_ids(conn, "", "北", "")
+
+
+def test_stale_previous_result_is_not_used(conn):
+    index = search_index.SearchIndex.from_connection(conn)
+    previous = index.search(site_name="台中")
+    index.add(10 ** 6, 2025, "台中住宅工程", "鋼筋")
+    assert previous.generation != index.generation
+    assert 10 ** 6 in index.search(site_name="台中住", previous=previous).ids
+    stale = index.search(site_name="台中住")
+    index.remove([10 ** 6])
+    assert 10 ** 6 not in index.search(site_name="台中住宅", previous=stale).ids
+    # 重建的索引也不會沿用舊索引的結果
+    rebuilt = search_index.SearchIndex.from_connection(conn)
+    assert rebuilt.generation != index.generation
+
+
+@pytest.mark.parametrize("build_postings_first", [False, True])
+def test_incremental_updates_match_rebuild(conn, build_postings_first):
+    rng = random.Random(13)
+    index = search_index.SearchIndex.from_connection(conn)
+    if build_postings_first:
+        # 先以長條件查詢，各欄位的 trigram 反向索引已建立後再遞增更新
+        index.search("年度", "台中北", "鋼筋工")
+    for _ in range(200):
+        pid = rng.randint(1, 320)
+        if rng.random() < 0.3:
+            conn.execute("DELETE FROM projects WHERE id = ?", (pid,))
+            index.remove([pid])
+        else:
+            row = (pid, rng.choice([2023, 2025]), _random_text(rng, 1), _random_text(rng, 1))
+            conn.execute("INSERT OR REPLACE INTO projects (id, year, site_name, project_name) "
+                         "VALUES (?, ?, ?, ?)", row)
+            index.update(*row)
+    assert len(index) == conn.execute(
+        "SELECT COUNT(*) FROM projects WHERE deleted_at IS NULL").fetchone()[0]
+    for terms in [("", "台中北", ""), ("", "", "鋼筋工"), ("202", "aab", ""), ("", "a", "b")]:
+        assert index.search(*terms).ids == _like_ids(conn, *terms)
@@ -0,0 +1,60 @@
+"""search_query.build_search_query：全文索引與 LIKE 兩種條件的結果都與 LIKE '%詞%' 相同。"""
+import sqlite3
+
+import pytest
+
+import db_migrations
+import search_query
+
+ROWS = [
+    ("2023", "台中西屯住宅新建工程", "鋼筋工程", "永信營造有限公司", "含保固三年"),
+    ("2023", "台中北屯辦公大樓新建工程", "模板工程", "大成工程有限公司", ""),
+    ("2024", "高雄左營商場改建工程", "機電工程", "永信營造有限公司", "追加減帳"),
+    ("2024", "桃園青埔 \"A\" 區住宅新建工程", "鋼構工程", None, None),
+    ("2025", "新北板橋廠房新建工程", "空調工程", "宏達機電工程行", "已完成驗收"),
+]
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    db_migrations.migrate(conn)
+    conn.executemany("INSERT INTO projects (year, site_name, project_name, contractor, remarks) "
+                     "VALUES (?, ?, ?, ?, ?)", ROWS)
+    # 已標記刪除的列不列入結果
+    conn.execute("INSERT INTO projects (year, site_name, project_name, deleted_at) "
+                 "VALUES (2023, '台中西屯住宅新建工程', '鋼筋工程', CURRENT_TIMESTAMP)")
+    return conn
+
+
+def _expected(year="", site="", project="", keyword=""):
+    ids = []
+    for pid, (y, s, p, c, r) in enumerate(ROWS, start=1):
+        if (year in y and site in s and project in p
+                and (not keyword or any(keyword in (v or "") for v in (s, p, c, r)))):
+            ids.append(pid)
+    return ids
+
+
+@pytest.mark.parametrize("conditions", [
+    {},
+    {"year": "2023"},
+    {"site": "台中"},                              # 短條件：LIKE
+    {"site": "住宅新建"},                          # 全文索引
+    {"site": "台中", "project": "鋼筋工程"},       # 兩種條件混用
+    {"keyword": "永信營造"},                       # 關鍵字比對廠商
+    {"keyword": "保固"},
+    {"site": '"A" 區'},                            # 雙引號需跳脫
+    {"year": "2024", "keyword": "機電工程"},
+])
+def test_matches_like_semantics(conn, conditions):
+    query, params = search_query.build_search_query("projects.id", **conditions)
+    ids = sorted(row[0] for row in conn.execute(query, params))
+    assert ids == _expected(**conditions)
+
+
+def test_rank_orders_full_text_matches_only(conn):
+    query, _ = search_query.build_search_query("projects.id", site="住宅新建", rank=True)
+    assert query.endswith(" ORDER BY projects_fts.rank")
+    query, _ = search_query.build_search_query("projects.id", site="台中", rank=True)
+    assert " ORDER BY " not in query
@@ -0,0 +1,51 @@
+"""app 寫入佇列：合併在同一個交易中的寫入，失敗的只退回自己的 SAVEPOINT。"""
+import sqlite3
+
+import pytest
+
+
+def _insert(site_name):
+    def work(conn):
+        return conn.execute(
+            "INSERT INTO projects (year, site_name, project_name) VALUES (2024, ?, '鋼筋工程')",
+            (site_name,)).lastrowid
+    return work
+
+
+def _failing(conn):
+    # 先寫入一列再失敗：這一列必須跟著退回
+    conn.execute("INSERT INTO projects (year, site_name, project_name) "
+                 "VALUES (2024, '失敗的工地', '模板工程')")
+    conn.execute("INSERT INTO projects (year, site_name, project_name) VALUES (2024, NULL, 'x')")
+
+
+def test_failing_job_rolls_back_only_its_savepoint(app):
+    index = app.get_search_index()
+    jobs = [app._WriteJob(_insert("台中西屯住宅新建工程"), lambda pid: [pid]),
+            app._WriteJob(_failing, lambda _: []),
+            app._WriteJob(_insert("高雄左營商場改建工程"), lambda pid: [pid])]
+    with app.get_connection() as conn:
+        app._execute_writes(conn, jobs)
+        assert not conn.in_transaction
+
+    first, second = jobs[0].future.result(), jobs[2].future.result()
+    with pytest.raises(sqlite3.IntegrityError):
+        jobs[1].future.result()
+    # 其他寫入已提交 (從另一條連線也看得到)，失敗寫入的第一列不存在
+    check = sqlite3.connect(app.DB_PATH)
+    try:
+        rows = check.execute("SELECT id, site_name FROM projects ORDER BY id").fetchall()
+    finally:
+        check.close()
+    assert rows == [(first, "台中西屯住宅新建工程"), (second, "高雄左營商場改建工程")]
+    # 提交後索引依成功寫入的 id 遞增更新，不需重建
+    assert app.get_search_index() is index
+    assert index.search(site_name="工地").ids == ()
+    assert set(index.search(site_name="新建工程").ids) == {first}
+
+
+def test_run_write_reports_job_error(app):
+    with pytest.raises(sqlite3.IntegrityError):
+        app.run_write(_failing)
+    assert app.run_write(_insert("新北板橋廠房新建工程"), reindex=lambda pid: [pid]) > 0
+    assert app.count_projects() == 1